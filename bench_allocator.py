@@ -0,0 +1,71 @@
+import ipaddress
+import random
+import sys
+import time
+
+from cidr_allocator import FreeSpaceAllocator, PRIVATE_RANGES
+
+# Micro-benchmark: FreeSpaceAllocator.first_free vs the original brute-force scan.
+# Usage: python bench_allocator.py [num_used_prefixes] [seed]
+
+
+# The scan suggest_cidr used before the allocator existed
+def legacy_suggest_cidr(used_cidrs, netmask):
+    private_ranges = [ipaddress.IPv4Network(r) for r in PRIVATE_RANGES]
+    for parent in private_ranges:
+        if netmask < parent.prefixlen:
+            continue
+        for subnet in parent.subnets(new_prefix=netmask):
+            if str(subnet) not in used_cidrs:
+                overlap = False
+                for used in used_cidrs:
+                    if ipaddress.IPv4Network(used).overlaps(subnet):
+                        overlap = True
+                        break
+                if not overlap:
+                    return str(subnet)
+    return None
+
+
+# Used prefixes packed largest-first from the bottom of 10.0.0.0/8, with rare holes
+def generate_used_cidrs(count, rng):
+    prefixlens = sorted(rng.choice([22, 24, 24, 24, 26, 27, 28]) for _ in range(count))
+    used = set()
+    cursor = int(ipaddress.IPv4Address('10.0.0.0'))
+    for prefixlen in prefixlens:
+        size = 1 << (32 - prefixlen)
+        if rng.random() < 0.01:
+            cursor += size
+        used.add(str(ipaddress.IPv4Network((cursor, prefixlen))))
+        cursor += size
+    return used
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 42
+    used = generate_used_cidrs(count, random.Random(seed))
+    print(f"{len(used)} used prefixes")
+    print(f"{'netmask':>8} {'legacy (s)':>12} {'allocator (s)':>14} {'speedup':>9}  result")
+    mismatches = 0
+    for netmask in (16, 20, 22, 24, 26, 28):
+        expected, legacy_time = timed(legacy_suggest_cidr, used, netmask)
+        allocator, build_time = timed(FreeSpaceAllocator, used)
+        actual, query_time = timed(allocator.first_free, netmask)
+        total = build_time + query_time
+        status = "ok" if actual == expected else f"MISMATCH (legacy {expected})"
+        mismatches += actual != expected
+        speedup = legacy_time / total if total else float('inf')
+        print(f"{'/' + str(netmask):>8} {legacy_time:>12.4f} {total:>14.6f} {speedup:>8.0f}x  {actual} {status}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import ipaddress
+import random
+import sys
+import time
+
+from cidr_conflicts import overlapping_pairs, prefix_arrays
+from cidr_prefix import parse_prefixes
+
+# Benchmark: sort-and-sweep overlap detection vs the pairwise ipaddress.overlaps loop.
+# Usage: python bench_conflicts.py [pairwise_size] [sweep_size] [seed]
+
+
+# VNet-sized prefixes (/16 .. /26) laid out back to back from 10.0.0.0, with a
+# fraction placed at random instead so they collide with the rest
+def generate_cidrs(count, rng, conflict_ratio=0.02):
+    cidrs = []
+    cursor = 0x0A000000
+    for _ in range(count):
+        prefixlen = rng.choice([16, 20, 22, 24, 24, 24, 26, 26])
+        size = 1 << (32 - prefixlen)
+        if rng.random() < conflict_ratio:
+            start = rng.randrange(0x0A000000, cursor + size) & ~(size - 1)
+        else:
+            start = cursor = -(-cursor // size) * size
+            cursor += size
+        cidrs.append(str(ipaddress.IPv4Network((start, prefixlen))))
+    return cidrs
+
+
+# How overlap used to be tested: every prefix against every other
+def pairwise_overlaps(cidrs):
+    networks = [ipaddress.IPv4Network(c) for c in cidrs]
+    pairs = set()
+    for i in range(len(networks)):
+        for j in range(i + 1, len(networks)):
+            if networks[i].overlaps(networks[j]):
+                pairs.add((i, j))
+    return pairs
+
+
+def sweep_overlaps(cidrs):
+    firsts, lasts = prefix_arrays(parse_prefixes(cidrs))
+    return overlapping_pairs(firsts, lasts)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    pairwise_size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sweep_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 42
+    rng = random.Random(seed)
+
+    cidrs = generate_cidrs(pairwise_size, rng)
+    expected, pairwise_time = timed(pairwise_overlaps, cidrs)
+    pairs, sweep_time = timed(sweep_overlaps, cidrs)
+    actual = {tuple(p) for p in pairs.tolist()}
+    status = "ok" if actual == expected else "MISMATCH"
+    print(f"{pairwise_size} prefixes: pairwise {pairwise_time:.3f}s, sweep {sweep_time:.4f}s, "
+          f"{len(actual)} overlapping pairs, {status}")
+
+    cidrs = generate_cidrs(sweep_size, rng)
+    firsts, lasts = prefix_arrays(parse_prefixes(cidrs))
+    pairs, sweep_time = timed(overlapping_pairs, firsts, lasts)
+    print(f"{sweep_size} prefixes: sweep {sweep_time:.4f}s ({len(pairs)} overlapping pairs)")
+    if actual != expected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import yaml
+
+from cidr_allocator import PRIVATE_RANGES, FreeSpaceAllocator
+from cidr_analysis import first_free_cidr, idle_subnets, place_subnets, place_vnet, subnet_page, subnet_rows
+from cidr_export import export_rows, write_export
+from cidr_fragmentation import range_fragmentation, recovery_candidates
+from cidr_index import AddressIndex
+from cidr_inventory import load_inventory, load_nics, subnet_ip_usage
+from cidr_pools import EXAMPLE, parse_pools
+from cidr_prefix import parse_prefix
+from cidr_whatif import ChangeSet, Simulation, unused_subnet_ids
+from synthetic_estate import SyntheticEstate
+
+# Benchmark: the web UI's analyses on synthetic estates of growing size, appended to a
+# JSON Lines file so runs on different commits can be compared.
+# Usage: python bench_estate.py [sizes=1000,10000,100000] [output=bench_results.jsonl] [repeat=3] [seed=42]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(dirty.stdout.strip())
+
+
+def timed(fn, repeat):
+    """(result, min seconds, median seconds) over repeat calls of fn()."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times), statistics.median(times)
+
+
+# The VNet with the most IPv4 space, i.e. the one a subnet request most likely targets
+def largest_vnet(inventory):
+    return max(inventory.vnets, key=lambda vnet: sum(p.num_addresses for p in vnet.prefixes if p.family == 4))
+
+
+def bench_estate(num_vnets, repeat, seed):
+    start = time.perf_counter()
+    estate = SyntheticEstate(num_vnets, seed)
+    client = estate.client()
+    generate_time = time.perf_counter() - start
+
+    timings = {}
+
+    def record(name, fn, repeat=repeat):
+        result, best, median = timed(fn, repeat)
+        timings[name] = {"min": best, "median": median}
+        return result
+
+    # Ingest is timed once: it is the crawl's parsing cost, not a query
+    inventory = record("load_inventory", lambda: load_inventory(client), 1)
+    record("load_nics", lambda: load_nics(client, inventory), 1)
+    used = list(record("fetch_used_cidrs", inventory.used_prefixes))
+    record("fetch_vnets_and_subnets", lambda: subnet_rows(inventory, subnet_ip_usage(inventory.nics)))
+    usage = subnet_ip_usage(inventory.nics, family=4)
+    record("subnet_page", lambda: subnet_page(inventory, usage, "snet-1", 2, 100))
+    record("export_csv", lambda: write_export(export_rows(inventory, "subnets", usage), io.BytesIO(), "csv"))
+    record("suggest_cidr", lambda: first_free_cidr(used, 24))
+    record("suggest_cidr_ipv6", lambda: first_free_cidr(used, 48, 6))
+    record("suggest_vnet_cidr", lambda: place_vnet(used, 24, 4))
+    vnet = largest_vnet(inventory)
+    vnet_cidrs = [p for p in vnet.prefixes if p.family == 4]
+    existing = [p for subnet in vnet.subnets for p in subnet.prefixes if p.family == 4]
+    record("suggest_subnets_in_vnet", lambda: place_subnets(vnet_cidrs, existing, 28, 4))
+    record("find_unused_subnets", lambda: idle_subnets(inventory, subnet_ip_usage(inventory.nics)))
+    record("range_fragmentation", lambda: range_fragmentation(FreeSpaceAllocator(used, PRIVATE_RANGES)))
+    record("recovery_candidates", lambda: recovery_candidates(inventory, usage))
+    index = record("build_address_index", lambda: AddressIndex(inventory), 1)
+    nic_ip = next(ip for nic in inventory.nics for _, ip in nic.ip_configurations if ip)
+    record("lookup_address", lambda: index.lookup(nic_ip))
+    record("contains_cidr", lambda: index.contains("10.40.0.0/14", limit=1000))
+    policy = parse_pools(yaml.safe_load(EXAMPLE))
+    used_intervals = [(p.start, p.end) for p in used if p.family == 4]
+    pool_allocator = record("compile_pool_allocator", lambda: policy.allocator(used_intervals))
+    record("suggest_cidr_in_pool", lambda: pool_allocator.within(policy.ranges(4, "westeurope", "dev")).first_free(24))
+    record("pool_headroom", lambda: policy.headroom(used_intervals))
+    simulation = record("build_simulation", lambda: Simulation(inventory), 1)
+    idle = unused_subnet_ids(inventory, subnet_ip_usage(inventory.nics))[:40]
+    new_vnets = [(f"vnet-whatif-{n}", "rg-whatif", [parse_prefix(f"10.{200 + n}.0.0/22")], []) for n in range(12)]
+    changes = ChangeSet(add_vnets=new_vnets).with_deleted_subnets(idle)
+    record("simulate_changes", lambda: simulation.evaluate(simulation.apply(changes)))
+
+    return {
+        "vnets": num_vnets,
+        "subnets": estate.num_subnets,
+        "nics": len(inventory.nics),
+        "used_prefixes": len(used),
+        "generate_seconds": generate_time,
+        "timings": timings,
+    }
+
+
+# Most recent earlier run in output, to compare against
+def previous_run(output):
+    try:
+        with open(output) as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 10000, 100000]
+    output = sys.argv[2] if len(sys.argv) > 2 else "bench_results.jsonl"
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 42
+
+    previous = previous_run(output)
+    baseline = {e["vnets"]: e["timings"] for e in previous["estates"]} if previous and previous.get("seed") == seed else {}
+    if baseline:
+        print(f"comparing with {previous['commit']} ({previous['recorded_at']})")
+
+    commit, dirty = git_commit()
+    estates = []
+    for size in sizes:
+        result = bench_estate(size, repeat, seed)
+        estates.append(result)
+        print(f"\n{size} VNets: {result['subnets']} subnets, {result['nics']} NICs, "
+              f"{result['used_prefixes']} used prefixes (generated in {result['generate_seconds']:.1f}s)")
+        print(f"{'function':<26} {'min (ms)':>10} {'median (ms)':>12} {'previous':>10} {'change':>8}")
+        for name, timing in result["timings"].items():
+            line = f"{name:<26} {timing['min'] * 1000:>10.2f} {timing['median'] * 1000:>12.2f}"
+            before = baseline.get(size, {}).get(name)
+            if before:
+                line += f" {before['min'] * 1000:>10.2f} {timing['min'] / before['min'] - 1:>+8.0%}"
+            print(line)
+
+    record = {
+        "commit": commit,
+        "dirty": dirty,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "seed": seed,
+        "repeat": repeat,
+        "estates": estates,
+    }
+    with open(output, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"\nappended to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,686 @@
 import typer
 from rich.console import Console
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.network import NetworkManagementClient
-import ipaddress
+from rich.table import Table
+import json
+import logging
 import os
+import time
+from typing import List
+
+from cidr_allocator import PRIVATE_RANGES, ULA_RANGES, FreeSpaceAllocator
+from cidr_daemon import DEFAULT_HOST, DEFAULT_PORT, REFRESH_INTERVAL, InventoryService, daemon_request, make_server
+from cidr_leases import LeaseStore, existing_lease_store, lease_first_free
+from cidr_metrics import METRICS
+from cidr_planner import load_requirements, plan_batch
+from cidr_snapshot import open_snapshot, save_snapshot, snapshot_path
+
+# The Azure SDK (and numpy, for conflicts) is imported where it is used, so that
+# commands answered by a running daemon start without loading it
 
 app = typer.Typer()
 console = Console()
 
-# Helper to authenticate and create client
-def get_network_client():
+ALL_SUBSCRIPTIONS_OPTION = typer.Option(False, "--all-subscriptions", help="Crawl every subscription the credential can see.")
+NO_DAEMON_OPTION = typer.Option(False, "--no-daemon", help="Do not ask a running `serve` daemon; load the inventory directly.")
+FROM_SNAPSHOT_OPTION = typer.Option(False, "--from-snapshot", help="Answer from the last saved inventory snapshot instead of crawling Azure.")
+MAX_AGE_OPTION = typer.Option(None, "--max-age", help="With --from-snapshot, refresh the snapshot from the Azure change feed if it is older than this many seconds.")
+POOLS_OPTION = typer.Option(None, "--pools", help="YAML or JSON pool policy to allocate from (default: $CIDR_AGENT_POOLS).")
+REGION_OPTION = typer.Option(None, "--region", help="Allocate only from the policy's pools for this region.")
+ENVIRONMENT_OPTION = typer.Option(None, "--environment", help="Allocate only from the policy's pools for this environment.")
+
+@app.callback()
+def main(ctx: typer.Context,
+         profile: bool = typer.Option(False, "--profile", help="Print a timing breakdown of Azure calls and analysis steps when the command finishes.")):
+    """Find used and free address space across Azure VNets."""
+    if profile:
+        started = time.perf_counter()
+        ctx.call_on_close(lambda: print_profile(time.perf_counter() - started))
+
+# Where a command's time went: Azure list pages, instrumented functions, HTTP responses and cache use
+def print_profile(elapsed):
+    table = Table(title=f"Timing breakdown ({elapsed:.3f}s total)")
+    table.add_column("Kind", no_wrap=True)
+    table.add_column("Name", no_wrap=True, min_width=24)
+    for column in ("Calls", "Total (s)", "Mean (ms)", "p95 (ms)", "Max (ms)"):
+        table.add_column(column, justify="right")
+    kinds = {
+        "cidr_agent_api_page_seconds": "Azure",
+        "cidr_agent_function_seconds": "local",
+        "cidr_agent_daemon_request_seconds": "served",
+    }
+    for row in METRICS.breakdown():
+        table.add_row(kinds.get(row["metric"], row["metric"]), row["name"], str(row["count"]), f"{row['total']:.3f}",
+                      f"{row['mean'] * 1000:.1f}", f"{row['p95'] * 1000:.1f}", f"{row['max'] * 1000:.1f}")
+    console.print(table)
+    console.print(
+        f"Azure: {METRICS.counter('cidr_agent_api_pages_total')} page(s), "
+        f"{METRICS.counter('cidr_agent_api_items_total')} resource(s), "
+        f"{METRICS.counter('cidr_agent_response_bytes_total') / 1024:.0f} KiB, "
+        f"{METRICS.counter('cidr_agent_http_responses_total', status='429')} throttled response(s), "
+        f"{METRICS.counter('cidr_agent_throttled_retries_total')} page retry(ies). "
+        f"Cache: {METRICS.counter('cidr_agent_cache_lookups_total', result='hit')} hit(s), "
+        f"{METRICS.counter('cidr_agent_cache_lookups_total', result='miss')} miss(es)."
+    )
+
+def get_subscription_id():
     subscription_id = os.environ.get("AZURE_SUBSCRIPTION_ID")
     if not subscription_id:
         console.print("[red]Please set the AZURE_SUBSCRIPTION_ID environment variable.[/red]")
         raise typer.Exit(1)
+    return subscription_id
+
+# Helper to authenticate and create client
+def get_network_client():
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.network import NetworkManagementClient
+    subscription_id = get_subscription_id()
     credential = DefaultAzureCredential()
     return NetworkManagementClient(credential, subscription_id)
 
 # List all used CIDRs in VNets and Subnets
 def fetch_used_cidrs(client):
-    used_cidrs = set()
-    vnets = client.virtual_networks.list_all()
-    for vnet in vnets:
-        used_cidrs.update(vnet.address_space.address_prefixes)
-        for subnet in client.subnets.list(vnet.resource_group_name, vnet.name):
-            used_cidrs.add(subnet.address_prefix)
-    return used_cidrs
+    from cidr_inventory import load_inventory
+    return load_inventory(client).used_cidrs()
+
+# Snapshot files are kept per subscription, plus one for the tenant-wide crawl
+def snapshot_scope(all_subscriptions):
+    return "tenant" if all_subscriptions else get_subscription_id()
+
+# Load one subscription, or every subscription concurrently into one tenant-wide model
+def crawl_cli_inventory(all_subscriptions, include_nics=False):
+    from azure.identity import DefaultAzureCredential
+    from cidr_collector import collect_tenant_inventory, fetch_subscription_ids
+    from cidr_inventory import load_inventory, load_nics
+    if not all_subscriptions:
+        client = get_network_client()
+        inventory = load_inventory(client, get_subscription_id())
+        return load_nics(client, inventory) if include_nics else inventory
+    credential = DefaultAzureCredential()
+    subscription_ids = fetch_subscription_ids(credential)
+
+    def report(subscription_id, inventory, error):
+        if error is not None:
+            console.print(f"[red]{subscription_id}: {error}[/red]")
+        else:
+            console.print(f"[dim]{subscription_id}: {len(inventory.vnets)} VNets[/dim]")
+
+    inventory, errors = collect_tenant_inventory(subscription_ids, credential, include_nics=include_nics, on_result=report)
+    if errors:
+        console.print(f"[yellow]{len(errors)} of {len(subscription_ids)} subscriptions could not be read.[/yellow]")
+    return inventory
+
+# Patch a stale snapshot from the Resource Graph change feed; the refresher falls
+# back to a full crawl once the snapshot is past its reconciliation interval
+def refresh_cli_inventory(all_subscriptions, snapshot):
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.network import NetworkManagementClient
+    from azure.mgmt.resourcegraph import ResourceGraphClient
+    from cidr_changes import InventoryRefresher
+    credential = DefaultAzureCredential()
+    inventory = snapshot.load_inventory()
+    # A snapshot saved with NICs keeps them current, through the change feed and full reconciles alike
+    track_nics = inventory.nics_loaded
+    refresher = InventoryRefresher(
+        lambda subscription_id: NetworkManagementClient(credential, subscription_id),
+        ResourceGraphClient(credential),
+        snapshot.subscription_ids,
+        inventory=inventory,
+        full_crawl=lambda: crawl_cli_inventory(all_subscriptions, track_nics),
+        track_nics=track_nics,
+    )
+    inventory = refresher.refresh()
+    console.print(f"[dim]Snapshot refreshed ({refresher.last_refresh_mode}, {refresher.last_changes} changed resource(s)).[/dim]")
+    return inventory
+
+def open_cli_snapshot(all_subscriptions, from_snapshot):
+    if not from_snapshot:
+        return None
+    snapshot = open_snapshot(snapshot_path(snapshot_scope(all_subscriptions)))
+    if snapshot is None:
+        console.print("[yellow]No usable inventory snapshot found; crawling Azure.[/yellow]")
+    return snapshot
+
+def snapshot_is_fresh(snapshot, max_age):
+    if snapshot is None or (max_age is not None and snapshot.age() > max_age):
+        return False
+    collected = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.collected_at))
+    console.print(f"[dim]Using inventory snapshot collected {collected}.[/dim]")
+    return True
+
+# Answer from a snapshot when asked to, otherwise crawl (or refresh a stale
+# snapshot) and save a fresh snapshot. A snapshot the caller already opened is
+# used instead of opening another; either way it is closed here.
+def load_cli_inventory(all_subscriptions, from_snapshot=False, max_age=None, snapshot=None):
+    if snapshot is None:
+        snapshot = open_cli_snapshot(all_subscriptions, from_snapshot)
+    try:
+        if snapshot_is_fresh(snapshot, max_age):
+            return snapshot.load_inventory()
+        if snapshot is not None:
+            inventory = refresh_cli_inventory(all_subscriptions, snapshot)
+        else:
+            inventory = crawl_cli_inventory(all_subscriptions)
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+    save_snapshot(inventory, snapshot_path(snapshot_scope(all_subscriptions)))
+    return inventory
+
+# The pool policy in pools_file or $CIDR_AGENT_POOLS; None when neither is set
+def load_cli_policy(pools_file, region=None, environment=None):
+    from cidr_pools import load_pools
+    try:
+        policy = load_pools(pools_file)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        console.print(f"[red]Could not read pool policy: {e}[/red]")
+        raise typer.Exit(1)
+    if policy is None and (region or environment):
+        console.print("[red]--region and --environment need a pool policy (--pools or CIDR_AGENT_POOLS).[/red]")
+        raise typer.Exit(1)
+    return policy
+
+# Search ranges and reserved prefixes for one family: the policy's pools, or the private ranges when there is none
+def policy_space(policy, family, region=None, environment=None):
+    if policy is None:
+        return (ULA_RANGES if family == 6 else PRIVATE_RANGES), []
+    try:
+        return policy.ranges(family, region, environment), policy.reserved_prefixes(family)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+
+# Ask a running `serve` daemon for the same scope; None when there is none, so the caller loads the inventory itself
+def ask_daemon(no_daemon, all_subscriptions, path, **params):
+    if no_daemon:
+        return None
+    answer = daemon_request(path, scope=snapshot_scope(all_subscriptions), **params)
+    if answer is not None:
+        collected = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(answer["collected_at"]))
+        console.print(f"[dim]Answered by the agent daemon (inventory collected {collected}).[/dim]")
+    return answer
 
 @app.command()
-def show_used_cidrs():
+def show_used_cidrs(all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+                    from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+                    max_age: float = MAX_AGE_OPTION,
+                    no_daemon: bool = NO_DAEMON_OPTION):
     """Display all currently used CIDRs in Azure."""
-    client = get_network_client()
-    used_cidrs = fetch_used_cidrs(client)
+    answer = ask_daemon(no_daemon, all_subscriptions, "/used-cidrs")
+    if answer is not None:
+        used_cidrs = answer["used_cidrs"]
+    else:
+        inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age)
+        # IPv4 before IPv6, each in address order
+        used_cidrs = sorted(inventory.used_prefixes())
     console.print("[bold green]Currently used CIDRs:[/bold green]")
-    for cidr in sorted(used_cidrs):
+    for cidr in used_cidrs:
         console.print(f"- {cidr}")
     console.print(f"\n[bold]Total in use:[/bold] {len(used_cidrs)}")
+    if answer is None:
+        console.print(f"[dim]Inventory loaded with {inventory.api_calls} Azure API call(s).[/dim]")
 
 @app.command()
-def freeup_suggestions():
+def freeup_suggestions(all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+                       from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+                       max_age: float = MAX_AGE_OPTION,
+                       no_daemon: bool = NO_DAEMON_OPTION):
     """Suggest actions to free up CIDRs."""
-    client = get_network_client()
-    vnets = list(client.virtual_networks.list_all())
-    unused_vnets = []
-    for vnet in vnets:
-        subnets = list(client.subnets.list(vnet.resource_group_name, vnet.name))
-        if not subnets:
-            unused_vnets.append(vnet)
+    answer = ask_daemon(no_daemon, all_subscriptions, "/freeup")
+    if answer is not None:
+        unused_vnets = [(v["name"], v["address_prefixes"], v["resource_group"]) for v in answer["unused_vnets"]]
+    else:
+        inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age)
+        unused_vnets = [(v.name, v.address_prefixes, v.resource_group) for v in inventory.vnets if not v.subnets]
     if unused_vnets:
         console.print("[yellow]VNets with no subnets (can be deleted to free CIDRs):[/yellow]")
-        for vnet in unused_vnets:
-            console.print(f"- {vnet.name} ({vnet.address_space.address_prefixes}) in {vnet.resource_group_name}")
+        for name, address_prefixes, resource_group in unused_vnets:
+            console.print(f"- {name} ({address_prefixes}) in {resource_group}")
     else:
         console.print("[green]No unused VNets found. All CIDRs are in use.[/green]")
 
 @app.command()
-def suggest_cidr(netmask: int = typer.Argument(..., help="Netmask for the new VNet (e.g., 24 for /24)")):
-    """Suggest the optimal CIDR for a new VNet with the given netmask, with zero IP wastage."""
-    client = get_network_client()
-    used_cidrs = set(fetch_used_cidrs(client))
-    # Azure private address space
-    private_ranges = [
-        ipaddress.IPv4Network('10.0.0.0/8'),
-        ipaddress.IPv4Network('172.16.0.0/12'),
-        ipaddress.IPv4Network('192.168.0.0/16'),
-    ]
-    block_size = 2 ** (32 - netmask)
-    for parent in private_ranges:
-        for subnet in parent.subnets(new_prefix=netmask):
-            if str(subnet) not in used_cidrs:
-                # Check for overlap
-                overlap = False
-                for used in used_cidrs:
-                    if ipaddress.IPv4Network(used).overlaps(subnet):
-                        overlap = True
-                        break
-                if not overlap:
-                    console.print(f"[bold green]Suggested CIDR:[/bold green] {subnet}")
-                    return
+def suggest_cidr(netmask: int = typer.Argument(..., help="Netmask for the new VNet (e.g., 24 for /24)"),
+                 ipv6: bool = typer.Option(False, "--ipv6", help="Suggest an IPv6 prefix from the unique local range fd00::/8."),
+                 all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+                 from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+                 max_age: float = MAX_AGE_OPTION,
+                 no_daemon: bool = NO_DAEMON_OPTION,
+                 reserve: bool = typer.Option(False, "--reserve", help="Lease the suggested block so concurrent callers are not offered it."),
+                 owner: str = typer.Option(None, "--owner", help="With --reserve, who holds the lease (e.g. a pipeline run id)."),
+                 ttl: float = typer.Option(None, "--ttl", help="With --reserve, seconds until the lease expires (default 1800)."),
+                 pools: str = POOLS_OPTION,
+                 region: str = REGION_OPTION,
+                 environment: str = ENVIRONMENT_OPTION):
+    """Suggest the optimal CIDR for a new VNet with the given netmask, with zero IP wastage.
+
+    Blocks leased by other --reserve calls count as used until they expire or show up in the inventory.
+    With a pool policy, the block comes from the pools for --region and --environment and never from a reserved range.
+    """
+    family = 6 if ipv6 else 4
+    policy = load_cli_policy(pools, region, environment)
+    ranges, reserved = policy_space(policy, family, region, environment)
+    answer = ask_daemon(no_daemon, all_subscriptions, "/suggest", netmask=netmask, family=family,
+                        reserve=1 if reserve else None, owner=owner, ttl=ttl, region=region, environment=environment,
+                        policy=policy.digest if policy else None)
+    lease_token = None
+    if answer is not None:
+        suggestion = answer["cidr"]
+        lease_token = answer.get("lease")
+    else:
+        # Only --reserve creates the lease DB; plain suggestions read it if it exists
+        leases = LeaseStore() if reserve else existing_lease_store()
+        snapshot = open_cli_snapshot(all_subscriptions, from_snapshot)
+        if snapshot_is_fresh(snapshot, max_age):
+            # Integer ranges straight from the snapshot, no CIDR parsing
+            intervals = snapshot.used_intervals(family)
+            snapshot.close()
+        else:
+            inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age, snapshot)
+            if leases is not None:
+                # Leased blocks that now exist in Azure no longer need a lease
+                leases.confirm(inventory)
+            used = inventory.used_prefixes()
+            intervals = [(p.start, p.end) for p in used if p.family == family]
+        # Reserved ranges are compiled into the used space, so the search never lands in one
+        allocator = FreeSpaceAllocator.from_intervals(intervals + [(p.start, p.end) for p in reserved], ranges)
+        if reserve:
+            lease = lease_first_free(leases, allocator, netmask, owner, ttl)
+            suggestion = lease.prefixes[0] if lease else None
+            lease_token = lease.token if lease else None
+        else:
+            if leases is not None:
+                allocator = allocator.with_used(leases.active(family))
+            suggestion = allocator.first_free(netmask)
+    if suggestion:
+        console.print(f"[bold green]Suggested CIDR:[/bold green] {suggestion}")
+        if lease_token:
+            console.print(f"[dim]Leased as {lease_token}; release it with `release {lease_token}` if unused.[/dim]")
+        return
     console.print("[red]No available CIDR found with the given netmask and zero IP wastage.[/red]")
 
+@app.command()
+def leases():
+    """List the active CIDR leases."""
+    store = existing_lease_store()
+    entries = store.entries() if store else []
+    if not entries:
+        console.print("[green]No active leases.[/green]")
+        return
+    for token, prefix, owner, expires_at in entries:
+        expires = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(expires_at))
+        console.print(f"- {prefix} leased by {owner or 'unknown'} until {expires} ({token})")
+
+@app.command()
+def release(token: str = typer.Argument(..., help="Lease token printed by suggest-cidr --reserve")):
+    """Release a CIDR lease before it expires."""
+    store = existing_lease_store()
+    if store and store.release(token):
+        console.print(f"[green]Released lease {token}.[/green]")
+        return
+    console.print(f"[yellow]No lease {token} (already released, confirmed or expired).[/yellow]")
+    raise typer.Exit(1)
+
+@app.command()
+def conflicts(all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+              from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+              max_age: float = MAX_AGE_OPTION):
+    """Report VNets whose address spaces overlap (these can never be peered)."""
+    from cidr_conflicts import find_vnet_conflicts
+    inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age)
+    found = find_vnet_conflicts(inventory)
+    if not found:
+        console.print("[green]No overlapping VNet address spaces found.[/green]")
+        return
+    console.print(f"[yellow]{len(found)} overlapping VNet address space pair(s):[/yellow]")
+    for conflict in found:
+        console.print(
+            f"- {conflict['VNet A']} ({conflict['CIDR A']}, {conflict['Resource Group A']}) {conflict['Relation']} "
+            f"{conflict['VNet B']} ({conflict['CIDR B']}, {conflict['Resource Group B']})"
+        )
+
+# Crawl NICs unless the inventory has them, and save them into the snapshot so the next command does not crawl again
+def load_cli_nics(inventory, all_subscriptions):
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.network import NetworkManagementClient
+    from cidr_inventory import load_nics
+    if inventory.nics_loaded:
+        return inventory
+    credential = DefaultAzureCredential()
+    for subscription_id in inventory.subscription_ids:
+        load_nics(NetworkManagementClient(credential, subscription_id), inventory)
+    save_snapshot(inventory, snapshot_path(snapshot_scope(all_subscriptions)))
+    return inventory
+
+@app.command()
+def export(output: str = typer.Argument(..., help="File to write; the format follows its extension (.csv, .jsonl, .parquet) unless --format is given."),
+           fmt: str = typer.Option(None, "--format", help="csv, jsonl or parquet."),
+           dataset: str = typer.Option("subnets", "--dataset", help="subnets (one row per subnet) or nics (one row per NIC IP configuration)."),
+           usage: bool = typer.Option(False, "--usage", help="With the subnets dataset, crawl NICs to fill in used IPs and utilization."),
+           all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+           from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+           max_age: float = MAX_AGE_OPTION):
+    """Write the address inventory to CSV, JSON Lines or Parquet, streaming rows in bounded chunks."""
+    from cidr_export import DATASETS, EXPORT_FORMATS, export_rows, format_for_path, write_export
+    from cidr_inventory import subnet_ip_usage
+    fmt = (fmt or format_for_path(output)).lower()
+    if fmt not in EXPORT_FORMATS or dataset not in DATASETS:
+        console.print(f"[red]--format must be one of {', '.join(EXPORT_FORMATS)} and --dataset one of {', '.join(DATASETS)}.[/red]")
+        raise typer.Exit(1)
+    inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age)
+    if dataset == "nics" or usage:
+        load_cli_nics(inventory, all_subscriptions)
+    ip_usage = subnet_ip_usage(inventory.nics, family=4) if usage else None
+    try:
+        with open(output, "wb") as out:
+            written = write_export(export_rows(inventory, dataset, ip_usage), out, fmt, dataset)
+    except ValueError as error:
+        console.print(f"[red]{error}[/red]")
+        raise typer.Exit(1)
+    console.print(f"[green]Wrote {written} {dataset} row(s) to {output} ({fmt}).[/green]")
+
+@app.command()
+def fragmentation(limit: int = typer.Option(10, "--limit", help="How many recovery candidates to list."),
+                  usage: bool = typer.Option(False, "--usage", help="Crawl NICs to tell idle VNets (no IPs in use) from ones in use."),
+                  all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+                  from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+                  max_age: float = MAX_AGE_OPTION):
+    """Report how fragmented the free private space is, and which VNets to remove to recover the largest blocks."""
+    from cidr_fragmentation import CAPACITY_PREFIXLENS, range_fragmentation, recovery_candidates
+    from cidr_inventory import subnet_ip_usage
+    inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age)
+    if usage:
+        load_cli_nics(inventory, all_subscriptions)
+    ip_usage = subnet_ip_usage(inventory.nics) if usage else None
+
+    table = Table(title="Free space per range")
+    for column in ("Range", "Free", "Free %", "Blocks", "Largest", "Fragmentation"):
+        table.add_column(column, justify="left" if column == "Range" else "right")
+    for prefixlen in CAPACITY_PREFIXLENS:
+        table.add_column(f"/{prefixlen}s", justify="right")
+    for report in range_fragmentation(FreeSpaceAllocator(inventory.used_prefixes(), PRIVATE_RANGES)):
+        capacity = report["capacity"]
+        table.add_row(report["range"], f"{report['free_addresses']:,}", f"{report['free_percent']:.1f}",
+                      str(report["free_blocks"]), report["largest_free_block"] or "-", f"{report['fragmentation']:.3f}",
+                      *(f"{capacity[p]:,}" if p in capacity else "-" for p in CAPACITY_PREFIXLENS))
+    console.print(table)
+
+    candidates = recovery_candidates(inventory, ip_usage, limit=limit)
+    if not candidates:
+        console.print("[green]No VNet holds private space that removing it would free.[/green]")
+        return
+    console.print("[yellow]Largest blocks recovered by removing one VNet:[/yellow]")
+    for candidate in candidates:
+        console.print(
+            f"- {candidate['Block Recovered']}: {candidate['Action'].lower()} {candidate['VNet Name']} "
+            f"({candidate['Address Space']}, {candidate['Resource Group']}, {candidate['State']}), "
+            f"freeing {candidate['Addresses Freed']:,} addresses"
+        )
+
+def load_cli_index(all_subscriptions, from_snapshot, max_age, nics):
+    from cidr_index import AddressIndex
+    inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age)
+    if nics:
+        load_cli_nics(inventory, all_subscriptions)
+    return AddressIndex(inventory, None if nics else [])
+
+def print_index_rows(title, rows):
+    table = Table(title=title)
+    for column in ("Kind", "CIDR", "Name", "VNet Name", "Subnet Name", "Resource Group"):
+        table.add_column(column, no_wrap=column in ("Kind", "CIDR"))
+    for row in rows:
+        table.add_row(row["Kind"], row["CIDR"], row["Name"], row["VNet Name"] or "", row["Subnet Name"] or "", row["Resource Group"] or "")
+    console.print(table)
+
+@app.command()
+def lookup(address: str = typer.Argument(..., help="IP address or CIDR to look up, e.g. 10.42.7.19"),
+           nics: bool = typer.Option(True, "--nics/--no-nics", help="Include NIC and load balancer IPs (crawls NICs once if the snapshot has none, then saves them in it)."),
+           as_json: bool = typer.Option(False, "--json", help="Print the matches as JSON."),
+           all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+           from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+           max_age: float = MAX_AGE_OPTION):
+    """Show which NIC, subnet and VNet own an address, most specific first."""
+    index = load_cli_index(all_subscriptions, from_snapshot, max_age, nics)
+    try:
+        rows = index.lookup(address)
+    except ValueError as error:
+        console.print(f"[red]{error}[/red]")
+        raise typer.Exit(1)
+    if as_json:
+        print(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        console.print(f"[yellow]No VNet, subnet or NIC holds {address}.[/yellow]")
+        raise typer.Exit(1)
+    print_index_rows(f"Owners of {address}", rows)
+
+@app.command()
+def contains(query: str = typer.Argument(..., help="CIDR (10.40.0.0/14) or address range (10.40.0.0-10.41.255.255) to search"),
+             kind: str = typer.Option(None, "--kind", help="Comma-separated kinds to list: vnet, subnet, nic (default: all)."),
+             nics: bool = typer.Option(False, "--nics", help="Include NIC and load balancer IPs (crawls NICs once if the snapshot has none, then saves them in it)."),
+             limit: int = typer.Option(100, "--limit", help="Stop after this many matches (0 for all)."),
+             overlapping: bool = typer.Option(False, "--overlapping", help="Also list prefixes that only partly overlap the query or enclose it."),
+             as_json: bool = typer.Option(False, "--json", help="Print the matches as JSON."),
+             all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+             from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+             max_age: float = MAX_AGE_OPTION):
+    """List the VNets, subnets and NIC IPs inside a CIDR or address range, in address order."""
+    from cidr_index import KINDS
+    kinds = tuple(k.strip().lower() for k in kind.split(",")) if kind else KINDS
+    if not set(kinds) <= set(KINDS):
+        console.print(f"[red]--kind must be a comma-separated list of {', '.join(KINDS)}.[/red]")
+        raise typer.Exit(1)
+    index = load_cli_index(all_subscriptions, from_snapshot, max_age, nics or "nic" in (kind or ""))
+    try:
+        rows = index.overlapping(query, kinds) if overlapping else index.contains(query, kinds, limit)
+    except ValueError as error:
+        console.print(f"[red]{error}[/red]")
+        raise typer.Exit(1)
+    if overlapping and limit:
+        rows = rows[:limit]
+    if as_json:
+        print(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        console.print(f"[green]Nothing in {query}.[/green]")
+        return
+    print_index_rows(f"In {query}", rows)
+    if limit and len(rows) == limit:
+        console.print(f"[dim]Showing the first {limit}; raise --limit to see more.[/dim]")
+
+@app.command()
+def plan(requirements_file: str = typer.Argument(..., help="YAML or JSON file listing the VNets and subnets to create"),
+         as_json: bool = typer.Option(False, "--json", help="Print the plan as JSON."),
+         all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+         from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+         max_age: float = MAX_AGE_OPTION,
+         pools: str = POOLS_OPTION,
+         region: str = REGION_OPTION,
+         environment: str = ENVIRONMENT_OPTION):
+    """Place many VNets and their subnets at once, best-fit, and report fragmentation."""
+    try:
+        demands = load_requirements(requirements_file)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        console.print(f"[red]Could not read {requirements_file}: {e}[/red]")
+        raise typer.Exit(1)
+    policy = load_cli_policy(pools, region, environment)
+    ranges, reserved = policy_space(policy, 4, region, environment)
+    inventory = load_cli_inventory(all_subscriptions, from_snapshot, max_age)
+    store = existing_lease_store()
+    used = list(inventory.used_prefixes()) + (store.active() if store else []) + reserved
+    placements, unplaced, report = plan_batch(used, demands, ranges)
+    if as_json:
+        print(json.dumps({
+            "placements": placements,
+            "unplaced": [{"Requirement": d.name, "Instance": d.instance, "Prefix": d.prefixlen} for d in unplaced],
+            "fragmentation": report,
+        }, indent=2))
+        return
+    for placement in placements:
+        console.print(f"[bold green]{placement['Requirement']} #{placement['Instance']}:[/bold green] {placement['VNet CIDR']}")
+        for subnet in placement["Subnets"]:
+            console.print(f"    {subnet}")
+    for demand in unplaced:
+        console.print(f"[red]{demand.name} #{demand.instance}: no free /{demand.prefixlen} block.[/red]")
+    before, after = report["before"], report["after"]
+    console.print(
+        f"\n[bold]Free addresses:[/bold] {before['free_addresses']:,} -> {after['free_addresses']:,}"
+        f"  [bold]Largest free block:[/bold] {after['largest_free_block']}"
+        f"  [bold]Fragmentation:[/bold] {before['fragmentation']:.3f} -> {after['fragmentation']:.3f}"
+    )
+    if unplaced:
+        raise typer.Exit(1)
+
+@app.command("what-if")
+def what_if(changes_file: str = typer.Argument(None, help="YAML or JSON change set listing VNets and subnets to delete and add"),
+            delete_unused_subnets: bool = typer.Option(False, "--delete-unused-subnets", help="Also delete every subnet with no IPs in use (needs NICs in the snapshot)."),
+            netmask: List[int] = typer.Option([24], "--netmask", help="Block size to suggest before and after the changes; repeat for several."),
+            ipv6: bool = typer.Option(False, "--ipv6", help="Measure IPv6 space instead of IPv4."),
+            as_json: bool = typer.Option(False, "--json", help="Print the comparison as JSON."),
+            all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+            pools: str = POOLS_OPTION,
+            region: str = REGION_OPTION,
+            environment: str = ENVIRONMENT_OPTION):
+    """Simulate deleting and adding VNets and subnets on the saved snapshot, without calling Azure.
+
+    Compares free space, suggestions, VNet conflicts and subnet utilization before and after.
+    """
+    from cidr_inventory import subnet_ip_usage
+    from cidr_whatif import ChangeSet, Simulation, load_changes, unused_subnet_ids
+    try:
+        changes = load_changes(changes_file) if changes_file else ChangeSet()
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        console.print(f"[red]Could not read {changes_file}: {e}[/red]")
+        raise typer.Exit(1)
+    policy = load_cli_policy(pools, region, environment)
+    snapshot = open_snapshot(snapshot_path(snapshot_scope(all_subscriptions)))
+    if snapshot is None:
+        console.print("[red]No inventory snapshot to simulate on; run show-used-cidrs once to save one.[/red]")
+        raise typer.Exit(1)
+    snapshot_is_fresh(snapshot, None)
+    inventory = snapshot.load_inventory()
+    snapshot.close()
+    if delete_unused_subnets:
+        if not inventory.nics_loaded:
+            console.print("[red]The snapshot has no NICs, so unused subnets cannot be told apart.[/red]")
+            raise typer.Exit(1)
+        changes = changes.with_deleted_subnets(unused_subnet_ids(inventory, subnet_ip_usage(inventory.nics)))
+    simulation = Simulation(inventory, policy)
+    try:
+        report = simulation.evaluate(simulation.apply(changes), netmask, 6 if ipv6 else 4, region, environment)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    if as_json:
+        print(json.dumps(report, indent=2))
+        return
+
+    console.print("[bold]Changes:[/bold] " + ", ".join(f"{what} {count}" for what, count in report["changes"].items()))
+    table = Table(title="Before and after")
+    for column in ("", "Before", "After"):
+        table.add_column(column, justify="left" if not column else "right")
+    headroom = report["headroom"]
+    table.add_row(f"Free {headroom['Family']} addresses", f"{headroom['Free IPs Before']:,}", f"{headroom['Free IPs After']:,}")
+    table.add_row("Largest free block", headroom["Largest Free Block Before"] or "-", headroom["Largest Free Block After"] or "-")
+    table.add_row("Fragmentation", f"{headroom['Fragmentation Before']:.3f}", f"{headroom['Fragmentation After']:.3f}")
+    for row in report["pools"]:
+        table.add_row(f"Free in {row['Region']} pools", f"{row['Free IPs Before']:,}", f"{row['Free IPs After']:,}")
+    for row in report["suggestions"]:
+        table.add_row(f"First free {row['Netmask']}", row["Before"] or "none", row["After"] or "none")
+    conflicts = report["conflicts"]
+    table.add_row("Overlapping VNet pairs", str(conflicts["before"]), str(conflicts["after"]))
+    before, after = report["utilization"]["before"], report["utilization"]["after"]
+    table.add_row("Subnets", f"{before['Subnets']:,}", f"{after['Subnets']:,}")
+    table.add_row("Subnet IPs", f"{before['Total IPs']:,}", f"{after['Total IPs']:,}")
+    if before["Used IPs"] is not None:
+        table.add_row("Subnet utilization %", f"{before['Utilization %']}", f"{after['Utilization %']}")
+    console.print(table)
+    for row in conflicts["new"]:
+        console.print(f"[red]New overlap: {row['VNet A']} ({row['CIDR A']}, {row['Resource Group A']}) {row['Relation']} "
+                      f"{row['VNet B']} ({row['CIDR B']}, {row['Resource Group B']})[/red]")
+    if report["busy_deleted_subnets"]:
+        console.print(f"[yellow]Azure will refuse to delete these subnets while they hold IPs: "
+                      f"{', '.join(report['busy_deleted_subnets'])}[/yellow]")
+
+@app.command("pools")
+def pool_headroom(pools: str = POOLS_OPTION,
+                  all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+                  from_snapshot: bool = FROM_SNAPSHOT_OPTION,
+                  max_age: float = MAX_AGE_OPTION):
+    """Show how much of each region's pools is used, reserved and still free."""
+    policy = load_cli_policy(pools)
+    if policy is None:
+        console.print("[red]No pool policy: pass --pools or set CIDR_AGENT_POOLS.[/red]")
+        raise typer.Exit(1)
+    used = load_cli_inventory(all_subscriptions, from_snapshot, max_age).used_prefixes()
+    for family in (4, 6):
+        rows = policy.headroom([(p.start, p.end) for p in used if p.family == family], family)
+        if not rows:
+            continue
+        table = Table(title=f"IPv{family} pool headroom per region")
+        for column in rows[0]:
+            table.add_column(column, justify="left" if column in ("Region", "Pools") else "right", no_wrap=column == "Region")
+        for row in rows:
+            table.add_row(*(f"{value:,}" if isinstance(value, int) else f"{value:.1f}" if isinstance(value, float)
+                            else value or "-" for value in row.values()))
+        console.print(table)
+    for name, prefixes in policy.reserved:
+        console.print(f"[dim]Reserved {name}: {', '.join(str(p) for p in prefixes)}[/dim]")
+
+@app.command()
+def serve(host: str = typer.Option(DEFAULT_HOST, help="Address to listen on."),
+          port: int = typer.Option(DEFAULT_PORT, help="Port to listen on."),
+          interval: float = typer.Option(REFRESH_INTERVAL, help="Seconds between inventory refreshes."),
+          all_subscriptions: bool = ALL_SUBSCRIPTIONS_OPTION,
+          pools: str = POOLS_OPTION):
+    """Keep the inventory in memory, refresh it on a schedule and answer queries over a local JSON API.
+
+    While it runs, show-used-cidrs, freeup-suggestions and suggest-cidr for the same scope ask it instead of crawling.
+    """
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.network import NetworkManagementClient
+    from azure.mgmt.resourcegraph import ResourceGraphClient
+    from cidr_changes import InventoryRefresher
+    from cidr_collector import fetch_subscription_ids
+    # Our own progress at INFO; the Azure SDK's request logging only when it warns
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    logging.getLogger("cidr_agent").setLevel(logging.INFO)
+    policy = load_cli_policy(pools)
+    scope = snapshot_scope(all_subscriptions)
+    path = snapshot_path(scope)
+    credential = DefaultAzureCredential()
+    # Start answering from the last snapshot straight away; the first refresh patches it
+    inventory = None
+    snapshot = open_snapshot(path)
+    if snapshot is not None:
+        inventory = snapshot.load_inventory()
+        subscription_ids = snapshot.subscription_ids
+        snapshot.close()
+    elif all_subscriptions:
+        subscription_ids = fetch_subscription_ids(credential)
+    else:
+        subscription_ids = [scope]
+    # Keep NICs that lookup or export --usage saved in the snapshot, rather than overwrite them with none
+    track_nics = inventory is not None and inventory.nics_loaded
+    refresher = InventoryRefresher(
+        lambda subscription_id: NetworkManagementClient(credential, subscription_id),
+        ResourceGraphClient(credential),
+        subscription_ids,
+        inventory=inventory,
+        full_crawl=lambda: crawl_cli_inventory(all_subscriptions, track_nics),
+        track_nics=track_nics,
+    )
+    service = InventoryService(refresher, scope, interval, on_refresh=lambda inv: save_snapshot(inv, path),
+                               leases=LeaseStore(), policy=policy)
+    server = make_server(service, host, port)
+    service.start()
+    console.print(f"[bold green]Serving {scope} on http://{host}:{port}[/bold green] (refresh every {interval:g}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
 if __name__ == "__main__":
     app() 
\ No newline at end of file
@@ -1,19 +1,36 @@
 import streamlit as st
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.network import NetworkManagementClient
-import ipaddress
+import heapq
+import io
+import math
 import os
 import pandas as pd
 import requests
+import threading
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
 from streamlit_lottie import st_lottie
 
-def extract_resource_group_from_id(resource_id):
-    parts = resource_id.split("/")
-    try:
-        rg_index = parts.index("resourceGroups")
-        return parts[rg_index + 1]
-    except (ValueError, IndexError):
-        return None
+from cidr_allocator import PRIVATE_RANGES, FreeSpaceAllocator
+from cidr_analysis import first_free_cidr, idle_subnets, iter_subnet_rows, place_subnets, place_vnet, subnet_page, vnets_without_subnets
+from cidr_cache import InventoryCache
+from cidr_changes import RECONCILE_INTERVAL, InventoryRefresher
+from cidr_collector import collect_tenant_inventory
+from cidr_conflicts import find_vnet_conflicts
+from cidr_export import EXPORT_FORMATS, MIME_TYPES, export_rows, write_export
+from cidr_fragmentation import CAPACITY_PREFIXLENS, range_fragmentation, recovery_candidates
+from cidr_index import AddressIndex
+from cidr_inventory import Inventory, load_nics, subnet_ip_usage
+from cidr_leases import LEASE_PATH, LeaseStore
+from cidr_metrics import METRICS, timed
+from cidr_planner import parse_requirements, plan_batch
+from cidr_pools import POOLS_PATH, load_pools
+from cidr_snapshot import open_snapshot, save_snapshot, snapshot_path
+from cidr_whatif import Simulation, parse_changes, unused_subnet_ids
+
+st.set_page_config(page_title="Azure CIDR Agent", layout="wide")
 
 # Inject Azure Portal-like theme and custom CSS
 st.markdown(
@@ -96,182 +113,374 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Lottie animation (Azure cloud)
+# Lottie animation (Azure cloud), fetched once per process with a short timeout
+# so reruns never wait on lottiefiles.com; the page renders without it on failure
+@st.cache_resource(show_spinner=False)
 def load_lottieurl(url):
-    r = requests.get(url)
+    try:
+        r = requests.get(url, timeout=3)
+    except requests.RequestException:
+        return None
     if r.status_code != 200:
         return None
     return r.json()
 
 lottie_azure = load_lottieurl("https://assets10.lottiefiles.com/packages/lf20_3vbOcw.json")
 
-st.markdown('<div class="lottie-container">', unsafe_allow_html=True)
-st_lottie(lottie_azure, height=120, key="azurecloud")
-st.markdown('</div>', unsafe_allow_html=True)
+if lottie_azure:
+    st.markdown('<div class="lottie-container">', unsafe_allow_html=True)
+    st_lottie(lottie_azure, height=120, key="azurecloud")
+    st.markdown('</div>', unsafe_allow_html=True)
 
-st.set_page_config(page_title="Azure CIDR Agent", layout="wide")
 st.title("Azure CIDR Agent Dashboard")
 
+# Bars in the Used CIDRs utilization chart
+UTILIZATION_CHART_SUBNETS = 50
+
+BATCH_PLAN_EXAMPLE = """requirements:
+  - name: landing-zone
+    count: 12
+    subnets:
+      - prefix: 24
+        count: 4
+      - prefix: 27
+        count: 2
+"""
+
+WHAT_IF_EXAMPLE = """add:
+  vnets:
+    - name: vnet-new-app
+      resource_group: rg-app
+      cidrs: [10.200.0.0/22]
+      subnets:
+        - {name: snet-web, cidrs: [10.200.0.0/24]}
+# delete:
+#   vnets:
+#     - {name: vnet-legacy, resource_group: rg-legacy}
+#   subnets:
+#     - {vnet: vnet-hub, resource_group: rg-network, name: snet-old}
+"""
+
+# One credential and one client per subscription for the whole process
+@st.cache_resource
+def get_credential():
+    return DefaultAzureCredential()
+
 # Helper to authenticate and create client
+@st.cache_resource(max_entries=64)
 def get_network_client(subscription_id):
-    credential = DefaultAzureCredential()
-    return NetworkManagementClient(credential, subscription_id)
+    return NetworkManagementClient(get_credential(), subscription_id)
 
 # Caching for expensive Azure API calls
 @st.cache_data(ttl=300)
 def cached_fetch_subscriptions():
     from azure.mgmt.resource import SubscriptionClient
-    credential = DefaultAzureCredential()
-    sub_client = SubscriptionClient(credential)
+    sub_client = SubscriptionClient(get_credential())
     return [(sub.subscription_id, sub.display_name) for sub in sub_client.subscriptions.list()]
 
-@st.cache_data(ttl=300)
-def cached_fetch_vnets(_client):
-    return list(_client.virtual_networks.list_all())
+# One refresher per subscription: the first load is a full crawl, later TTL
+# expiries only patch what the Resource Graph change feed reports
+@st.cache_resource(max_entries=32)
+def get_inventory_refresher(subscription_id):
+    from azure.mgmt.resourcegraph import ResourceGraphClient
+    return InventoryRefresher(get_network_client, ResourceGraphClient(get_credential()), [subscription_id], track_nics=False)
 
-@st.cache_data(ttl=300)
-def cached_fetch_nics(_client):
-    return list(_client.network_interfaces.list_all())
+# Process-wide cache keyed by (subscription id or "tenant", scope), shared by all sessions
+@st.cache_resource
+def get_inventory_cache():
+    return InventoryCache(max_entries=32, ttl=300)
 
-@st.cache_data(ttl=300)
-def cached_fetch_subnets(_client, rg_name, vnet_name):
-    return list(_client.subnets.list(rg_name, vnet_name))
+def cached_fetch_inventory(subscription_id):
+    refresher = get_inventory_refresher(subscription_id)
+    return get_inventory_cache().get_or_load((subscription_id, "inventory"), refresher.refresh)
+
+# (cache key, loader) for a subscription's NICs. The loader touches no Streamlit
+# state, so it can also run on the prefetch pool.
+def nics_entry(subscription_id):
+    client = get_network_client(subscription_id)
+    return (subscription_id, "nics"), lambda: load_nics(client, Inventory(subscription_id)).nics
+
+def cached_fetch_nics(subscription_id):
+    return get_inventory_cache().get_or_load(*nics_entry(subscription_id))
+
+@st.cache_resource
+def get_prefetch_pool():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="cidr-prefetch")
+
+# The background NIC crawl per subscription, at most one in flight each
+@st.cache_resource
+def get_nic_prefetches():
+    return {}, threading.Lock()
+
+# Start the NIC crawl in the background so the views that need it find it warm;
+# a view that asks first simply waits for the in-flight load. A finished crawl's
+# failure is shown once, and the next rerun tries again.
+def prefetch_nics(subscription_id):
+    key, loader = nics_entry(subscription_id)
+    cache = get_inventory_cache()
+    futures, lock = get_nic_prefetches()
+    with lock:
+        future = futures.get(subscription_id)
+        if future is not None and not future.done():
+            return
+        futures.pop(subscription_id, None)
+        if future is None or future.exception() is None:
+            if not cache.is_fresh(key):
+                futures[subscription_id] = get_prefetch_pool().submit(cache.get_or_load, key, loader)
+            return
+    st.sidebar.warning(f"Could not read NICs for subscription {subscription_id}: {future.exception()}")
+
+# Crawl every subscription concurrently, updating a progress bar as each one finishes
+def crawl_tenant_inventory(subscription_ids):
+    progress = st.sidebar.progress(0.0, text="Collecting subscriptions...")
+    finished = []
+
+    def report(subscription_id, inventory, error):
+        finished.append(subscription_id)
+        progress.progress(len(finished) / len(subscription_ids), text=f"Collected {len(finished)}/{len(subscription_ids)} subscriptions")
+
+    inventory, errors = collect_tenant_inventory(subscription_ids, credential=get_credential(), on_result=report)
+    progress.empty()
+    for failed_id, error in errors.items():
+        st.sidebar.warning(f"Could not read subscription {failed_id}: {error}")
+    return inventory
+
+def fetch_tenant_inventory(subscription_ids):
+    return get_inventory_cache().get_or_load(("tenant", "inventory"), lambda: crawl_tenant_inventory(subscription_ids))
+
+# Snapshots already written by this process, so each crawl is saved once
+@st.cache_resource
+def saved_snapshots():
+    return {}
+
+def persist_snapshot(inventory, path, subscription_ids):
+    saved = saved_snapshots()
+    if saved.get(path) != inventory.collected_at:
+        save_snapshot(inventory, path, subscription_ids)
+        saved[path] = inventory.collected_at
+        store = existing_lease_store()
+        if store is not None:
+            # Leased blocks that now exist in Azure no longer need a lease
+            store.confirm(inventory)
+
+# Leases shared with the CLI and daemon, so suggestions made here and there never collide
+@st.cache_resource
+def get_lease_store():
+    return LeaseStore()
+
+# The lease store once something has reserved a block; reading never creates the DB
+def existing_lease_store():
+    return get_lease_store() if os.path.exists(LEASE_PATH) else None
+
+# Run pick(leased) with leased blocks counted as used; with reserve, also lease what it picks.
+# Returns (picked CIDRs or None, Lease or None).
+def suggest_with_leases(pick, family, reserve):
+    if not reserve:
+        store = existing_lease_store()
+        return pick(store.active(family) if store else []), None
+    lease = get_lease_store().reserve(pick, owner="web-ui", family=family)
+    return (lease.prefixes if lease else None), lease
+
+# The pool policy in $CIDR_AGENT_POOLS, compiled once per version of the file
+@st.cache_resource(max_entries=4)
+def get_pool_policy(path, mtime):
+    return load_pools(path)
+
+def current_pool_policy():
+    if not POOLS_PATH:
+        return None
+    try:
+        return get_pool_policy(POOLS_PATH, os.path.getmtime(POOLS_PATH))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError, yaml.YAMLError) as e:
+        st.sidebar.error(f"Could not read pool policy {POOLS_PATH}: {e}")
+        return None
+
+# Search ranges (None for the family's private ranges) and reserved prefixes for the
+# sidebar's region and environment; raises ValueError if no pool serves them
+def pool_space(family):
+    if pool_policy is None:
+        return None, []
+    return pool_policy.ranges(family, pool_region, pool_environment), pool_policy.reserved_prefixes(family)
+
+def load_snapshot_inventory(path):
+    snapshot = open_snapshot(path)
+    inventory = snapshot.load_inventory()
+    snapshot.close()
+    return inventory
+
+def cached_load_snapshot(scope, path, collected_at):
+    return get_inventory_cache().get_or_load((scope, f"snapshot@{collected_at}"), lambda: load_snapshot_inventory(path))
 
 # Use cached functions in place of direct API calls
 
 def fetch_subscriptions():
     return cached_fetch_subscriptions()
 
-def fetch_vnets_and_subnets(client):
-    vnets = cached_fetch_vnets(client)
-    vnet_data = []
-    for vnet in vnets:
-        rg_name = extract_resource_group_from_id(vnet.id)
-        vnet_name = vnet.name
-        vnet_cidrs = vnet.address_space.address_prefixes
-        subnets = cached_fetch_subnets(client, rg_name, vnet_name)
-        for subnet in subnets:
-            subnet_cidr = subnet.address_prefix
-            subnet_name = subnet.name
-            # Calculate total IPs in subnet
-            try:
-                net = ipaddress.ip_network(subnet_cidr)
-                total_ips = net.num_addresses
-            except Exception:
-                total_ips = None
-            used_ips = None
-            vnet_data.append({
-                "VNet Name": vnet_name,
-                "VNet CIDR": ", ".join(vnet_cidrs),
-                "Subnet Name": subnet_name,
-                "Subnet CIDR": subnet_cidr,
-                "Total IPs": total_ips,
-                "Used IPs": used_ips
-            })
-    return vnet_data
+# Inventory for the selected scope: one subscription, or the whole tenant.
+# A recent enough on-disk snapshot is used instead of crawling when allowed.
+def get_inventory(client):
+    scope = "tenant" if tenant_wide else subscription_id
+    path = snapshot_path(scope)
+    if use_snapshot and not refresh_requested:
+        snapshot = open_snapshot(path, max_snapshot_age * 60)
+        if snapshot is not None:
+            collected_at = snapshot.collected_at
+            snapshot.close()
+            return cached_load_snapshot(scope, path, collected_at)
+    if tenant_wide:
+        subscription_ids = [sid for sid, _ in subscriptions]
+        inventory = fetch_tenant_inventory(subscription_ids)
+    else:
+        subscription_ids = [subscription_id]
+        refresher = get_inventory_refresher(subscription_id)
+        if refresher.inventory is None:
+            # Seed from an older snapshot so the first refresh is incremental
+            snapshot = open_snapshot(path, RECONCILE_INTERVAL)
+            if snapshot is not None:
+                refresher.inventory = snapshot.load_inventory()
+                snapshot.close()
+        inventory = cached_fetch_inventory(subscription_id)
+    persist_snapshot(inventory, path, subscription_ids)
+    return inventory
+
+def get_nics(client):
+    if tenant_wide:
+        return get_inventory(client).nics
+    return cached_fetch_nics(subscription_id)
 
+# Without usage the used-IP columns are left empty, so the table can render before the NIC crawl
+@timed()
+def fetch_subnet_page(client, usage, match, page, page_size):
+    return subnet_page(get_inventory(client), usage, match, page, page_size)
+
+@timed()
 def fetch_used_cidrs(client):
-    used_cidrs = set()
-    vnets = cached_fetch_vnets(client)
-    for vnet in vnets:
-        used_cidrs.update(vnet.address_space.address_prefixes)
-        rg_name = extract_resource_group_from_id(vnet.id)
-        for subnet in cached_fetch_subnets(client, rg_name, vnet.name):
-            used_cidrs.add(subnet.address_prefix)
-    return used_cidrs
+    return get_inventory(client).used_prefixes()
 
+@timed()
 def freeup_suggestions(client):
-    vnets = cached_fetch_vnets(client)
-    unused_vnets = []
-    for vnet in vnets:
-        rg_name = extract_resource_group_from_id(vnet.id)
-        subnets = cached_fetch_subnets(client, rg_name, vnet.name)
-        if not subnets:
-            unused_vnets.append((vnet.name, vnet.address_space.address_prefixes, rg_name))
-    return unused_vnets
-
-def suggest_cidr(client, netmask):
-    used_cidrs = set(fetch_used_cidrs(client))
-    private_ranges = [
-        ipaddress.IPv4Network('10.0.0.0/8'),
-        ipaddress.IPv4Network('172.16.0.0/12'),
-        ipaddress.IPv4Network('192.168.0.0/16'),
-    ]
-    for parent in private_ranges:
-        for subnet in parent.subnets(new_prefix=netmask):
-            if str(subnet) not in used_cidrs:
-                overlap = False
-                for used in used_cidrs:
-                    if ipaddress.IPv4Network(used).overlaps(subnet):
-                        overlap = True
-                        break
-                if not overlap:
-                    return str(subnet)
-    return None
-
-def suggest_vnet_cidr(client, subnet_netmask, num_subnets):
-    used_cidrs = set(fetch_used_cidrs(client))
-    private_ranges = [
-        ipaddress.IPv4Network('10.0.0.0/8'),
-        ipaddress.IPv4Network('172.16.0.0/12'),
-        ipaddress.IPv4Network('192.168.0.0/16'),
-    ]
-    # Calculate the minimum VNet prefix length that can fit num_subnets of subnet_netmask
-    needed_addresses = 2 ** (32 - subnet_netmask) * num_subnets
-    for parent in private_ranges:
-        for vnet_prefix in range(subnet_netmask, parent.prefixlen - 1, -1):
-            vnet_block_size = 2 ** (32 - vnet_prefix)
-            if vnet_block_size < needed_addresses:
-                break
-            for vnet in parent.subnets(new_prefix=vnet_prefix):
-                # Check if this VNet CIDR is available
-                if str(vnet) in used_cidrs:
-                    continue
-                overlap = False
-                for used in used_cidrs:
-                    if ipaddress.IPv4Network(used).overlaps(vnet):
-                        overlap = True
-                        break
-                if not overlap:
-                    # Check if we can carve out num_subnets subnets of subnet_netmask from this VNet
-                    subnets = list(vnet.subnets(new_prefix=subnet_netmask))
-                    if len(subnets) >= num_subnets:
-                        return str(vnet), [str(s) for s in subnets[:num_subnets]]
-    return None, []
+    return vnets_without_subnets(get_inventory(client))
+
+@timed()
+def suggest_cidr(client, netmask, family=4, reserve=False):
+    ranges, reserved = pool_space(family)
+    used = list(fetch_used_cidrs(client)) + reserved
+
+    def pick(leased):
+        cidr = first_free_cidr(used + leased, netmask, family, ranges)
+        return [cidr] if cidr else None
+
+    cidrs, lease = suggest_with_leases(pick, family, reserve)
+    return (cidrs[0] if cidrs else None), lease
+
+@timed()
+def suggest_vnet_cidr(client, subnet_netmask, num_subnets, family=4, reserve=False):
+    ranges, reserved = pool_space(family)
+    used = list(fetch_used_cidrs(client)) + reserved
+    placed = {}
+
+    def pick(leased):
+        vnet_cidr, subnets = place_vnet(used + leased, subnet_netmask, num_subnets, family, ranges)
+        if vnet_cidr is None:
+            return None
+        placed["Subnets"] = subnets
+        return [vnet_cidr]
+
+    cidrs, lease = suggest_with_leases(pick, family, reserve)
+    if cidrs:
+        return cidrs[0], placed["Subnets"], lease
+    return None, [], None
 
 def get_vnet_choices(client):
-    vnets = cached_fetch_vnets(client)
-    return [(vnet.name, extract_resource_group_from_id(vnet.id), vnet.address_space.address_prefixes) for vnet in vnets]
-
-def suggest_subnets_in_vnet(client, vnet_cidr, existing_subnet_cidrs, subnet_netmask, num_subnets):
-    vnet_network = ipaddress.ip_network(vnet_cidr)
-    used_networks = [ipaddress.ip_network(c) for c in existing_subnet_cidrs]
-    possible_subnets = [s for s in vnet_network.subnets(new_prefix=subnet_netmask)
-                        if not any(s.overlaps(u) for u in used_networks)]
-    if len(possible_subnets) >= num_subnets:
-        return [str(s) for s in possible_subnets[:num_subnets]]
-    return []
+    inventory = get_inventory(client)
+    return [(vnet.name, vnet.resource_group, vnet.address_prefixes) for vnet in inventory.vnets]
+
+@timed()
+def suggest_subnets_in_vnet(client, vnet_cidrs, existing_subnet_cidrs, subnet_netmask, num_subnets, reserve=False):
+    def pick(leased):
+        return place_subnets(vnet_cidrs, list(existing_subnet_cidrs) + leased, subnet_netmask, num_subnets)
 
+    cidrs, lease = suggest_with_leases(pick, vnet_cidrs[0].family, reserve)
+    return cidrs or [], lease
+
+def show_lease(lease):
+    if lease is not None:
+        expires = time.strftime("%H:%M", time.localtime(lease.expires_at))
+        st.caption(f"Reserved until {expires} (lease {lease.token}). Other suggestions skip it until then or until it is deployed.")
+
+@timed()
 def find_unused_subnets(client):
-    nics = cached_fetch_nics(client)
-    used_subnet_ids = set()
-    for nic in nics:
-        for ipconf in nic.ip_configurations:
-            if ipconf.subnet and ipconf.subnet.id:
-                used_subnet_ids.add(ipconf.subnet.id.lower())
-    unused_subnets = []
-    vnets = cached_fetch_vnets(client)
-    for vnet in vnets:
-        rg_name = extract_resource_group_from_id(vnet.id)
-        for subnet in cached_fetch_subnets(client, rg_name, vnet.name):
-            if subnet.id.lower() not in used_subnet_ids:
-                unused_subnets.append({
-                    "VNet Name": vnet.name,
-                    "Subnet Name": subnet.name,
-                    "Subnet CIDR": subnet.address_prefix,
-                    "Resource Group": rg_name
-                })
-    return unused_subnets
+    return idle_subnets(get_inventory(client), subnet_ip_usage(get_nics(client)))
+
+@timed()
+def fetch_fragmentation(client):
+    rows = []
+    for report in range_fragmentation(FreeSpaceAllocator(fetch_used_cidrs(client), PRIVATE_RANGES)):
+        row = {
+            "Range": report["range"],
+            "Free IPs": report["free_addresses"],
+            "Free %": report["free_percent"],
+            "Free Blocks": report["free_blocks"],
+            "Largest Free Block": report["largest_free_block"],
+            "Fragmentation": report["fragmentation"],
+        }
+        for prefixlen in CAPACITY_PREFIXLENS:
+            row[f"/{prefixlen}s"] = report["capacity"].get(prefixlen)
+        rows.append(row)
+    return rows
+
+@timed()
+def fetch_recovery_candidates(client, limit):
+    return recovery_candidates(get_inventory(client), subnet_ip_usage(get_nics(client)), limit=limit)
+
+@timed()
+def fetch_pool_headroom(client):
+    used = fetch_used_cidrs(client)
+    rows = []
+    for family in (4, 6):
+        for row in pool_policy.headroom([(p.start, p.end) for p in used if p.family == family], family):
+            rows.append({"Family": f"IPv{family}", **row})
+    return rows
+
+# The base of every what-if scenario, built once per inventory, NIC crawl and pool policy
+@st.cache_resource(max_entries=8)
+def get_simulation(scope, collected_at, nic_count, policy_digest, _inventory, _nics, _policy):
+    return Simulation(_inventory, _policy, nics=_nics)
+
+@timed()
+def simulate_changes(client, changes, delete_unused, netmask):
+    inventory = get_inventory(client)
+    nics = get_nics(client)
+    simulation = get_simulation("tenant" if tenant_wide else subscription_id, inventory.collected_at, len(nics),
+                                pool_policy.digest if pool_policy is not None else None, inventory, nics, pool_policy)
+    if delete_unused:
+        if not nics:
+            raise ValueError("No NICs were found, so unused subnets cannot be told apart.")
+        changes = changes.with_deleted_subnets(unused_subnet_ids(inventory, subnet_ip_usage(nics)))
+    return simulation.evaluate(simulation.apply(changes), (netmask,), 4, pool_region, pool_environment)
+
+# One address index per scope, shared by all sessions; each search patches it with
+# whatever changed in the inventory and NICs since the last one
+@st.cache_resource(max_entries=32)
+def get_address_index(scope):
+    return AddressIndex()
+
+def current_address_index(client):
+    index = get_address_index("tenant" if tenant_wide else subscription_id)
+    index.update(get_inventory(client), get_nics(client))
+    return index
+
+# (prefixes holding the query, most specific first; what lies inside it) for an IP or CIDR,
+# or (everything overlapping it, []) for an address range
+@timed()
+def search_addresses(client, query, limit):
+    index = current_address_index(client)
+    if "-" in query:
+        return index.overlapping(query)[:limit], []
+    enclosing = index.lookup(query)
+    inside = index.contains(query, limit=limit + 1) if "/" in query else []
+    # The query's own prefix is already among the enclosing ones
+    return enclosing, [row for row in inside if row not in enclosing][:limit]
 
 # UI: Subscription selection
 st.sidebar.header("Azure Subscription")
@@ -285,27 +494,119 @@ sub_ids = {name: sid for sid, name in subscriptions}
 selected_sub = st.sidebar.selectbox("Select Subscription", list(sub_ids.keys()))
 subscription_id = sub_ids[selected_sub]
 
+tenant_wide = st.sidebar.checkbox(
+    "All subscriptions (tenant-wide)",
+    help="Check overlaps and suggest CIDRs against every subscription you can read, not just the selected one.",
+)
+
+use_snapshot = st.sidebar.checkbox(
+    "Start from saved snapshot",
+    value=True,
+    help="Answer from the last on-disk inventory snapshot instead of crawling Azure, if it is recent enough.",
+)
+max_snapshot_age = st.sidebar.number_input("Max snapshot age (minutes)", min_value=1, max_value=7 * 24 * 60, value=60, disabled=not use_snapshot)
+
+# Refresh drops only the selected scope's cache entries and skips the snapshot once
+refresh_requested = st.sidebar.button("Refresh", help="Reload this subscription's data from Azure.")
+if refresh_requested:
+    get_inventory_cache().invalidate("tenant" if tenant_wide else subscription_id)
+
+# With a pool policy, new blocks come only from the pools for the chosen region and environment
+pool_policy = current_pool_policy()
+pool_region = pool_environment = None
+if pool_policy is not None:
+    st.sidebar.header("Address Pools")
+    pool_region = st.sidebar.selectbox("Region", ["Any"] + pool_policy.regions())
+    pool_environment = st.sidebar.selectbox("Environment", ["Any"] + pool_policy.environments())
+    pool_region = None if pool_region == "Any" else pool_region
+    pool_environment = None if pool_environment == "Any" else pool_environment
+
 client = get_network_client(subscription_id)
+if not tenant_wide:
+    prefetch_nics(subscription_id)
+
+# Filled in after the selected view has rendered, so it never delays first paint
+inventory_caption = st.sidebar.empty()
+cache_panel = st.sidebar.expander("Cache")
+# Timings are process-wide, so they cover every session since the last reset
+diagnostics_panel = st.sidebar.expander("Diagnostics")
+if diagnostics_panel.button("Reset timings"):
+    METRICS.reset()
 
-# Tabs for features
-tab1, tab2, tab3 = st.tabs(["Used CIDRs", "Free Up Suggestions", "Suggest CIDR"])
+# Only the selected view runs, so opening the page does not load data for the others
+view = st.radio("View", ["Used CIDRs", "Address Search", "Free Up Suggestions", "Suggest CIDR", "Conflicts", "Batch Plan", "What-If"],
+                horizontal=True, label_visibility="collapsed")
 
-with tab1:
+if view == "Used CIDRs":
+    st.subheader("VNet and Subnet CIDR Usage Table")
+    # Filtering and paging run here; only the visible page is built and sent to the browser
+    filter_col, size_col, page_col = st.columns([3, 1, 1])
+    match = filter_col.text_input("Filter", placeholder="VNet, subnet or CIDR contains...")
+    page_size = size_col.selectbox("Rows per page", [50, 100, 250, 1000], index=1)
+    page = page_col.number_input("Page", min_value=1, value=1, step=1)
+    table = st.empty()
+    page_caption = st.empty()
     with st.spinner("Loading VNet and subnet data..."):
-        st.subheader("VNet and Subnet CIDR Usage Table")
-        vnet_data = fetch_vnets_and_subnets(client)
-        if vnet_data:
-            df = pd.DataFrame(vnet_data)
-            st.dataframe(df, use_container_width=True)
-            st.subheader("Subnet IP Utilization (Total IPs)")
-            chart_df = df[["VNet Name", "Subnet Name", "Total IPs"]].copy()
-            chart_df = chart_df.dropna(subset=["Total IPs"])
-            chart_df["Label"] = chart_df["VNet Name"] + "/" + chart_df["Subnet Name"]
-            st.bar_chart(chart_df.set_index("Label")["Total IPs"])
+        total, rows = fetch_subnet_page(client, None, match, page, page_size)
+    pages = max(1, math.ceil(total / page_size))
+    if page > pages:
+        page = pages
+        total, rows = fetch_subnet_page(client, None, match, page, page_size)
+    if rows:
+        # Show prefixes straight away, then fill in usage once the NICs are in
+        table.dataframe(pd.DataFrame(rows), use_container_width=True)
+        page_caption.caption(f"Page {page} of {pages} ({total:,} subnets)")
+        with st.spinner("Counting used IPs..."):
+            usage = subnet_ip_usage(get_nics(client), family=4)
+        _, rows = fetch_subnet_page(client, usage, match, page, page_size)
+        table.dataframe(pd.DataFrame(rows), use_container_width=True)
+        st.subheader(f"Most Utilized Subnets (top {UTILIZATION_CHART_SUBNETS}, % of addresses used)")
+        busiest = heapq.nlargest(UTILIZATION_CHART_SUBNETS,
+                                 (row for row in iter_subnet_rows(get_inventory(client), usage, match) if row["Utilization %"] is not None),
+                                 key=lambda row: row["Utilization %"])
+        chart_df = pd.DataFrame(busiest, columns=["VNet Name", "Subnet Name", "Utilization %"])
+        chart_df["Label"] = chart_df["VNet Name"] + "/" + chart_df["Subnet Name"]
+        st.bar_chart(chart_df.set_index("Label")["Utilization %"])
+        with st.expander("Export the full inventory"):
+            export_dataset = st.selectbox("Rows", ["subnets", "nics"], format_func=lambda d: "One per subnet" if d == "subnets" else "One per NIC IP")
+            export_format = st.selectbox("Format", EXPORT_FORMATS)
+            # Rows are encoded chunk by chunk; only the finished file is held, never a DataFrame of every row
+            if st.button("Prepare export"):
+                export_file = io.BytesIO()
+                written = write_export(export_rows(get_inventory(client), export_dataset, usage, get_nics(client)),
+                                       export_file, export_format, export_dataset)
+                st.download_button(f"Download {written:,} rows", export_file.getvalue(),
+                                   file_name=f"cidr_{export_dataset}.{export_format}", mime=MIME_TYPES[export_format])
+    elif match:
+        st.info("No subnets match the filter.")
+    else:
+        st.info("No VNets or subnets found in this subscription.")
+
+elif view == "Address Search":
+    st.subheader("Who Owns an Address")
+    query = st.text_input("IP address, CIDR or address range",
+                          placeholder="10.42.7.19, 10.40.0.0/14 or 10.40.0.0-10.40.3.255").strip()
+    search_limit = st.number_input("Rows to show", min_value=10, max_value=5000, value=200, step=50)
+    if query:
+        try:
+            with st.spinner("Searching..."):
+                enclosing, inside = search_addresses(client, query, search_limit)
+        except ValueError as error:
+            st.error(str(error))
         else:
-            st.info("No VNets or subnets found in this subscription.")
+            if "-" in query:
+                st.write(f"{len(enclosing)} VNet(s), subnet(s) and NIC IP(s) overlapping {query}:")
+                st.dataframe(pd.DataFrame(enclosing), use_container_width=True, hide_index=True)
+            elif enclosing:
+                st.write(f"Owners of {query}, most specific first:")
+                st.dataframe(pd.DataFrame(enclosing), use_container_width=True, hide_index=True)
+            else:
+                st.info(f"No VNet, subnet or NIC holds {query}.")
+            if inside:
+                st.write(f"Inside {query}, in address order:")
+                st.dataframe(pd.DataFrame(inside), use_container_width=True, hide_index=True)
 
-with tab2:
+elif view == "Free Up Suggestions":
     with st.spinner("Loading free up suggestions..."):
         st.subheader("Suggestions to Free Up CIDRs")
         unused_vnets = freeup_suggestions(client)
@@ -321,40 +622,214 @@ with tab2:
         else:
             st.success("No unused subnets found. All subnets have connected devices.")
 
-with tab3:
+    st.subheader("Fragmentation")
+    st.caption("Fragmentation is 1 - largest free block / free space: 0 when the free space is one block. "
+               "The /N columns count how many blocks of that size still fit.")
+    st.dataframe(pd.DataFrame(fetch_fragmentation(client)), hide_index=True, use_container_width=True)
+    recovery_limit = st.number_input("Recovery candidates to show", min_value=1, max_value=200, value=20)
+    with st.spinner("Ranking VNets by the block removing them would recover..."):
+        candidates = fetch_recovery_candidates(client, recovery_limit)
+    if candidates:
+        st.write("Largest contiguous blocks recovered by removing or migrating one VNet:")
+        st.dataframe(pd.DataFrame(candidates), hide_index=True, use_container_width=True)
+    else:
+        st.success("No VNet holds private space that removing it would free.")
+
+elif view == "Suggest CIDR":
     st.subheader("Suggest Optimal CIDR for New VNet or Subnets in Existing VNet")
     vnet_choices = get_vnet_choices(client)
     vnet_options = [f"{name} ({', '.join(cidrs)})" for name, _, cidrs in vnet_choices]
     vnet_options.insert(0, "[Create new VNet]")
     selected_vnet = st.selectbox("Select VNet (or create new)", vnet_options)
-    netmask = st.number_input("Subnet Netmask (e.g., 24 for /24)", min_value=8, max_value=30, value=24)
+    family = 6 if st.radio("Address family", ["IPv4", "IPv6"], horizontal=True) == "IPv6" else 4
+    if family == 6:
+        # Azure IPv6 subnets must be /64
+        netmask = st.number_input("Subnet Netmask (e.g., 64 for /64)", min_value=8, max_value=64, value=64, key="netmask_v6")
+    else:
+        netmask = st.number_input("Subnet Netmask (e.g., 24 for /24)", min_value=8, max_value=30, value=24, key="netmask_v4")
     num_subnets = st.number_input("Number of subnets needed", min_value=1, max_value=256, value=1)
+    reserve = st.checkbox("Reserve the suggestion for 30 minutes", help="Lease the block so other users, pipelines and the CLI are not offered it while you deploy.")
     if st.button("Suggest CIDR"):
         if selected_vnet == "[Create new VNet]":
-            if num_subnets == 1:
-                suggestion = suggest_cidr(client, netmask)
-                if suggestion:
-                    st.success(f"Suggested CIDR: {suggestion}")
+            try:
+                if num_subnets == 1:
+                    suggestion, lease = suggest_cidr(client, netmask, family, reserve)
                 else:
-                    st.error("No available CIDR found with the given netmask and zero IP wastage.")
+                    vnet_cidr, subnets, lease = suggest_vnet_cidr(client, netmask, num_subnets, family, reserve)
+            except ValueError as e:
+                # No pool serves the selected region and environment
+                st.error(str(e))
             else:
-                vnet_cidr, subnets = suggest_vnet_cidr(client, netmask, num_subnets)
-                if vnet_cidr:
+                if num_subnets == 1 and suggestion:
+                    st.success(f"Suggested CIDR: {suggestion}")
+                    show_lease(lease)
+                elif num_subnets == 1:
+                    st.error("No available CIDR found with the given netmask and zero IP wastage.")
+                elif vnet_cidr:
                     st.success(f"Suggested VNet CIDR: {vnet_cidr}")
                     st.write(f"Subnets of /{netmask} you can create:")
                     st.code("\n".join(subnets))
+                    show_lease(lease)
                 else:
                     st.error("No available VNet CIDR found that can fit the requested number of subnets with the given netmask and zero IP wastage.")
         else:
             idx = vnet_options.index(selected_vnet) - 1
-            vnet_name, vnet_rg, vnet_cidrs = vnet_choices[idx]
-            # For simplicity, use the first CIDR block of the VNet
-            vnet_cidr = vnet_cidrs[0]
-            subnets = list(client.subnets.list(vnet_rg, vnet_name))
-            existing_subnet_cidrs = [s.address_prefix for s in subnets]
-            suggested = suggest_subnets_in_vnet(client, vnet_cidr, existing_subnet_cidrs, netmask, num_subnets)
-            if suggested:
+            vnet_name, vnet_rg, _ = vnet_choices[idx]
+            vnet = get_inventory(client).find_vnet(vnet_name, vnet_rg)
+            family_prefixes = [p for p in vnet.prefixes if p.family == family]
+            vnet_cidr = ", ".join(str(p) for p in family_prefixes)
+            existing_subnet_cidrs = [p for s in vnet.subnets for p in s.prefixes if p.family == family]
+            suggested, lease = [], None
+            if family_prefixes:
+                suggested, lease = suggest_subnets_in_vnet(client, family_prefixes, existing_subnet_cidrs, netmask, num_subnets, reserve)
+            if not family_prefixes:
+                st.error(f"{vnet_name} has no IPv{family} address space.")
+            elif suggested:
                 st.success(f"Suggested subnets in {vnet_name} ({vnet_cidr}):")
                 st.code("\n".join(suggested))
+                show_lease(lease)
             else:
-                st.error(f"No available subnets of /{netmask} found in {vnet_name} ({vnet_cidr}) that do not overlap with existing subnets.") 
\ No newline at end of file
+                st.error(f"No available subnets of /{netmask} found in {vnet_name} ({vnet_cidr}) that do not overlap with existing subnets.") 
+    if pool_policy is not None:
+        st.markdown("**Pool headroom per region**")
+        st.dataframe(pd.DataFrame(fetch_pool_headroom(client)), use_container_width=True, hide_index=True)
+
+elif view == "Conflicts":
+    st.subheader("Overlapping VNet Address Spaces")
+    conflicts = find_vnet_conflicts(get_inventory(client))
+    if conflicts:
+        st.write(f"{len(conflicts)} pair(s) of VNets overlap and can never be peered or routed to each other:")
+        st.dataframe(pd.DataFrame(conflicts), use_container_width=True, hide_index=True)
+    else:
+        st.success("No overlapping VNet address spaces found.")
+
+elif view == "Batch Plan":
+    st.subheader("Plan Many VNets at Once")
+    st.write("Describe the VNets you need in YAML or JSON. They are placed together, largest first, "
+             "each into the smallest free block that fits.")
+    with st.form("batch_plan"):
+        requirements_text = st.text_area(
+            "Requirements",
+            value=BATCH_PLAN_EXAMPLE,
+            height=220,
+        )
+        submitted = st.form_submit_button("Plan")
+    if submitted:
+        try:
+            demands = parse_requirements(yaml.safe_load(requirements_text))
+        except (yaml.YAMLError, ValueError, KeyError, TypeError, AttributeError) as e:
+            st.error(f"Could not read requirements: {e}")
+        else:
+            try:
+                ranges, reserved = pool_space(4)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                store = existing_lease_store()
+                leased = store.active() if store else []
+                placements, unplaced, report = plan_batch(list(fetch_used_cidrs(client)) + leased + reserved, demands, ranges)
+                if placements:
+                    plan_df = pd.DataFrame(placements)
+                    plan_df["Subnets"] = plan_df["Subnets"].apply(", ".join)
+                    st.dataframe(plan_df, use_container_width=True, hide_index=True)
+                if unplaced:
+                    st.error(f"{len(unplaced)} VNet(s) could not be placed: "
+                             + ", ".join(f"{d.name} #{d.instance} (/{d.prefixlen})" for d in unplaced))
+                before, after = report["before"], report["after"]
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Free addresses", f"{after['free_addresses']:,}", f"{after['free_addresses'] - before['free_addresses']:,}")
+                col2.metric("Largest free block", after["largest_free_block"] or "none")
+                col3.metric("Fragmentation index", f"{after['fragmentation']:.3f}", f"{after['fragmentation'] - before['fragmentation']:+.3f}", delta_color="inverse")
+
+elif view == "What-If":
+    st.subheader("Simulate Planned Changes")
+    st.write("List VNets and subnets to delete or add in YAML or JSON. The changes are applied to a copy "
+             "of the inventory only; nothing is sent to Azure.")
+    with st.form("what_if"):
+        changes_text = st.text_area("Changes", value=WHAT_IF_EXAMPLE, height=260)
+        delete_unused = st.checkbox("Also delete every unused subnet", help="Subnets with no IPs in use, as listed in Free Up Suggestions.")
+        netmask = st.number_input("Suggest a block of size /", min_value=8, max_value=29, value=24)
+        submitted = st.form_submit_button("Simulate")
+    if submitted:
+        try:
+            changes = parse_changes(yaml.safe_load(changes_text) or {})
+        except (yaml.YAMLError, ValueError, KeyError, TypeError, AttributeError) as e:
+            st.error(f"Could not read changes: {e}")
+        else:
+            try:
+                with st.spinner("Simulating..."):
+                    report = simulate_changes(client, changes, delete_unused, int(netmask))
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.write(", ".join(f"{what}: {count}" for what, count in report["changes"].items()))
+                headroom, conflicts = report["headroom"], report["conflicts"]
+                before, after = report["utilization"]["before"], report["utilization"]["after"]
+                suggestion = report["suggestions"][0]
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Free addresses", f"{headroom['Free IPs After']:,}",
+                            f"{headroom['Free IPs After'] - headroom['Free IPs Before']:,}")
+                col2.metric("Fragmentation index", f"{headroom['Fragmentation After']:.3f}",
+                            f"{headroom['Fragmentation After'] - headroom['Fragmentation Before']:+.3f}", delta_color="inverse")
+                col3.metric("Overlapping VNet pairs", conflicts["after"], conflicts["after"] - conflicts["before"], delta_color="inverse")
+                if None not in (before["Utilization %"], after["Utilization %"]):
+                    col4.metric("Subnet utilization", f"{after['Utilization %']}%",
+                                f"{after['Utilization %'] - before['Utilization %']:+.1f}")
+                st.write(f"First free {suggestion['Netmask']}: {suggestion['Before'] or 'none'} before, "
+                         f"{suggestion['After'] or 'none'} after. Largest free block: "
+                         f"{headroom['Largest Free Block Before'] or 'none'} before, {headroom['Largest Free Block After'] or 'none'} after.")
+                if report["pools"]:
+                    st.markdown("**Pool headroom per region**")
+                    st.dataframe(pd.DataFrame(report["pools"]), use_container_width=True, hide_index=True)
+                if conflicts["new"]:
+                    st.error(f"{len(conflicts['new'])} new overlap(s) with existing VNets:")
+                    st.dataframe(pd.DataFrame(conflicts["new"]), use_container_width=True, hide_index=True)
+                if report["busy_deleted_subnets"]:
+                    st.warning("Azure will refuse to delete these subnets while they hold IPs: "
+                               + ", ".join(report["busy_deleted_subnets"]))
+
+inventory = get_inventory(client)
+collected = time.strftime("%Y-%m-%d %H:%M", time.localtime(inventory.collected_at))
+inventory_caption.caption(f"Inventory collected {collected} with {inventory.api_calls} Azure API call(s).")
+
+with cache_panel:
+    cache_stats = get_inventory_cache().stats()
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    hit_rate = f"{cache_stats['hits'] / lookups:.0%}" if lookups else "n/a"
+    st.write(f"Hits: {cache_stats['hits']} · Misses: {cache_stats['misses']} · Hit rate: {hit_rate} · Evictions: {cache_stats['evictions']}")
+    if cache_stats["entries"]:
+        st.dataframe(
+            pd.DataFrame(
+                [{"Subscription": key[0], "Scope": key[1], "Age (s)": int(age)} for key, age in cache_stats["entries"]]
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+METRIC_KINDS = {
+    "cidr_agent_api_page_seconds": "Azure page",
+    "cidr_agent_function_seconds": "Function",
+}
+
+with diagnostics_panel:
+    timings = METRICS.breakdown()
+    if timings:
+        st.dataframe(
+            pd.DataFrame([{
+                "Kind": METRIC_KINDS.get(row["metric"], row["metric"]),
+                "Name": row["name"],
+                "Calls": row["count"],
+                "Total (s)": round(row["total"], 3),
+                "Mean (ms)": round(row["mean"] * 1000, 1),
+                "p95 (ms)": round(row["p95"] * 1000, 1),
+                "Max (ms)": round(row["max"] * 1000, 1),
+            } for row in timings]),
+            use_container_width=True,
+            hide_index=True,
+        )
+    throttled = METRICS.counter("cidr_agent_http_responses_total", status="429")
+    st.write(f"Azure pages: {METRICS.counter('cidr_agent_api_pages_total')} · "
+             f"Resources: {METRICS.counter('cidr_agent_api_items_total')} · "
+             f"Received: {METRICS.counter('cidr_agent_response_bytes_total') / 1024 / 1024:.1f} MiB · "
+             f"429 responses: {throttled} · Page retries: {METRICS.counter('cidr_agent_throttled_retries_total')}")
+    st.download_button("Download metrics", METRICS.render(), file_name="cidr_agent_metrics.prom", mime="text/plain")
@@ -0,0 +1,280 @@
+import bisect
+
+from cidr_prefix import MAX_PREFIXLEN, format_prefix, parse_prefix, parse_prefixes
+
+# Azure private address space, searched in this order
+PRIVATE_RANGES = ['10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16']
+# Unique local IPv6 space (RFC 4193), the IPv6 counterpart of the private ranges
+ULA_RANGES = ['fd00::/8']
+
+
+# Helper to turn a CIDR string (or Prefix) into a half-open [start, end) integer interval
+def cidr_to_interval(cidr):
+    prefix = parse_prefix(cidr)
+    if prefix is None:
+        raise ValueError(f"{cidr!r} is not an IPv4 or IPv6 prefix")
+    return prefix.start, prefix.end
+
+
+def merge_intervals(intervals):
+    """Sort and merge overlapping or adjacent [start, end) intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def subtract_intervals(intervals, holes):
+    """Parts of sorted, merged [start, end) intervals that sorted, merged holes do not cover."""
+    remaining = []
+    j = 0
+    for start, end in intervals:
+        while j < len(holes) and holes[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(holes) and holes[k][0] < end:
+            if holes[k][0] > start:
+                remaining.append((start, holes[k][0]))
+            start = max(start, holes[k][1])
+            k += 1
+        if start < end:
+            remaining.append((start, end))
+    return remaining
+
+
+# Split [start, end) into the fewest aligned CIDR blocks, as (start, prefixlen)
+def aligned_blocks(start, end, max_prefixlen=32):
+    while start < end:
+        size = start & -start if start else 1 << max_prefixlen
+        while size > end - start:
+            size >>= 1
+        yield start, max_prefixlen + 1 - size.bit_length()
+        start += size
+
+
+class _PatchedList:
+    """A list read through from another list, with slice assignments kept as patches.
+
+    Reads go to pieces of the shared lists, so the source is never copied; it must
+    not change while this list is in use.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, _PatchedList):
+            # Share the source's pieces, so patches of patches still read plain lists
+            self._pieces = list(source._pieces)
+            self._offsets = list(source._offsets)
+            self._len = source._len
+        else:
+            self._pieces = [(source, 0, len(source))] if source else []
+            self._offsets = [0] if source else []
+            self._len = len(source)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("list index out of range")
+        k = bisect.bisect_right(self._offsets, i) - 1
+        items, start, _ = self._pieces[k]
+        return items[start + i - self._offsets[k]]
+
+    def __iter__(self):
+        for items, start, end in self._pieces:
+            yield from items[start:end]
+
+    # Cut the piece holding index i so that a piece starts at i; returns that piece's position
+    def _split(self, i):
+        if i == self._len:
+            return len(self._pieces)
+        k = bisect.bisect_right(self._offsets, i) - 1
+        if self._offsets[k] == i:
+            return k
+        items, start, end = self._pieces[k]
+        cut = start + i - self._offsets[k]
+        self._pieces[k:k + 1] = [(items, start, cut), (items, cut, end)]
+        self._offsets.insert(k + 1, i)
+        return k + 1
+
+    def __setitem__(self, index, values):
+        lo, hi, _ = index.indices(self._len)
+        values = list(values)
+        k = self._split(lo)
+        m = self._split(max(lo, hi))
+        self._pieces[k:m] = [(values, 0, len(values))] if values else []
+        self._offsets = []
+        offset = 0
+        for items, start, end in self._pieces:
+            self._offsets.append(offset)
+            offset += end - start
+        self._len = offset
+
+
+class FreeSpaceAllocator:
+    """Used space of one address family as merged, sorted intervals with first-fit block search.
+
+    The family is the one of the ranges; used prefixes (CIDR strings or Prefix
+    objects) of the other family are ignored.
+    """
+
+    def __init__(self, used_cidrs=(), ranges=PRIVATE_RANGES):
+        self.ranges = parse_prefixes(ranges)
+        families = {r.family for r in self.ranges}
+        if len(families) > 1:
+            raise ValueError("ranges mix IPv4 and IPv6 prefixes")
+        self.family = families.pop() if families else 4
+        self.max_prefixlen = MAX_PREFIXLEN[self.family]
+        intervals = []
+        for cidr in used_cidrs:
+            prefix = parse_prefix(cidr) if cidr else None
+            if prefix is not None and prefix.family == self.family:
+                intervals.append((prefix.start, prefix.end))
+        self._set_intervals(intervals)
+
+    @classmethod
+    def from_intervals(cls, intervals, ranges=PRIVATE_RANGES):
+        """Build from pre-computed [start, end) integer intervals, skipping CIDR parsing."""
+        allocator = cls((), ranges)
+        allocator._set_intervals(intervals)
+        return allocator
+
+    def with_used(self, used_cidrs):
+        """A new allocator over the same ranges with used_cidrs marked used as well, merged in one pass."""
+        intervals = self.used_intervals()
+        for cidr in used_cidrs:
+            prefix = parse_prefix(cidr) if cidr else None
+            if prefix is not None and prefix.family == self.family:
+                intervals.append((prefix.start, prefix.end))
+        return FreeSpaceAllocator.from_intervals(intervals, [str(r) for r in self.ranges])
+
+    def within(self, ranges):
+        """A new allocator with the same used space that searches only ranges (of the same family)."""
+        allocator = FreeSpaceAllocator((), ranges)
+        if allocator.family != self.family:
+            raise ValueError(f"ranges are not IPv{self.family}")
+        allocator._starts = list(self._starts)
+        allocator._ends = list(self._ends)
+        return allocator
+
+    def overlay(self, ranges=None):
+        """Like within (default: the same ranges), but reading this allocator's used space instead of copying it.
+
+        Space the new allocator marks used or free is kept as patches on top, so it
+        costs time in proportion to those changes. This allocator must not change
+        while the overlay is in use.
+        """
+        allocator = FreeSpaceAllocator((), [str(r) for r in self.ranges] if ranges is None else ranges)
+        if allocator.family != self.family:
+            raise ValueError(f"ranges are not IPv{self.family}")
+        allocator._starts = _PatchedList(self._starts)
+        allocator._ends = _PatchedList(self._ends)
+        return allocator
+
+    def _set_intervals(self, intervals):
+        merged = merge_intervals(intervals)
+        self._starts = [s for s, _ in merged]
+        self._ends = [e for _, e in merged]
+
+    def __len__(self):
+        return len(self._starts)
+
+    def used_intervals(self):
+        """The merged used space as sorted [start, end) integer intervals."""
+        return list(zip(self._starts, self._ends))
+
+    def is_free(self, cidr):
+        start, end = cidr_to_interval(cidr)
+        # First used interval ending after our start is the only one that can overlap
+        i = bisect.bisect_right(self._ends, start)
+        return i == len(self._starts) or self._starts[i] >= end
+
+    def add(self, cidr):
+        """Mark a CIDR as used, merging it into the neighbouring intervals."""
+        self.add_interval(*cidr_to_interval(cidr))
+
+    def add_interval(self, start, end):
+        """Mark [start, end) as used; only the intervals it touches are rewritten."""
+        lo = bisect.bisect_left(self._ends, start)
+        hi = bisect.bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def remove_interval(self, start, end):
+        """Mark [start, end) as free again, trimming or splitting the intervals it overlaps."""
+        lo = bisect.bisect_right(self._ends, start)
+        hi = bisect.bisect_left(self._starts, end)
+        if lo >= hi:
+            return
+        starts, ends = [], []
+        if self._starts[lo] < start:
+            starts.append(self._starts[lo])
+            ends.append(start)
+        if self._ends[hi - 1] > end:
+            starts.append(end)
+            ends.append(self._ends[hi - 1])
+        self._starts[lo:hi] = starts
+        self._ends[lo:hi] = ends
+
+    def first_free(self, prefixlen):
+        """Return the first free, aligned /prefixlen block in the ranges, or None."""
+        if not 0 <= prefixlen <= self.max_prefixlen:
+            return None
+        size = 1 << (self.max_prefixlen - prefixlen)
+        for parent in self.ranges:
+            if prefixlen < parent.prefixlen:
+                continue
+            range_start = parent.start
+            range_end = parent.end
+            i = bisect.bisect_right(self._ends, range_start)
+            cursor = range_start
+            # Walk the gaps between used intervals inside this range
+            while cursor < range_end:
+                gap_end = range_end
+                if i < len(self._starts) and self._starts[i] < range_end:
+                    gap_end = self._starts[i]
+                candidate = -(-cursor // size) * size
+                if candidate + size <= gap_end:
+                    return format_prefix(candidate, prefixlen, self.family)
+                if gap_end == range_end:
+                    break
+                cursor = max(cursor, self._ends[i])
+                i += 1
+        return None
+
+    def free_blocks(self, start=None, end=None):
+        """Yield (start, prefixlen) for the maximal aligned free blocks in the ranges, in address order.
+
+        With start and end, only the part of the ranges inside [start, end) is walked.
+        """
+        for parent in self.ranges:
+            range_start = parent.start if start is None else max(parent.start, start)
+            range_end = parent.end if end is None else min(parent.end, end)
+            i = bisect.bisect_right(self._ends, range_start)
+            cursor = range_start
+            while cursor < range_end:
+                gap_end = range_end
+                if i < len(self._starts) and self._starts[i] < range_end:
+                    gap_end = self._starts[i]
+                if gap_end > cursor:
+                    yield from aligned_blocks(cursor, gap_end, self.max_prefixlen)
+                if gap_end == range_end:
+                    break
+                cursor = max(cursor, self._ends[i])
+                i += 1
+
+    def allocate(self, prefixlen):
+        """Find the first free /prefixlen block and mark it as used."""
+        cidr = self.first_free(prefixlen)
+        if cidr:
+            self.add(cidr)
+        return cidr
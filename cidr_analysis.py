@@ -0,0 +1,145 @@
+from cidr_allocator import PRIVATE_RANGES, ULA_RANGES, FreeSpaceAllocator
+from cidr_inventory import AZURE_RESERVED_IPS, extract_resource_group_from_id
+from cidr_metrics import timed
+from cidr_planner import VNetDemand, plan_batch
+
+# Inventory analyses behind the web UI's views, kept free of Streamlit and Azure
+# clients so they can be benchmarked and reused on any Inventory.
+
+
+# New VNets come from the private IPv4 ranges or the IPv6 unique local range
+def family_ranges(family):
+    return ULA_RANGES if family == 6 else PRIVATE_RANGES
+
+
+# Helper to walk (vnet, vnet CIDRs, subnet, subnet CIDRs), keeping those whose VNet or
+# subnet name or CIDRs contain match (case-insensitive)
+def _matching_subnets(inventory, match=None):
+    match = match.lower() if match else None
+    for vnet in inventory.vnets:
+        vnet_cidrs = ", ".join(vnet.address_prefixes)
+        vnet_matches = match is None or match in vnet.name.lower() or match in vnet_cidrs
+        for subnet in vnet.subnets:
+            subnet_cidrs = ", ".join(subnet.address_prefixes)
+            if vnet_matches or match in subnet.name.lower() or match in subnet_cidrs:
+                yield vnet, vnet_cidrs, subnet, subnet_cidrs
+
+
+def _subnet_row(vnet, vnet_cidrs, subnet, subnet_cidrs, usage):
+    # Utilization is measured on the subnet's IPv4 space; IPv6 /64s are never short of addresses
+    total_ips = sum(p.num_addresses for p in subnet.prefixes if p.family == 4) or None
+    # Used IPs include the addresses Azure reserves in every subnet
+    used_ips = None
+    utilization = None
+    if usage is not None and total_ips:
+        used_ips = AZURE_RESERVED_IPS + usage.get(subnet.id.lower(), 0)
+        utilization = round(100 * used_ips / total_ips, 1)
+    return {
+        "VNet Name": vnet.name,
+        "VNet CIDR": vnet_cidrs,
+        "Subnet Name": subnet.name,
+        "Subnet CIDR": subnet_cidrs,
+        "Total IPs": total_ips,
+        "Used IPs": used_ips,
+        "Utilization %": utilization
+    }
+
+
+def iter_subnet_rows(inventory, usage=None, match=None):
+    """Table rows, one per subnet, generated as they are consumed.
+
+    Without usage (from subnet_ip_usage) the used-IP columns are left empty; with
+    match only subnets whose VNet or subnet name or CIDRs contain it are kept.
+    """
+    for entry in _matching_subnets(inventory, match):
+        yield _subnet_row(*entry, usage)
+
+
+@timed()
+def subnet_rows(inventory, usage=None):
+    """Every iter_subnet_rows row, as a list."""
+    return list(iter_subnet_rows(inventory, usage))
+
+
+@timed()
+def subnet_page(inventory, usage=None, match=None, page=1, page_size=100):
+    """(number of matching subnets, rows of the 1-based page); rows of other pages are never built."""
+    first = (page - 1) * page_size
+    rows = []
+    total = 0
+    for entry in _matching_subnets(inventory, match):
+        if first <= total < first + page_size:
+            rows.append(_subnet_row(*entry, usage))
+        total += 1
+    return total, rows
+
+
+def iter_nic_rows(inventory, nics=None):
+    """One row per NIC (or load balancer frontend) IP configuration, with the VNet and subnet it sits in.
+
+    nics defaults to the inventory's own NICs.
+    """
+    subnets = {subnet.id.lower(): (vnet, subnet) for vnet, subnet in inventory.iter_subnets()}
+    for nic in inventory.nics if nics is None else nics:
+        for subnet_id, ip in nic.ip_configurations:
+            vnet, subnet = subnets.get(subnet_id.lower(), (None, None)) if subnet_id else (None, None)
+            yield {
+                "NIC Name": nic.name,
+                "Private IP": ip,
+                "VNet Name": vnet.name if vnet else None,
+                "Subnet Name": subnet.name if subnet else None,
+                "Resource Group": extract_resource_group_from_id(nic.id),
+            }
+
+
+@timed()
+def vnets_without_subnets(inventory):
+    """(name, address prefixes, resource group) of every VNet without subnets."""
+    return [(vnet.name, vnet.address_prefixes, vnet.resource_group) for vnet in inventory.vnets if not vnet.subnets]
+
+
+@timed()
+def idle_subnets(inventory, usage):
+    """Subnets with no private IPs in use, given usage from subnet_ip_usage."""
+    unused = []
+    for vnet, subnet in inventory.iter_subnets():
+        if not usage.get(subnet.id.lower()):
+            unused.append({
+                "VNet Name": vnet.name,
+                "Subnet Name": subnet.name,
+                "Subnet CIDR": ", ".join(subnet.address_prefixes),
+                "Resource Group": vnet.resource_group
+            })
+    return unused
+
+
+@timed()
+def first_free_cidr(used, netmask, family=4, ranges=None):
+    """First free /netmask in ranges (default: the family's private ranges), or None."""
+    return FreeSpaceAllocator(used, ranges or family_ranges(family)).first_free(netmask)
+
+
+@timed()
+def place_vnet(used, subnet_netmask, num_subnets, family=4, ranges=None):
+    """Smallest VNet that holds num_subnets of /subnet_netmask, placed best-fit in the free space of ranges.
+
+    Returns (vnet_cidr, subnet_cidrs), or (None, []) if it does not fit.
+    """
+    demand = VNetDemand("new-vnet", 1, [subnet_netmask] * num_subnets, family)
+    placements, _, _ = plan_batch(used, [demand], ranges or family_ranges(family))
+    if not placements:
+        return None, []
+    return placements[0]["VNet CIDR"], placements[0]["Subnets"]
+
+
+@timed()
+def place_subnets(vnet_cidrs, existing_subnet_cidrs, subnet_netmask, num_subnets):
+    """First-fit num_subnets of /subnet_netmask across the VNet's prefixes of one family, or None if they do not fit."""
+    allocator = FreeSpaceAllocator(existing_subnet_cidrs, ranges=vnet_cidrs)
+    suggested = []
+    for _ in range(num_subnets):
+        subnet = allocator.allocate(subnet_netmask)
+        if subnet is None:
+            return None
+        suggested.append(subnet)
+    return suggested
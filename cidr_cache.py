@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from cidr_metrics import METRICS
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 32
+
+
+class InventoryCache:
+    """Thread-safe TTL cache with LRU eviction, keyed by (subscription_id, scope) tuples.
+
+    scope names the resource set, e.g. "inventory" or "nics". Concurrent loads of
+    the same key wait for one loader instead of all hitting Azure.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (loaded_at, value)
+        self._lock = threading.Lock()
+        self._key_locks = {}  # key -> [lock, callers holding or waiting for it], while a load is under way
+
+    def _fresh_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            self._entries.move_to_end(key)
+            return entry
+        return None
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() to fill it on a miss."""
+        with self._lock:
+            entry = self._fresh_entry(key)
+            if entry is not None:
+                self.hits += 1
+                METRICS.inc("cidr_agent_cache_lookups_total", scope=key[1], result="hit")
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                with self._lock:
+                    # Another caller may have loaded it while we waited
+                    entry = self._fresh_entry(key)
+                    if entry is not None:
+                        self.hits += 1
+                        METRICS.inc("cidr_agent_cache_lookups_total", scope=key[1], result="hit")
+                        return entry[1]
+                    self.misses += 1
+                    METRICS.inc("cidr_agent_cache_lookups_total", scope=key[1], result="miss")
+                value = loader()
+                with self._lock:
+                    self._entries[key] = (time.time(), value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+                return value
+        finally:
+            # The last caller through drops the lock, so keys that miss or expire leave nothing behind
+            with self._lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    del self._key_locks[key]
+
+    def invalidate(self, subscription_id=None, scope=None):
+        """Drop entries matching subscription_id and/or scope; no arguments clears everything."""
+        with self._lock:
+            for key in list(self._entries):
+                if subscription_id is not None and key[0] != subscription_id:
+                    continue
+                if scope is not None and key[1] != scope:
+                    continue
+                del self._entries[key]
+
+    def is_fresh(self, key):
+        """Whether key holds an unexpired value; does not count as a hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.time() - entry[0] < self.ttl
+
+    def age(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return time.time() - entry[0] if entry is not None else None
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": [(key, now - loaded_at) for key, (loaded_at, _) in self._entries.items()],
+            }
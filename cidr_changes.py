@@ -0,0 +1,156 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from cidr_inventory import extract_resource_group_from_id, load_inventory, load_nics, nic_record, vnet_record
+from cidr_metrics import METRICS, response_hook, timed
+
+VNET_TYPE = "microsoft.network/virtualnetworks"
+SUBNET_TYPE = "microsoft.network/virtualnetworks/subnets"
+NIC_TYPE = "microsoft.network/networkinterfaces"
+
+# Full re-crawl at least this often, so anything the change feed missed is corrected
+RECONCILE_INTERVAL = 6 * 60 * 60
+# Changes show up in Resource Graph with some delay; overlap each query window
+# by this much. Re-applying a change is harmless since the current state is re-read.
+CHANGE_LOOKBACK = 10 * 60
+
+CHANGE_QUERY = """resourcechanges
+| extend changeTime = todatetime(properties.changeAttributes.timestamp),
+         targetResourceId = tostring(properties.targetResourceId),
+         targetResourceType = tolower(tostring(properties.targetResourceType)),
+         changeType = tostring(properties.changeType)
+| where changeTime > datetime({since})
+| where targetResourceType in ('{vnet}', '{subnet}', '{nic}')
+| project targetResourceId, targetResourceType, changeType, changeTime
+| order by changeTime asc"""
+
+
+def fetch_changes(query_client, subscription_ids, since):
+    """Return VNet, subnet and NIC change records newer than the since timestamp.
+
+    query_client is an azure.mgmt.resourcegraph ResourceGraphClient, or anything
+    with the same resources(request) method.
+    """
+    from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+    since_text = datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    query = CHANGE_QUERY.format(since=since_text, vnet=VNET_TYPE, subnet=SUBNET_TYPE, nic=NIC_TYPE)
+    changes = []
+    skip_token = None
+    while True:
+        request = QueryRequest(
+            subscriptions=list(subscription_ids),
+            query=query,
+            options=QueryRequestOptions(skip_token=skip_token, result_format="objectArray"),
+        )
+        with METRICS.time("cidr_agent_api_page_seconds", operation="resource_graph.resources"):
+            response = query_client.resources(request, raw_response_hook=response_hook("resource_graph.resources"))
+        METRICS.inc("cidr_agent_api_pages_total", operation="resource_graph.resources")
+        changes.extend(response.data)
+        skip_token = response.skip_token
+        if not skip_token:
+            return changes
+
+
+def _subscription_from_id(resource_id):
+    parts = resource_id.split("/")
+    try:
+        return parts[[p.lower() for p in parts].index("subscriptions") + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+# Read the current state of a changed VNet or NIC; None if it no longer exists
+def _get_record(client_factory, resource_id, resource_type, inventory):
+    client = client_factory(_subscription_from_id(resource_id))
+    rg_name = extract_resource_group_from_id(resource_id)
+    name = resource_id.rstrip("/").split("/")[-1]
+    operation = "virtual_networks.get" if resource_type == VNET_TYPE else "network_interfaces.get"
+    inventory.api_calls += 1
+    try:
+        with METRICS.time("cidr_agent_api_page_seconds", operation=operation):
+            if resource_type == VNET_TYPE:
+                resource = client.virtual_networks.get(rg_name, name, raw_response_hook=response_hook(operation))
+            else:
+                resource = client.network_interfaces.get(rg_name, name, raw_response_hook=response_hook(operation))
+    except ResourceNotFoundError:
+        return None
+    if resource_type == VNET_TYPE:
+        return vnet_record(client, resource, inventory)
+    return nic_record(resource)
+
+
+def apply_changes(inventory, changes, client_factory, track_nics=True):
+    """Patch the inventory in place from change records; returns the number of resources patched."""
+    # Only the latest change per resource matters. Subnet changes re-read the
+    # parent VNet, which carries every subnet.
+    latest = {}
+    for change in changes:
+        resource_id = change["targetResourceId"]
+        resource_type = change["targetResourceType"].lower()
+        change_type = change["changeType"]
+        if resource_type == SUBNET_TYPE:
+            resource_id = resource_id[:resource_id.lower().rindex("/subnets/")]
+            resource_type = VNET_TYPE
+            change_type = "Update"
+        elif resource_type == NIC_TYPE and not track_nics:
+            continue
+        latest[resource_id.lower()] = (resource_id, resource_type, change_type)
+    for resource_id, resource_type, change_type in latest.values():
+        record = None
+        if change_type != "Delete":
+            record = _get_record(client_factory, resource_id, resource_type, inventory)
+        if resource_type == VNET_TYPE:
+            inventory.replace_vnet(resource_id, record)
+        else:
+            inventory.replace_nic(resource_id, record)
+    return len(latest)
+
+
+class InventoryRefresher:
+    """Keeps an inventory current by patching it from the Resource Graph change feed.
+
+    A full crawl runs on the first refresh and then every reconcile_interval
+    seconds; every other refresh only re-reads resources that changed.
+    """
+
+    def __init__(self, client_factory, query_client, subscription_ids, inventory=None, full_crawl=None,
+                 reconcile_interval=RECONCILE_INTERVAL, track_nics=True):
+        self.client_factory = client_factory
+        self.query_client = query_client
+        self.subscription_ids = list(subscription_ids)
+        self.inventory = inventory
+        self.full_crawl = full_crawl or self._crawl
+        self.reconcile_interval = reconcile_interval
+        self.track_nics = track_nics
+        self.last_refresh_mode = None
+        self.last_changes = 0
+        self._lock = threading.Lock()
+
+    def _crawl(self):
+        inventory = None
+        for subscription_id in self.subscription_ids:
+            client = self.client_factory(subscription_id)
+            sub_inventory = load_inventory(client, subscription_id)
+            if self.track_nics:
+                load_nics(client, sub_inventory)
+            inventory = sub_inventory if inventory is None else inventory.merge(sub_inventory)
+        return inventory
+
+    @timed("inventory_refresh")
+    def refresh(self):
+        with self._lock:
+            now = time.time()
+            if self.inventory is None or now - self.inventory.reconciled_at >= self.reconcile_interval:
+                self.inventory = self.full_crawl()
+                self.last_refresh_mode = "full"
+                self.last_changes = 0
+                return self.inventory
+            since = self.inventory.collected_at - CHANGE_LOOKBACK
+            changes = fetch_changes(self.query_client, self.subscription_ids, since)
+            self.last_changes = apply_changes(self.inventory, changes, self.client_factory, self.track_nics)
+            self.inventory.collected_at = now
+            self.last_refresh_mode = "incremental"
+            return self.inventory
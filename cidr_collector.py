@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.identity import DefaultAzureCredential
+from azure.mgmt.network import NetworkManagementClient
+
+from cidr_inventory import Inventory, load_inventory, load_nics
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def fetch_subscription_ids(credential):
+    from azure.mgmt.resource import SubscriptionClient
+    sub_client = SubscriptionClient(credential)
+    return [sub.subscription_id for sub in sub_client.subscriptions.list()]
+
+
+# One requests session sized to the pool, shared by every subscription's client
+def _shared_transport(max_workers):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
+def _collect_subscription(credential, subscription_id, transport, base_url, include_nics):
+    kwargs = {"transport": transport, "retry_status": 0}
+    if base_url:
+        kwargs["base_url"] = base_url
+    # Status retries are off in the SDK: throttling is retried page by page in
+    # cidr_inventory so it can honor Retry-After and count the retries
+    client = NetworkManagementClient(credential, subscription_id, **kwargs)
+    inventory = load_inventory(client, subscription_id)
+    if include_nics:
+        load_nics(client, inventory)
+    return inventory
+
+
+def iter_subscription_inventories(subscription_ids, credential=None, max_workers=DEFAULT_MAX_WORKERS,
+                                  base_url=None, include_nics=True):
+    """Crawl VNets and NICs for many subscriptions on a bounded thread pool.
+
+    Yields (subscription_id, inventory, error) as each subscription finishes;
+    exactly one of inventory and error is None.
+    """
+    credential = credential or DefaultAzureCredential()
+    transport = _shared_transport(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cidr-collector") as pool:
+        futures = {
+            pool.submit(_collect_subscription, credential, sid, transport, base_url, include_nics): sid
+            for sid in subscription_ids
+        }
+        for future in as_completed(futures):
+            subscription_id = futures[future]
+            try:
+                yield subscription_id, future.result(), None
+            except Exception as error:
+                yield subscription_id, None, error
+
+
+def collect_tenant_inventory(subscription_ids, credential=None, max_workers=DEFAULT_MAX_WORKERS,
+                             base_url=None, include_nics=True, on_result=None):
+    """Merge every subscription's inventory into one tenant-wide model.
+
+    on_result(subscription_id, inventory, error) is called as each subscription
+    finishes. Returns (inventory, {subscription_id: error}) for failed subscriptions.
+    """
+    tenant = Inventory()
+    errors = {}
+    results = iter_subscription_inventories(subscription_ids, credential, max_workers, base_url, include_nics)
+    for subscription_id, inventory, error in results:
+        if error is not None:
+            errors[subscription_id] = error
+        else:
+            tenant.merge(inventory)
+        if on_result:
+            on_result(subscription_id, inventory, error)
+    return tenant, errors
@@ -0,0 +1,105 @@
+import numpy as np
+
+from cidr_metrics import timed
+
+UINT64_MASK = (1 << 64) - 1
+
+
+# Dense int64 ranks of 128-bit values given as (hi, lo) uint64 halves; equal values share a rank
+def _ranks_128(hi, lo):
+    order = np.lexsort((lo, hi))
+    sorted_hi = hi[order]
+    sorted_lo = lo[order]
+    distinct = np.ones(len(order), dtype=bool)
+    distinct[1:] = (sorted_hi[1:] != sorted_hi[:-1]) | (sorted_lo[1:] != sorted_lo[:-1])
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.cumsum(distinct) - 1
+    return ranks
+
+
+def prefix_arrays(prefixes):
+    """First/last address arrays for Prefix objects of one family, for overlapping_pairs.
+
+    IPv4 addresses fit uint32. IPv6 addresses are split into two uint64 halves
+    and replaced by their rank among all first and last addresses, which keeps
+    their order, and so every overlap, in an int64.
+    """
+    if not prefixes:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    if prefixes[0].family == 4:
+        firsts = np.fromiter((p.start for p in prefixes), dtype=np.uint32, count=len(prefixes))
+        lasts = np.fromiter((p.end - 1 for p in prefixes), dtype=np.uint32, count=len(prefixes))
+        return firsts, lasts
+    bounds = [p.start for p in prefixes] + [p.end - 1 for p in prefixes]
+    hi = np.fromiter((b >> 64 for b in bounds), dtype=np.uint64, count=len(bounds))
+    lo = np.fromiter((b & UINT64_MASK for b in bounds), dtype=np.uint64, count=len(bounds))
+    ranks = _ranks_128(hi, lo)
+    return ranks[:len(prefixes)], ranks[len(prefixes):]
+
+
+def overlapping_pairs(firsts, lasts):
+    """Every (i, j), i < j in input order, whose [first, last] ranges overlap.
+
+    Sort by first address, then for each range binary-search how many later
+    ranges start at or before its last address. O(N log N + pairs found).
+    """
+    n = len(firsts)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    order = np.argsort(firsts, kind="stable")
+    sorted_firsts = firsts[order]
+    sorted_lasts = lasts[order]
+    stop = np.searchsorted(sorted_firsts, sorted_lasts, side="right")
+    counts = np.maximum(stop - np.arange(n) - 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    left = np.repeat(np.arange(n), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = left + 1 + offsets
+    pairs = np.stack([order[left], order[right]], axis=1)
+    pairs.sort(axis=1)
+    return pairs
+
+
+@timed()
+def find_vnet_conflicts(inventory):
+    """VNet address prefixes that overlap a prefix of a different VNet.
+
+    Overlapping VNets can never be peered or routed to each other.
+    """
+    return [row for _, _, row in iter_vnet_conflicts(inventory)]
+
+
+def iter_vnet_conflicts(inventory):
+    """Yield (VNet A, VNet B, row) for each find_vnet_conflicts row, with the VNet records it names."""
+    # Prefixes of different families never overlap, so each family is swept on its own
+    for family in (4, 6):
+        owners = []
+        prefixes = []
+        for vnet in inventory.vnets:
+            for prefix in vnet.prefixes:
+                if prefix.family == family:
+                    owners.append(vnet)
+                    prefixes.append(prefix)
+        firsts, lasts = prefix_arrays(prefixes)
+        for i, j in overlapping_pairs(firsts, lasts).tolist():
+            a = owners[i]
+            b = owners[j]
+            if a.id.lower() == b.id.lower():
+                continue
+            if firsts[i] == firsts[j] and lasts[i] == lasts[j]:
+                relation = "identical"
+            elif firsts[i] <= firsts[j] and lasts[j] <= lasts[i]:
+                relation = "contains"
+            else:
+                relation = "inside"
+            yield a, b, {
+                "VNet A": a.name,
+                "CIDR A": str(prefixes[i]),
+                "Resource Group A": a.resource_group,
+                "Relation": relation,
+                "VNet B": b.name,
+                "CIDR B": str(prefixes[j]),
+                "Resource Group B": b.resource_group,
+            }
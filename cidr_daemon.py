@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from cidr_allocator import PRIVATE_RANGES, ULA_RANGES, FreeSpaceAllocator
+from cidr_leases import lease_first_free
+from cidr_metrics import METRICS, timed
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Where CLI commands look for a running daemon
+DAEMON_URL = os.environ.get("CIDR_AGENT_URL", f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+REFRESH_INTERVAL = 300
+CLIENT_TIMEOUT = 2.0
+
+logger = logging.getLogger("cidr_agent.daemon")
+
+
+class InventoryView:
+    """Query answers precomputed from one inventory; swapped wholesale after each refresh.
+
+    Requests only read a view, so they never wait on a refresh in progress. With a
+    PoolPolicy the allocators search the policy's pools and hold its reserved
+    ranges as used space.
+    """
+
+    @timed("build_inventory_view")
+    def __init__(self, inventory, policy=None):
+        self.collected_at = inventory.collected_at
+        self.vnet_count = len(inventory.vnets)
+        prefixes = inventory.used_prefixes()
+        self.used_cidrs = [str(p) for p in sorted(prefixes)]
+        self.unused_vnets = [
+            {"name": vnet.name, "address_prefixes": vnet.address_prefixes, "resource_group": vnet.resource_group}
+            for vnet in inventory.vnets if not vnet.subnets
+        ]
+        self.policy = policy
+        if policy is None:
+            self.allocators = {
+                4: FreeSpaceAllocator(prefixes, PRIVATE_RANGES),
+                6: FreeSpaceAllocator(prefixes, ULA_RANGES),
+            }
+        else:
+            self.allocators = {
+                family: policy.allocator([(p.start, p.end) for p in prefixes if p.family == family], family)
+                for family in (4, 6)
+            }
+        # (family, region, environment) -> allocator over just those pools, built on first use
+        self._pool_allocators = {}
+
+    def allocator(self, family=4, region=None, environment=None):
+        if self.policy is None or (region is None and environment is None):
+            return self.allocators[family]
+        key = (family, region, environment)
+        allocator = self._pool_allocators.get(key)
+        if allocator is None:
+            allocator = self.allocators[family].within(self.policy.ranges(family, region, environment))
+            self._pool_allocators[key] = allocator
+        return allocator
+
+    def suggest(self, netmask, family=4, leased=(), region=None, environment=None):
+        allocator = self.allocator(family, region, environment)
+        return (allocator.with_used(leased) if leased else allocator).first_free(netmask)
+
+
+class InventoryService:
+    """Keeps an inventory hot by calling refresher.refresh() every interval seconds on a background thread.
+
+    on_refresh(inventory), if given, runs after each successful refresh (e.g. to
+    save a snapshot). A failed refresh keeps serving the last good inventory.
+    With a LeaseStore, suggestions skip leased blocks and can lease their answer,
+    and leases are confirmed as their prefixes show up in the inventory. With a
+    PoolPolicy, suggestions come from its pools only.
+    """
+
+    def __init__(self, refresher, scope, interval=REFRESH_INTERVAL, on_refresh=None, leases=None, policy=None):
+        self.refresher = refresher
+        self.scope = scope
+        self.interval = interval
+        self.on_refresh = on_refresh
+        self.leases = leases
+        self.policy = policy
+        self.view = InventoryView(refresher.inventory, policy) if refresher.inventory is not None else None
+        self.started_at = time.time()
+        self.last_refresh = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        inventory = self.refresher.refresh()
+        self.view = InventoryView(inventory, self.policy)
+        self.last_refresh = time.time()
+        self.last_error = None
+        if self.leases is not None:
+            self.leases.confirm(inventory)
+        if self.on_refresh is not None:
+            self.on_refresh(inventory)
+        return self.view
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                logger.info("Inventory refreshed (%s, %d changed resource(s), %d VNets)",
+                            self.refresher.last_refresh_mode, self.refresher.last_changes, self.view.vnet_count)
+            except Exception as error:
+                self.last_error = str(error)
+                logger.warning("Inventory refresh failed, serving the previous one: %s", error)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cidr-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        view = self.view
+        return {
+            "status": "ok" if view is not None else "loading",
+            "scope": self.scope,
+            "policy": self.policy.digest if self.policy is not None else None,
+            "collected_at": view.collected_at if view is not None else None,
+            "last_refresh": self.last_refresh,
+            "last_error": self.last_error,
+            "refresh_interval": self.interval,
+            "uptime": time.time() - self.started_at,
+        }
+
+
+def _health(service, view, params):
+    return service.status()
+
+
+def _used_cidrs(service, view, params):
+    return {"used_cidrs": view.used_cidrs, "collected_at": view.collected_at}
+
+
+def _freeup(service, view, params):
+    return {"unused_vnets": view.unused_vnets, "collected_at": view.collected_at}
+
+
+def _suggest(service, view, params):
+    if "netmask" not in params:
+        raise ValueError("netmask is required")
+    netmask = int(params["netmask"])
+    family = int(params.get("family", 4))
+    if family not in (4, 6):
+        raise ValueError("family must be 4 or 6")
+    # A client with another pool policy (or none) would be offered blocks its own policy forbids
+    policy = view.policy.digest if view.policy is not None else None
+    if params.get("policy") != policy:
+        raise ValueError(f"daemon runs pool policy {policy}")
+    region, environment = params.get("region"), params.get("environment")
+    leases = service.leases
+    if leases is None:
+        return {"cidr": view.suggest(netmask, family, region=region, environment=environment),
+                "collected_at": view.collected_at}
+    allocator = view.allocator(family, region, environment)
+    if params.get("reserve") in ("1", "true"):
+        ttl = float(params["ttl"]) if "ttl" in params else None
+        lease = lease_first_free(leases, allocator, netmask, params.get("owner"), ttl)
+        if lease is None:
+            return {"cidr": None, "collected_at": view.collected_at}
+        return {"cidr": lease.prefixes[0], "lease": lease.token, "expires_at": lease.expires_at,
+                "collected_at": view.collected_at}
+    return {"cidr": view.suggest(netmask, family, leases.active(family), region, environment),
+            "collected_at": view.collected_at}
+
+
+# Prometheus text format; a str body is sent as text rather than JSON
+def _metrics(service, view, params):
+    if view is not None:
+        METRICS.set("cidr_agent_inventory_age_seconds", time.time() - view.collected_at)
+        METRICS.set("cidr_agent_inventory_vnets", view.vnet_count)
+    return METRICS.render()
+
+
+# path -> (handler, needs a loaded inventory)
+ROUTES = {
+    "/health": (_health, False),
+    "/used-cidrs": (_used_cidrs, True),
+    "/freeup": (_freeup, True),
+    "/suggest": (_suggest, True),
+    "/metrics": (_metrics, False),
+}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = "cidr-agent"
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        status = self._handle(url)
+        path = url.path if url.path in ROUTES else "other"
+        METRICS.observe("cidr_agent_daemon_request_seconds", time.perf_counter() - start, path=path, status=str(status))
+
+    # Answers one request; returns the HTTP status sent
+    def _handle(self, url):
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        service = self.server.service
+        route = ROUTES.get(url.path)
+        if route is None:
+            return self._send(404, {"error": f"unknown path {url.path}"})
+        # Clients say which scope they want, so a daemon for another subscription is never used by mistake
+        if params.get("scope", service.scope) != service.scope:
+            return self._send(409, {"error": f"daemon serves scope {service.scope}"})
+        handler, needs_view = route
+        view = service.view
+        if needs_view and view is None:
+            return self._send(503, {"error": "inventory is still loading"})
+        try:
+            body = handler(service, view, params)
+        except ValueError as error:
+            return self._send(400, {"error": str(error)})
+        return self._send(200, body)
+
+    def _send(self, status, body):
+        if isinstance(body, str):
+            payload = body.encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            payload = json.dumps(body).encode()
+            content_type = "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        return status
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """HTTP server answering JSON queries from service's current view, one thread per request."""
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+@timed()
+def daemon_request(path, url=None, timeout=CLIENT_TIMEOUT, **params):
+    """GET a daemon endpoint and return its JSON answer, or None if no daemon answered it."""
+    query = urlencode({k: v for k, v in params.items() if v is not None})
+    try:
+        with urllib.request.urlopen(f"{url or DAEMON_URL}{path}?{query}", timeout=timeout) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+import os
+
+from cidr_analysis import iter_nic_rows, iter_subnet_rows
+from cidr_metrics import timed
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+MIME_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+# Rows held in memory at once while writing
+CHUNK_ROWS = 10000
+
+# Column types per dataset, so every Parquet chunk has the same schema even when a
+# chunk's column is all empty
+DATASETS = {
+    "subnets": [("VNet Name", "string"), ("VNet CIDR", "string"), ("Subnet Name", "string"),
+                ("Subnet CIDR", "string"), ("Total IPs", "int64"), ("Used IPs", "int64"),
+                ("Utilization %", "float64")],
+    "nics": [("NIC Name", "string"), ("Private IP", "string"), ("VNet Name", "string"),
+             ("Subnet Name", "string"), ("Resource Group", "string")],
+}
+
+
+def export_rows(inventory, dataset, usage=None, nics=None):
+    """Rows of one dataset, generated lazily: "subnets" (with usage, if given) or "nics"."""
+    if dataset == "subnets":
+        return iter_subnet_rows(inventory, usage)
+    if dataset == "nics":
+        return iter_nic_rows(inventory, nics)
+    raise ValueError(f"unknown dataset {dataset!r}; expected one of {', '.join(DATASETS)}")
+
+
+def format_for_path(path, default="csv"):
+    """Export format implied by a file name's extension."""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return extension if extension in EXPORT_FORMATS else default
+
+
+def chunked(rows, size=CHUNK_ROWS):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@timed()
+def write_export(rows, out, fmt, dataset="subnets", chunk_rows=CHUNK_ROWS):
+    """Write rows to the binary file out as CSV, JSON Lines or Parquet, one chunk at a time.
+
+    Only chunk_rows rows are held in memory, however many the generator yields.
+    Returns the number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    columns = DATASETS[dataset]
+    if fmt == "parquet":
+        return _write_parquet(rows, out, columns, chunk_rows)
+    written = 0
+    if fmt == "csv":
+        text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+        writer = csv.DictWriter(text, fieldnames=[name for name, _ in columns])
+        writer.writeheader()
+        for chunk in chunked(rows, chunk_rows):
+            writer.writerows(chunk)
+            written += len(chunk)
+        # Leave out open for the caller
+        text.detach()
+        return written
+    for chunk in chunked(rows, chunk_rows):
+        out.write("".join(json.dumps(row) + "\n" for row in chunk).encode())
+        written += len(chunk)
+    return written
+
+
+def _write_parquet(rows, out, columns, chunk_rows):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in columns])
+    written = 0
+    # One row group per chunk
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in chunked(rows, chunk_rows):
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            written += len(chunk)
+    return written
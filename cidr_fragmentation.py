@@ -0,0 +1,151 @@
+import heapq
+
+from cidr_allocator import PRIVATE_RANGES, FreeSpaceAllocator, merge_intervals
+from cidr_metrics import timed
+from cidr_planner import fragmentation_report
+from cidr_prefix import MAX_PREFIXLEN, format_prefix, parse_prefixes
+
+# Block sizes whose free capacity is reported per range
+CAPACITY_PREFIXLENS = (16, 20, 22, 24, 26, 28)
+RECOVERY_LIMIT = 20
+# Cheapest moves first when two VNets would free the same block
+ACTIONS = {"empty": (0, "Delete"), "idle": (1, "Delete or consolidate"), "in use": (2, "Migrate")}
+
+
+def block_capacity(blocks, max_prefixlen, prefixlens=CAPACITY_PREFIXLENS):
+    """How many /p blocks the free space holds for each p, given its maximal aligned (start, prefixlen) blocks."""
+    counts = [0] * (max_prefixlen + 1)
+    for _, prefixlen in blocks:
+        counts[prefixlen] += 1
+    return {p: sum(counts[q] << (p - q) for q in range(p + 1)) for p in prefixlens if p <= max_prefixlen}
+
+
+@timed()
+def range_fragmentation(allocator, prefixlens=CAPACITY_PREFIXLENS):
+    """fragmentation_report for each of the allocator's ranges, with its free share and capacity per prefix length."""
+    used = allocator.used_intervals()
+    reports = []
+    for parent in allocator.ranges:
+        single = FreeSpaceAllocator.from_intervals(used, [str(parent)])
+        report = fragmentation_report(single)
+        report["range"] = str(parent)
+        report["free_percent"] = round(100 * report["free_addresses"] / parent.num_addresses, 2)
+        report["capacity"] = block_capacity(single.free_blocks(), single.max_prefixlen,
+                                            [p for p in prefixlens if p >= parent.prefixlen])
+        reports.append(report)
+    return reports
+
+
+# Size of the largest aligned block inside the gap [left, right) that overlaps [start, end),
+# i.e. the biggest block that only becomes free once [start, end) is released
+def _largest_new_block(left, right, start, end, max_prefixlen):
+    for prefixlen in range(max_prefixlen + 1):
+        size = 1 << (max_prefixlen - prefixlen)
+        block = -(-max(left, start - size + 1) // size) * size
+        if block + size <= right and block < end:
+            return block, prefixlen
+    return None
+
+
+# Split a range into runs of (start, end, owner): owner is None where no VNet is, the
+# VNet's index where exactly one VNet is, and -1 where several overlap
+def _ownership(parent, blocks):
+    events = []
+    for start, end, index in blocks:
+        start, end = max(start, parent.start), min(end, parent.end)
+        if start < end:
+            events.append((start, 1, index))
+            events.append((end, -1, index))
+    events.sort()
+    runs = []
+    position = parent.start
+    count = 0
+    # With one VNet present, the sum of present indices is its index
+    owners = 0
+    i = 0
+    while position < parent.end:
+        while i < len(events) and events[i][0] == position:
+            count += events[i][1]
+            owners += events[i][1] * events[i][2]
+            i += 1
+        next_position = events[i][0] if i < len(events) else parent.end
+        owner = None if count == 0 else owners if count == 1 else -1
+        if runs and runs[-1][2] == owner:
+            runs[-1][1] = next_position
+        else:
+            runs.append([position, next_position, owner])
+        position = next_position
+    return runs
+
+
+@timed()
+def recovery_candidates(inventory, usage=None, ranges=PRIVATE_RANGES, limit=RECOVERY_LIMIT):
+    """VNets ranked by the largest aligned block in the ranges that removing them would free.
+
+    Only space no other VNet also covers is freed. The gap a VNet leaves joins the
+    free space around it, so the block recovered can be larger than the VNet
+    itself. With usage (from subnet_ip_usage), VNets whose subnets hold no IPs are
+    marked idle. A sort and one sweep over all VNet prefixes, so O(N log N).
+    """
+    parents = parse_prefixes(ranges)
+    family = parents[0].family if parents else 4
+    max_prefixlen = MAX_PREFIXLEN[family]
+    blocks = []
+    for index, vnet in enumerate(inventory.vnets):
+        for start, end in merge_intervals((p.start, p.end) for p in vnet.prefixes if p.family == family):
+            blocks.append((start, end, index))
+
+    # vnet index -> [largest new block (start, prefixlen), addresses freed]
+    recovered = {}
+    for parent in parents:
+        runs = _ownership(parent, blocks)
+        i = 0
+        while i < len(runs):
+            index = runs[i][2]
+            if index is None or index < 0:
+                i += 1
+                continue
+            # The gap removing this VNet opens: its own runs plus the free runs around and between them
+            first = i
+            while first > 0 and runs[first - 1][2] is None:
+                first -= 1
+            last = i
+            while last + 1 < len(runs) and runs[last + 1][2] in (None, index):
+                last += 1
+            left, right = runs[first][0], runs[last][1]
+            entry = recovered.setdefault(index, [None, 0])
+            for start, end, owner in runs[i:last + 1]:
+                if owner != index:
+                    continue
+                entry[1] += end - start
+                block = _largest_new_block(left, right, start, end, max_prefixlen)
+                if block is not None and (entry[0] is None or block[1] < entry[0][1]):
+                    entry[0] = block
+            i = last + 1
+
+    def state(vnet):
+        if not vnet.subnets:
+            return "empty"
+        if usage is not None and not any(usage.get(subnet.id.lower()) for subnet in vnet.subnets):
+            return "idle"
+        return "in use"
+
+    candidates = []
+    for index, (block, freed) in recovered.items():
+        if block is None:
+            continue
+        vnet = inventory.vnets[index]
+        vnet_state = state(vnet)
+        # Bigger blocks first, then cheaper actions, then more addresses freed
+        rank = (block[1], ACTIONS[vnet_state][0], -freed)
+        candidates.append((rank, index, vnet, vnet_state, block, freed))
+    ranked = heapq.nsmallest(limit, candidates) if limit else sorted(candidates)
+    return [{
+        "VNet Name": vnet.name,
+        "Resource Group": vnet.resource_group,
+        "Address Space": ", ".join(vnet.address_prefixes),
+        "State": vnet_state,
+        "Action": ACTIONS[vnet_state][1],
+        "Block Recovered": format_prefix(block[0], block[1], family),
+        "Addresses Freed": freed,
+    } for _, _, vnet, vnet_state, block, freed in ranked]
@@ -0,0 +1,377 @@
+import functools
+import threading
+
+from cidr_inventory import extract_resource_group_from_id
+from cidr_metrics import timed
+from cidr_prefix import MAX_PREFIXLEN, format_prefix, parse_prefix
+
+KINDS = ("vnet", "subnet", "nic")
+# Past this share of changed records a refresh rebuilds the index rather than patching it
+REBUILD_SHARE = 0.5
+
+# Index entries are flat tuples of strings and integers:
+# (kind, family, network, prefixlen, name, VNet name, subnet name, resource group, resource id)
+
+
+def _vnet_entries(vnet):
+    entries = [("vnet", p.family, p.network, p.prefixlen, vnet.name, vnet.name, None, vnet.resource_group, vnet.id)
+               for p in vnet.prefixes]
+    for subnet in vnet.subnets:
+        entries.extend(("subnet", p.family, p.network, p.prefixlen, subnet.name, vnet.name, subnet.name,
+                        vnet.resource_group, subnet.id) for p in subnet.prefixes)
+    return entries
+
+
+# NICs only know their subnet by id, so its VNet and subnet names are read from that
+def _nic_entries(nic):
+    entries = []
+    for subnet_id, ip in nic.ip_configurations:
+        prefix = parse_prefix(ip) if ip else None
+        if prefix is None:
+            continue
+        vnet_name, subnet_name = _subnet_names(subnet_id)
+        entries.append(("nic", prefix.family, prefix.network, prefix.prefixlen, nic.name, vnet_name, subnet_name,
+                        extract_resource_group_from_id(nic.id), nic.id))
+    return entries
+
+
+# Many NICs share a subnet
+@functools.lru_cache(maxsize=65536)
+def _subnet_names(subnet_id):
+    parts = subnet_id.split("/") if subnet_id else []
+    if len(parts) > 3 and parts[-2].lower() == "subnets":
+        return parts[-3], parts[-1]
+    return None, None
+
+
+def entry_row(entry):
+    kind, family, network, prefixlen, name, vnet_name, subnet_name, resource_group, resource_id = entry
+    cidr = format_prefix(network, prefixlen, family)
+    return {
+        "Kind": kind,
+        # A NIC's host route is shown as its address
+        "CIDR": cidr.partition("/")[0] if kind == "nic" else cidr,
+        "Name": name,
+        "VNet Name": vnet_name,
+        "Subnet Name": subnet_name,
+        "Resource Group": resource_group,
+        "Resource ID": resource_id,
+    }
+
+
+def parse_range(text):
+    """(family, first, last) integer addresses of a CIDR, a single IP or a first-last address range."""
+    first_text, dash, last_text = text.strip().partition("-")
+    first = parse_prefix(first_text)
+    if first is None:
+        raise ValueError(f"{text!r} is not an IP address, CIDR or address range")
+    if not dash:
+        return first.family, first.start, first.end - 1
+    last = parse_prefix(last_text)
+    if (last is None or last.family != first.family
+            or first.prefixlen != first.max_prefixlen or last.prefixlen != last.max_prefixlen):
+        raise ValueError(f"{text!r} is not a first-last address range")
+    if last.start < first.start:
+        raise ValueError(f"{text!r} ends before it starts")
+    return first.family, first.start, last.start
+
+
+def range_blocks(first, last, max_prefixlen):
+    """The fewest aligned (network, prefixlen) blocks covering [first, last]: at most two per bit."""
+    blocks = []
+    while first <= last:
+        size = first & -first if first else 1 << max_prefixlen
+        while size > last - first + 1:
+            size >>= 1
+        blocks.append((first, max_prefixlen + 1 - size.bit_length()))
+        first += size
+    return blocks
+
+
+class PrefixTrie:
+    """Path-compressed binary trie of one address family, keyed by (network, prefixlen).
+
+    Nodes only exist where something is stored or where two branches fork, so a
+    walk from the root takes at most max_prefixlen steps. Nodes are slots in
+    parallel lists of integers rather than objects, which keeps a trie of millions
+    of addresses compact and out of the garbage collector's way.
+    """
+
+    def __init__(self, family):
+        self.max_prefixlen = MAX_PREFIXLEN[family]
+        # Node 0 is the root, 0.0.0.0/0 or ::/0; 0 as a child means no child
+        self.network = [0]
+        self.prefixlen = [0]
+        self.child = ([0], [0])
+        # Tuple of the entries stored at exactly this prefix
+        self.entries = [()]
+        self._free = []
+
+    def _bit(self, network, depth):
+        return (network >> (self.max_prefixlen - 1 - depth)) & 1
+
+    # Whether node's prefix contains network/prefixlen
+    def _covers(self, node, network, prefixlen):
+        node_prefixlen = self.prefixlen[node]
+        shift = self.max_prefixlen - node_prefixlen
+        return node_prefixlen <= prefixlen and network >> shift == self.network[node] >> shift
+
+    def _node(self, network, prefixlen, entries=()):
+        if self._free:
+            node = self._free.pop()
+            self.network[node] = network
+            self.prefixlen[node] = prefixlen
+            self.child[0][node] = self.child[1][node] = 0
+            self.entries[node] = entries
+            return node
+        self.network.append(network)
+        self.prefixlen.append(prefixlen)
+        self.child[0].append(0)
+        self.child[1].append(0)
+        self.entries.append(entries)
+        return len(self.network) - 1
+
+    # A node for the longest prefix a and b share, forking into them; neither may contain the other
+    def _fork(self, a, b):
+        network_a, network_b = self.network[a], self.network[b]
+        common = self.max_prefixlen - (network_a ^ network_b).bit_length()
+        shift = self.max_prefixlen - common
+        fork = self._node(network_a >> shift << shift, common)
+        self.child[self._bit(network_a, common)][fork] = a
+        self.child[self._bit(network_b, common)][fork] = b
+        return fork
+
+    def build(self, entries):
+        """Fill an empty trie from entries sorted by (network, prefixlen).
+
+        In that order every prefix comes right after its ancestors, so each one hangs
+        off the rightmost path built so far and no walk from the root is needed.
+        """
+        stack = [0]
+        for entry in entries:
+            network, prefixlen = entry[2], entry[3]
+            while not self._covers(stack[-1], network, prefixlen):
+                stack.pop()
+            parent = stack[-1]
+            if self.prefixlen[parent] == prefixlen:
+                self.entries[parent] += (entry,)
+                continue
+            node = self._node(network, prefixlen, (entry,))
+            side = self.child[self._bit(network, self.prefixlen[parent])]
+            # A branch already on this side sorts earlier and does not cover the new
+            # prefix, so the two only share some leading bits
+            if side[parent]:
+                fork = self._fork(side[parent], node)
+                side[parent] = fork
+                stack.append(fork)
+            else:
+                side[parent] = node
+            stack.append(node)
+
+    def insert(self, entry):
+        network, prefixlen = entry[2], entry[3]
+        node = 0
+        while self.prefixlen[node] != prefixlen:
+            side = self.child[self._bit(network, self.prefixlen[node])]
+            child = side[node]
+            if not child:
+                side[node] = self._node(network, prefixlen, (entry,))
+                return
+            if self._covers(child, network, prefixlen):
+                node = child
+                continue
+            added = self._node(network, prefixlen, (entry,))
+            if self._covers(added, self.network[child], self.prefixlen[child]):
+                # The new prefix sits between node and child
+                self.child[self._bit(self.network[child], prefixlen)][added] = child
+                side[node] = added
+            else:
+                side[node] = self._fork(child, added)
+            return
+        self.entries[node] += (entry,)
+
+    def remove(self, entry):
+        """Remove one stored entry, pruning nodes left empty; False if it was not stored."""
+        network, prefixlen = entry[2], entry[3]
+        path = [0]
+        while self.prefixlen[path[-1]] < prefixlen:
+            child = self.child[self._bit(network, self.prefixlen[path[-1]])][path[-1]]
+            if not child or not self._covers(child, network, prefixlen):
+                return False
+            path.append(child)
+        entries = self.entries[path[-1]]
+        if self.prefixlen[path[-1]] != prefixlen or entry not in entries:
+            return False
+        position = entries.index(entry)
+        self.entries[path[-1]] = entries[:position] + entries[position + 1:]
+        # Drop nodes left holding nothing, and forks left with a single branch
+        while len(path) > 1 and not self.entries[path[-1]]:
+            node = path.pop()
+            zero, one = self.child[0][node], self.child[1][node]
+            if zero and one:
+                break
+            parent = path[-1]
+            side = self.child[0] if self.child[0][parent] == node else self.child[1]
+            side[parent] = zero or one
+            self._free.append(node)
+        return True
+
+    def covering(self, network, prefixlen):
+        """Entries at or above network/prefixlen, least specific first."""
+        found = []
+        node = 0
+        while self._covers(node, network, prefixlen):
+            found.extend(self.entries[node])
+            if self.prefixlen[node] == prefixlen:
+                break
+            node = self.child[self._bit(network, self.prefixlen[node])][node]
+            if not node:
+                break
+        return found
+
+    def within(self, network, prefixlen, kinds=KINDS, limit=None):
+        """Entries of the given kinds inside network/prefixlen, in address order; stops after limit."""
+        found = []
+        node = 0
+        while self.prefixlen[node] < prefixlen:
+            if not self._covers(node, network, prefixlen):
+                return found
+            node = self.child[self._bit(network, self.prefixlen[node])][node]
+            if not node:
+                return found
+        shift = self.max_prefixlen - prefixlen
+        if self.network[node] >> shift != network >> shift:
+            return found
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for entry in self.entries[node]:
+                if entry[0] in kinds:
+                    found.append(entry)
+                    if limit and len(found) >= limit:
+                        return found
+            if self.child[1][node]:
+                stack.append(self.child[1][node])
+            if self.child[0][node]:
+                stack.append(self.child[0][node])
+        return found
+
+
+# Hashes of what a record contributes to the index, to tell a re-read but unchanged record
+# from a changed one; an int per record rather than a copy of its contents
+def _vnet_signature(vnet):
+    return hash((vnet.id, vnet.name, vnet.resource_group, tuple(vnet.prefixes),
+                 tuple((subnet.id, subnet.name, tuple(subnet.prefixes)) for subnet in vnet.subnets)))
+
+
+def _nic_signature(nic):
+    return hash((nic.id, nic.name, tuple(nic.ip_configurations)))
+
+
+class AddressIndex:
+    """Radix index over every VNet, subnet and NIC address in an inventory.
+
+    lookup() (longest-prefix match) and contains() walk one root-to-node path, so
+    they cost O(prefix length) plus the size of the answer however big the estate;
+    address ranges are split into at most two aligned blocks per bit. update()
+    only touches the tries for VNets and NICs that actually changed since the last
+    call. Safe to query from several threads while another updates it.
+    """
+
+    def __init__(self, inventory=None, nics=None):
+        self._tries = {family: PrefixTrie(family) for family in MAX_PREFIXLEN}
+        # id() of each indexed record -> (record, signature, entries); holding the record keeps its id() unique
+        self._records = {}
+        self._lock = threading.Lock()
+        self.entry_count = 0
+        if inventory is not None:
+            self.update(inventory, nics)
+
+    @timed("address_index_update")
+    def update(self, inventory, nics=None):
+        """Bring the index in line with inventory (and nics, if given instead of its own).
+
+        A change-feed refresh swaps in new record objects only for the resources
+        that changed, and a re-read list whose records carry the same content is
+        matched back to the entries already indexed, so either way only real
+        changes reach the tries. Returns how many records were added or removed.
+        """
+        nics = inventory.nics if nics is None else nics
+        records = self._records
+        current = set(map(id, inventory.vnets))
+        current.update(map(id, nics))
+        with self._lock:
+            new = [(vnet, _vnet_signature, _vnet_entries) for vnet in inventory.vnets if id(vnet) not in records]
+            new.extend((nic, _nic_signature, _nic_entries) for nic in nics if id(nic) not in records)
+            # Records no longer present, by content, so unchanged ones can be carried over
+            gone = {}
+            for key in [key for key in records if key not in current]:
+                gone.setdefault(records[key][1], []).append(key)
+            added = []
+            for record, signature_of, entries_of in new:
+                signature = signature_of(record)
+                keys = gone.get(signature)
+                if keys:
+                    records[id(record)] = (record, signature, records.pop(keys.pop())[2])
+                else:
+                    added.append((record, signature, entries_of))
+            removed = [key for keys in gone.values() for key in keys]
+            if len(added) + len(removed) > REBUILD_SHARE * len(current):
+                self._rebuild(inventory.vnets, nics)
+            else:
+                for key in removed:
+                    for entry in records.pop(key)[2]:
+                        self.entry_count -= self._tries[entry[1]].remove(entry)
+                for record, signature, entries_of in added:
+                    entries = entries_of(record)
+                    for entry in entries:
+                        self._tries[entry[1]].insert(entry)
+                    self.entry_count += len(entries)
+                    records[id(record)] = (record, signature, entries)
+        return len(added) + len(removed)
+
+    def _rebuild(self, vnets, nics):
+        self._records = {id(vnet): (vnet, _vnet_signature(vnet), _vnet_entries(vnet)) for vnet in vnets}
+        self._records.update((id(nic), (nic, _nic_signature(nic), _nic_entries(nic))) for nic in nics)
+        entries = [entry for _, _, record_entries in self._records.values() for entry in record_entries]
+        entries.sort(key=lambda entry: (entry[1], entry[2], entry[3]))
+        self._tries = {family: PrefixTrie(family) for family in MAX_PREFIXLEN}
+        for family, trie in self._tries.items():
+            trie.build(entry for entry in entries if entry[1] == family)
+        self.entry_count = len(entries)
+
+    def lookup(self, address):
+        """Everything containing an IP address or CIDR, most specific first: NIC, subnet, then VNet."""
+        prefix = parse_prefix(address)
+        if prefix is None:
+            raise ValueError(f"{address!r} is not an IP address or CIDR")
+        with self._lock:
+            found = self._tries[prefix.family].covering(prefix.network, prefix.prefixlen)
+        return [entry_row(entry) for entry in reversed(found)]
+
+    def contains(self, query, kinds=KINDS, limit=None):
+        """Everything inside a CIDR or first-last address range, in address order, up to limit rows."""
+        family, first, last = parse_range(query)
+        found = []
+        with self._lock:
+            trie = self._tries[family]
+            for network, prefixlen in range_blocks(first, last, trie.max_prefixlen):
+                found.extend(trie.within(network, prefixlen, kinds, limit and limit - len(found)))
+                if limit and len(found) >= limit:
+                    break
+        return [entry_row(entry) for entry in found]
+
+    def overlapping(self, query, kinds=KINDS):
+        """Everything sharing an address with a CIDR or address range: the prefixes around it, then those inside."""
+        family, first, last = parse_range(query)
+        found = {}
+        with self._lock:
+            trie = self._tries[family]
+            blocks = range_blocks(first, last, trie.max_prefixlen)
+            for network, prefixlen in blocks:
+                for entry in trie.covering(network, prefixlen):
+                    found.setdefault(entry, None)
+            for network, prefixlen in blocks:
+                for entry in trie.within(network, prefixlen, kinds):
+                    found.setdefault(entry, None)
+        return [entry_row(entry) for entry in found if entry[0] in kinds]
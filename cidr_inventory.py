@@ -0,0 +1,268 @@
+import email.utils
+import random
+import time
+
+from azure.core.exceptions import HttpResponseError
+
+from cidr_metrics import METRICS, response_hook, timed
+from cidr_prefix import parse_prefixes
+
+# Throttling backoff for ARM list calls
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_STATUS_CODES = (429, 503)
+
+# Azure keeps the first four addresses and the last one of every subnet
+AZURE_RESERVED_IPS = 5
+
+
+def extract_resource_group_from_id(resource_id):
+    parts = resource_id.split("/")
+    try:
+        rg_index = parts.index("resourceGroups")
+        return parts[rg_index + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+class SubnetRecord:
+    def __init__(self, id, name, prefixes):
+        self.id = id
+        self.name = name
+        # Parsed Prefix objects; dual-stack and multi-prefix subnets have several
+        self.prefixes = prefixes
+
+    @property
+    def address_prefixes(self):
+        return [str(p) for p in self.prefixes]
+
+    # First prefix, for places that show a single CIDR per subnet
+    @property
+    def address_prefix(self):
+        return str(self.prefixes[0]) if self.prefixes else None
+
+
+# A NIC, or an internal load balancer frontend, holding private IPs in subnets
+class NicRecord:
+    def __init__(self, id, name, ip_configurations):
+        self.id = id
+        self.name = name
+        # (subnet id, private IP) per IP configuration
+        self.ip_configurations = ip_configurations
+
+
+class VNetRecord:
+    def __init__(self, id, name, resource_group, prefixes, subnets):
+        self.id = id
+        self.name = name
+        self.resource_group = resource_group
+        # Parsed Prefix objects of the address space, IPv4 and IPv6
+        self.prefixes = prefixes
+        self.subnets = subnets
+
+    @property
+    def address_prefixes(self):
+        return [str(p) for p in self.prefixes]
+
+
+class Inventory:
+    """VNet -> subnet model for one subscription, plus how many ARM calls it took."""
+
+    def __init__(self, subscription_id=None, collected_at=None):
+        self.subscription_id = subscription_id
+        self.subscription_ids = [subscription_id] if subscription_id else []
+        self.collected_at = collected_at if collected_at is not None else time.time()
+        # Time of the last full crawl; incremental refreshes only move collected_at
+        self.reconciled_at = self.collected_at
+        self.vnets = []
+        self.nics = []
+        # Whether NICs were crawled at all, since an estate may have none
+        self.nics_loaded = False
+        self.api_calls = 0
+        self.throttled_retries = 0
+
+    def merge(self, other):
+        """Fold another subscription's inventory into this one."""
+        # NICs are only loaded for the merge if every subscription in it had them
+        self.nics_loaded = other.nics_loaded and (self.nics_loaded or not self.subscription_ids)
+        self.subscription_ids.extend(other.subscription_ids)
+        self.collected_at = min(self.collected_at, other.collected_at)
+        self.reconciled_at = min(self.reconciled_at, other.reconciled_at)
+        self.vnets.extend(other.vnets)
+        self.nics.extend(other.nics)
+        self.api_calls += other.api_calls
+        self.throttled_retries += other.throttled_retries
+        return self
+
+    def used_prefixes(self):
+        """Every VNet and subnet prefix, of both families, as parsed Prefix objects."""
+        used = set()
+        for vnet in self.vnets:
+            used.update(vnet.prefixes)
+            for subnet in vnet.subnets:
+                used.update(subnet.prefixes)
+        return used
+
+    def used_cidrs(self):
+        return {str(p) for p in self.used_prefixes()}
+
+    def iter_subnets(self):
+        for vnet in self.vnets:
+            for subnet in vnet.subnets:
+                yield vnet, subnet
+
+    def find_vnet(self, name, resource_group):
+        for vnet in self.vnets:
+            if vnet.name == name and vnet.resource_group == resource_group:
+                return vnet
+        return None
+
+    def replace_vnet(self, vnet_id, record):
+        """Swap the VNet with this id for record, adding it if new or dropping it if record is None."""
+        self.vnets = _replace_record(self.vnets, vnet_id, record)
+
+    def replace_nic(self, nic_id, record):
+        """Swap the NIC with this id for record, adding it if new or dropping it if record is None."""
+        self.nics = _replace_record(self.nics, nic_id, record)
+
+
+# ARM resource ids are case-insensitive
+def _replace_record(records, resource_id, record):
+    resource_id = resource_id.lower()
+    kept = [r for r in records if r.id.lower() != resource_id]
+    if record is not None:
+        kept.append(record)
+    return kept
+
+
+# Seconds to wait before retrying a throttled call: Retry-After if ARM sent one,
+# otherwise jittered exponential backoff
+def _retry_delay(error, attempt):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            if retry_at is not None:
+                return max(retry_at.timestamp() - time.time(), 0.0)
+    return delay * random.uniform(0.5, 1.0)
+
+
+# Helper to call an SDK list method and drain its ItemPaged result page by page, counting
+# one API call per page and recording page latency and throttling under operation.
+# A throttled page is retried on the same page iterator, so paging resumes where it stopped.
+def _list_paged(inventory, operation, list_call, *args):
+    items = []
+    pages = list_call(*args, raw_response_hook=response_hook(operation)).by_page()
+    attempt = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            page = next(pages, None)
+        except HttpResponseError as error:
+            inventory.api_calls += 1
+            if error.status_code not in RETRY_STATUS_CODES or attempt >= MAX_RETRIES:
+                raise
+            inventory.throttled_retries += 1
+            METRICS.inc("cidr_agent_throttled_retries_total", operation=operation)
+            time.sleep(_retry_delay(error, attempt))
+            attempt += 1
+            continue
+        if page is None:
+            return items
+        page = list(page)
+        METRICS.observe("cidr_agent_api_page_seconds", time.perf_counter() - start, operation=operation)
+        METRICS.inc("cidr_agent_api_pages_total", operation=operation)
+        METRICS.inc("cidr_agent_api_items_total", len(page), operation=operation)
+        inventory.api_calls += 1
+        attempt = 0
+        items.extend(page)
+
+
+def vnet_record(client, vnet, inventory):
+    """Turn an SDK VirtualNetwork into a VNetRecord, listing subnets only if none were embedded."""
+    rg_name = extract_resource_group_from_id(vnet.id)
+    subnets = vnet.subnets
+    if subnets is None:
+        subnets = _list_paged(inventory, "subnets.list", client.subnets.list, rg_name, vnet.name)
+    address_prefixes = vnet.address_space.address_prefixes if vnet.address_space else None
+    return VNetRecord(
+        vnet.id,
+        vnet.name,
+        rg_name,
+        parse_prefixes(address_prefixes),
+        [SubnetRecord(s.id, s.name, subnet_prefixes(s)) for s in subnets],
+    )
+
+
+# Dual-stack and multi-prefix subnets fill address_prefixes; single-prefix ones only address_prefix
+def subnet_prefixes(subnet):
+    return parse_prefixes(subnet.address_prefixes or [subnet.address_prefix])
+
+
+def nic_record(nic):
+    ip_configurations = []
+    for ipconf in nic.ip_configurations or []:
+        subnet_id = ipconf.subnet.id if ipconf.subnet and ipconf.subnet.id else None
+        ip_configurations.append((subnet_id, ipconf.private_ip_address))
+    return NicRecord(nic.id, nic.name, ip_configurations)
+
+
+@timed()
+def load_inventory(client, subscription_id=None):
+    """Build the whole VNet -> subnet model from the paged virtual_networks.list_all call.
+
+    Subnets come from the list embedded in each VNet; subnets.list is only called
+    for VNets that came back without one.
+    """
+    inventory = Inventory(subscription_id)
+    for vnet in _list_paged(inventory, "virtual_networks.list_all", client.virtual_networks.list_all):
+        inventory.vnets.append(vnet_record(client, vnet, inventory))
+    return inventory
+
+
+@timed()
+def load_nics(client, inventory):
+    """Add the subscription's NICs and internal load balancer frontends to the inventory.
+
+    Private endpoints need no separate call: their NICs are part of network_interfaces.list_all.
+    """
+    for nic in _list_paged(inventory, "network_interfaces.list_all", client.network_interfaces.list_all):
+        inventory.nics.append(nic_record(nic))
+    for lb in _list_paged(inventory, "load_balancers.list_all", client.load_balancers.list_all):
+        for frontend in lb.frontend_ip_configurations or []:
+            if frontend.subnet and frontend.subnet.id:
+                inventory.nics.append(NicRecord(
+                    frontend.id,
+                    f"{lb.name}/{frontend.name}",
+                    [(frontend.subnet.id, frontend.private_ip_address)],
+                ))
+    inventory.nics_loaded = True
+    return inventory
+
+
+def subnet_ip_usage(nics, family=None):
+    """Private IPs in use per lowercased subnet id, from a single pass over the IP configurations.
+
+    With family 4 or 6 only addresses of that family are counted. Azure's reserved
+    addresses are not included; add AZURE_RESERVED_IPS for the IPv4 subnet total.
+    """
+    usage = {}
+    seen = set()
+    for nic in nics:
+        for subnet_id, ip in nic.ip_configurations:
+            if not subnet_id:
+                continue
+            if family is not None and ip is not None and (":" in ip) != (family == 6):
+                continue
+            key = subnet_id.lower()
+            if ip is not None:
+                if (key, ip) in seen:
+                    continue
+                seen.add((key, ip))
+            usage[key] = usage.get(key, 0) + 1
+    return usage
@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from cidr_metrics import timed
+from cidr_prefix import parse_prefix, parse_prefixes
+from cidr_snapshot import SNAPSHOT_DIR
+
+LEASE_PATH = os.environ.get("CIDR_AGENT_LEASE_DB", os.path.join(SNAPSHOT_DIR, "leases.sqlite"))
+LEASE_TTL = 30 * 60
+# Optimistic claims retried before suggesting under the write lock instead
+OPTIMISTIC_ATTEMPTS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (token TEXT NOT NULL, prefix TEXT NOT NULL, family INTEGER NOT NULL,
+                                   start BLOB NOT NULL, "end" BLOB NOT NULL, owner TEXT,
+                                   created_at REAL NOT NULL, expires_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS leases_range ON leases (family, start);
+CREATE INDEX IF NOT EXISTS leases_token ON leases (token);
+"""
+
+
+# Interval bounds as fixed-width big-endian BLOBs: SQLite compares BLOBs bytewise,
+# so they order like the integers, and IPv6 (and its 2**128 end) fits where INTEGER does not
+def _bound(value):
+    return value.to_bytes(17, "big")
+
+
+class Lease:
+    def __init__(self, token, prefixes, owner, expires_at):
+        self.token = token
+        self.prefixes = prefixes
+        self.owner = owner
+        self.expires_at = expires_at
+
+
+class LeaseStore:
+    """Short-lived reservations of suggested blocks, shared by every process using the same file.
+
+    Suggestions are computed outside any lock, then claimed in a short write
+    transaction that only checks the new blocks against active leases. If
+    another caller got there first the claim fails and the suggestion is redone
+    with that lease counted as used, so callers normally only queue on SQLite's
+    write lock for the duration of one insert. A caller that keeps losing races
+    makes its suggestion inside the write transaction, which always succeeds.
+    """
+
+    def __init__(self, path=LEASE_PATH, ttl=LEASE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+
+    # One connection per thread; autocommit, so transactions are explicit
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout = 30000")
+            self._local.conn = conn
+        return conn
+
+    def active(self, family=None, now=None):
+        """Prefixes under an unexpired lease, optionally of one family."""
+        return self._active(self._conn(), family, time.time() if now is None else now)
+
+    def _active(self, conn, family, now):
+        query = "SELECT prefix FROM leases WHERE expires_at > ?"
+        args = [now]
+        if family is not None:
+            query += " AND family = ?"
+            args.append(family)
+        return parse_prefixes(row[0] for row in conn.execute(query, args))
+
+    def entries(self, now=None):
+        """(token, prefix, owner, expires_at) for every unexpired lease."""
+        now = time.time() if now is None else now
+        return self._conn().execute(
+            "SELECT token, prefix, owner, expires_at FROM leases WHERE expires_at > ? ORDER BY created_at",
+            (now,)).fetchall()
+
+    def claim(self, cidrs, owner=None, ttl=None):
+        """Lease all of cidrs under one token, or none of them if any overlaps an active lease.
+
+        Returns the Lease, or None when another lease got in first.
+        """
+        return self._write(lambda conn: cidrs, owner, ttl)
+
+    def reserve(self, suggest, owner=None, ttl=None, family=None):
+        """Run suggest(leased_prefixes) and lease what it returns, retrying if it raced another caller.
+
+        suggest gets the currently leased prefixes (to treat as used) and returns
+        a list of CIDRs to lease, or None when nothing fits. Returns the Lease or None.
+        """
+        for _ in range(OPTIMISTIC_ATTEMPTS):
+            cidrs = suggest(self.active(family))
+            if not cidrs:
+                return None
+            lease = self.claim(cidrs, owner, ttl)
+            if lease is not None:
+                return lease
+        return self._write(lambda conn: suggest(self._active(conn, family, time.time())), owner, ttl)
+
+    # One write transaction: drop expired leases, get the CIDRs to lease from
+    # pick(conn), and insert them unless one overlaps an active lease
+    def _write(self, pick, owner, ttl):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        token = uuid.uuid4().hex
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            cidrs = pick(conn)
+            if not cidrs:
+                conn.execute("ROLLBACK")
+                return None
+            prefixes = [parse_prefix(c) for c in cidrs]
+            if None in prefixes:
+                raise ValueError(f"cannot lease {cidrs!r}")
+            for prefix in prefixes:
+                clash = conn.execute(
+                    'SELECT 1 FROM leases WHERE family = ? AND start < ? AND "end" > ? LIMIT 1',
+                    (prefix.family, _bound(prefix.end), _bound(prefix.start))).fetchone()
+                if clash:
+                    conn.execute("ROLLBACK")
+                    return None
+            conn.executemany(
+                "INSERT INTO leases VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(token, str(p), p.family, _bound(p.start), _bound(p.end), owner, now, expires_at) for p in prefixes])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Lease(token, [str(p) for p in prefixes], owner, expires_at)
+
+    def release(self, token):
+        """Drop a lease early; returns how many prefixes it held."""
+        return self._conn().execute("DELETE FROM leases WHERE token = ?", (token,)).rowcount
+
+    def confirm(self, inventory):
+        """Drop leases whose prefixes now exist in the inventory; returns how many were confirmed.
+
+        Once the VNet or subnet is deployed the inventory itself marks the block used.
+        """
+        existing = inventory.used_prefixes()
+        confirmed = [(token, prefix) for token, prefix in self._conn().execute("SELECT token, prefix FROM leases")
+                     if parse_prefix(prefix) in existing]
+        if confirmed:
+            self._conn().executemany("DELETE FROM leases WHERE token = ? AND prefix = ?", confirmed)
+        return len(confirmed)
+
+
+# The lease store when its file exists, else None: read-only callers have no
+# leases to honour until something reserves one, so they never create the DB
+def existing_lease_store(path=LEASE_PATH):
+    return LeaseStore(path) if os.path.exists(path) else None
+
+
+@timed()
+def lease_first_free(store, allocator, prefixlen, owner=None, ttl=None):
+    """Lease the first /prefixlen block that is free in allocator and not leased; returns the Lease or None."""
+    def suggest(leased):
+        cidr = allocator.with_used(leased).first_free(prefixlen)
+        return [cidr] if cidr else None
+    return store.reserve(suggest, owner, ttl, allocator.family)
@@ -0,0 +1,186 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency bucket upper bounds in seconds, from sub-millisecond analyses to throttled ARM pages
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "cidr_agent_api_page_seconds": "Time to fetch one page of an Azure list call, by operation.",
+    "cidr_agent_api_pages_total": "Pages returned by Azure list calls, by operation.",
+    "cidr_agent_api_items_total": "Resources returned by Azure list calls, by operation.",
+    "cidr_agent_http_responses_total": "HTTP responses from Azure, including ones the SDK retried, by operation and status.",
+    "cidr_agent_response_bytes_total": "Response body bytes from Azure, by operation.",
+    "cidr_agent_throttled_retries_total": "Throttled (429/503) pages retried after backing off, by operation.",
+    "cidr_agent_function_seconds": "Time spent in instrumented functions, by function.",
+    "cidr_agent_cache_lookups_total": "Inventory cache lookups, by scope and result.",
+    "cidr_agent_daemon_request_seconds": "Daemon request handling time, by path and status.",
+    "cidr_agent_inventory_age_seconds": "Age of the inventory the daemon is serving.",
+    "cidr_agent_inventory_vnets": "VNets in the inventory the daemon is serving.",
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (capped at the largest value seen)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Process-wide counters, gauges and latency histograms, keyed by metric name and labels.
+
+    Cheap enough to record on every API page and analysis call; render() gives the
+    Prometheus text format and breakdown() a per-operation timing summary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name, **labels):
+        """Sum of a counter over every label set matching labels."""
+        with self._lock:
+            return sum(value for (n, key), value in self._counters.items()
+                       if n == name and all(dict(key).get(k) == v for k, v in labels.items()))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def breakdown(self):
+        """One dict per timed operation or function, slowest in total first."""
+        with self._lock:
+            rows = [{
+                "metric": name,
+                "name": ",".join(str(v) for _, v in labels),
+                "count": h.count,
+                "total": h.sum,
+                "mean": h.sum / h.count if h.count else 0.0,
+                "p95": h.quantile(0.95),
+                "max": h.max,
+            } for (name, labels), h in self._histograms.items()]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def render(self):
+        """Everything recorded so far in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            lines = []
+            typed = set()
+
+            def header(name, kind):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+
+            for (name, labels), value in counters:
+                header(name, "counter")
+                lines.append(f"{name}{_label_text(labels)} {value}")
+            for (name, labels), value in gauges:
+                header(name, "gauge")
+                lines.append(f"{name}{_label_text(labels)} {value}")
+            for (name, labels), h in histograms:
+                header(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.buckets):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{name}_sum{_label_text(labels)} {h.sum}")
+                lines.append(f"{name}_count{_label_text(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def timed(name=None):
+    """Decorator recording each call's duration under cidr_agent_function_seconds."""
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.observe("cidr_agent_function_seconds", time.perf_counter() - start, function=label)
+        return wrapper
+    return decorate
+
+
+def response_hook(operation):
+    """raw_response_hook for an Azure SDK call: counts every HTTP response by status, and its bytes.
+
+    It runs below the SDK's own retry policy, so retried 429s are counted too.
+    """
+    def hook(response):
+        http_response = response.http_response
+        METRICS.inc("cidr_agent_http_responses_total", operation=operation, status=str(http_response.status_code))
+        METRICS.inc("cidr_agent_response_bytes_total", len(http_response.body() or b""), operation=operation)
+    return hook
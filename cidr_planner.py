@@ -0,0 +1,149 @@
+import heapq
+import json
+from collections import Counter
+
+from cidr_allocator import PRIVATE_RANGES, FreeSpaceAllocator
+from cidr_metrics import timed
+from cidr_prefix import MAX_PREFIXLEN, format_prefix
+
+
+class VNetDemand:
+    """One VNet to place: its subnets (largest first) and the block that holds them."""
+
+    def __init__(self, name, instance, subnet_prefixes, family=4):
+        self.name = name
+        self.instance = instance
+        self.family = family
+        self.subnet_prefixes = sorted(subnet_prefixes)
+        max_prefixlen = MAX_PREFIXLEN[family]
+        total = sum(1 << (max_prefixlen - p) for p in self.subnet_prefixes)
+        # Power-of-two sizes packed largest first always fit a block of the rounded-up total
+        self.prefixlen = max_prefixlen - (total - 1).bit_length()
+
+
+def parse_requirements(data):
+    """Expand a requirements document into one VNetDemand per VNet to create.
+
+    {"requirements": [{"name": "landing-zone", "count": 12,
+                       "subnets": [{"prefix": 24, "count": 4}, {"prefix": 27, "count": 2}]}]}
+    A bare list of requirements is accepted too.
+    """
+    if isinstance(data, dict):
+        data = data.get("requirements", [])
+    demands = []
+    for requirement in data:
+        name = requirement.get("name", f"requirement-{len(demands) + 1}")
+        subnet_prefixes = []
+        for subnet in requirement.get("subnets", []):
+            prefixlen = int(subnet["prefix"])
+            if not 8 <= prefixlen <= 29:
+                raise ValueError(f"{name}: subnet prefix /{prefixlen} is outside /8-/29")
+            subnet_prefixes.extend([prefixlen] * int(subnet.get("count", 1)))
+        if not subnet_prefixes:
+            raise ValueError(f"{name}: no subnets requested")
+        for instance in range(1, int(requirement.get("count", 1)) + 1):
+            demands.append(VNetDemand(name, instance, subnet_prefixes))
+    return demands
+
+
+def load_requirements(path):
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        return parse_requirements(yaml.safe_load(text))
+    return parse_requirements(json.loads(text))
+
+
+class BuddyFreeLists:
+    """Free space as per-prefix-length heaps of aligned block starts.
+
+    take(prefixlen) is best fit: it uses the smallest free block that is big
+    enough (lowest address on ties) and returns the unused halves to the lists.
+    """
+
+    def __init__(self, allocator):
+        self.max_prefixlen = allocator.max_prefixlen
+        self._lists = [[] for _ in range(self.max_prefixlen + 1)]
+        for start, prefixlen in allocator.free_blocks():
+            self._lists[prefixlen].append(start)
+        for starts in self._lists:
+            heapq.heapify(starts)
+
+    def take(self, prefixlen):
+        for fit in range(prefixlen, -1, -1):
+            if self._lists[fit]:
+                start = heapq.heappop(self._lists[fit])
+                for split in range(fit + 1, prefixlen + 1):
+                    heapq.heappush(self._lists[split], start + (1 << (self.max_prefixlen - split)))
+                return start
+        return None
+
+
+# Lay subnets out back to back inside the VNet, largest first, so each is aligned
+def carve_subnets(vnet_start, subnet_prefixes, family=4):
+    subnets = []
+    offset = vnet_start
+    for prefixlen in sorted(subnet_prefixes):
+        subnets.append(format_prefix(offset, prefixlen, family))
+        offset += 1 << (MAX_PREFIXLEN[family] - prefixlen)
+    return subnets
+
+
+def fragmentation_report(allocator):
+    """Free addresses, free block count, largest free block and a 0-1 fragmentation index.
+
+    The index is 1 - largest free block / total free space: 0 when all free space
+    is one block, approaching 1 as it splinters into small pieces.
+    """
+    return histogram_report(block_histogram(allocator.free_blocks()), allocator.max_prefixlen)
+
+
+def block_histogram(blocks):
+    """How many free blocks there are of each prefix length, given (start, prefixlen) blocks."""
+    return Counter(prefixlen for _, prefixlen in blocks)
+
+
+def histogram_report(histogram, max_prefixlen):
+    """fragmentation_report from a block_histogram, so histograms of parts of the space can be summed first."""
+    total = sum(count << (max_prefixlen - prefixlen) for prefixlen, count in histogram.items() if count > 0)
+    smallest = min((prefixlen for prefixlen, count in histogram.items() if count > 0), default=None)
+    largest = 1 << (max_prefixlen - smallest) if smallest is not None else 0
+    return {
+        "free_addresses": total,
+        "free_blocks": sum(count for count in histogram.values() if count > 0),
+        "largest_free_block": f"/{smallest}" if smallest is not None else None,
+        "fragmentation": round(1 - largest / total, 4) if total else 0.0,
+    }
+
+
+@timed()
+def plan_batch(used_cidrs, demands, ranges=None):
+    """Place every demand against the free space in one pass.
+
+    Demands are placed largest first, each into the best-fitting free block, and
+    the placements are marked used so later demands see them. The family
+    follows the ranges (the IPv4 private ranges by default); demands of the
+    other family are left unplaced. Returns (placements, unplaced, report)
+    where report has fragmentation before and after.
+    """
+    allocator = FreeSpaceAllocator(used_cidrs, PRIVATE_RANGES if ranges is None else ranges)
+    before = fragmentation_report(allocator)
+    free_lists = BuddyFreeLists(allocator)
+    placements = []
+    unplaced = []
+    for demand in sorted(demands, key=lambda d: d.prefixlen):
+        start = free_lists.take(demand.prefixlen) if demand.family == allocator.family else None
+        if start is None:
+            unplaced.append(demand)
+            continue
+        vnet_cidr = format_prefix(start, demand.prefixlen, allocator.family)
+        allocator.add(vnet_cidr)
+        placements.append({
+            "Requirement": demand.name,
+            "Instance": demand.instance,
+            "VNet CIDR": vnet_cidr,
+            "Subnets": carve_subnets(start, demand.subnet_prefixes, allocator.family),
+        })
+    placements.sort(key=lambda p: (p["Requirement"], p["Instance"]))
+    return placements, unplaced, {"before": before, "after": fragmentation_report(allocator)}
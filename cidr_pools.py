@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+
+from cidr_allocator import FreeSpaceAllocator, merge_intervals
+from cidr_analysis import family_ranges
+from cidr_planner import fragmentation_report
+from cidr_prefix import parse_prefix, require_prefixes
+
+# YAML (or JSON) file describing the pools to allocate from; no policy when unset
+POOLS_PATH = os.environ.get("CIDR_AGENT_POOLS")
+
+EXAMPLE = """\
+pools:
+  - name: weu-prod
+    region: westeurope
+    environment: prod
+    cidrs: [10.64.0.0/12]
+  - name: weu-dev
+    region: westeurope
+    environment: dev
+    cidrs: [10.80.0.0/14]
+  - name: neu-prod
+    region: northeurope
+    environment: prod
+    cidrs: [10.96.0.0/12]
+reserved:
+  - name: on-prem
+    cidrs: [10.0.0.0/10, 192.168.0.0/16]
+  - name: expressroute
+    cidrs: [10.255.0.0/16]
+"""
+
+
+class Pool:
+    """A named set of prefixes VNets in one region and environment are allocated from.
+
+    A pool without a region (or environment) is shared: it serves any region (or environment).
+    """
+
+    def __init__(self, name, prefixes, region=None, environment=None):
+        self.name = name
+        self.prefixes = prefixes
+        self.region = region
+        self.environment = environment
+
+    def matches(self, region=None, environment=None):
+        return ((region is None or self.region is None or self.region.lower() == region.lower())
+                and (environment is None or self.environment is None or self.environment.lower() == environment.lower()))
+
+
+class PoolPolicy:
+    """Pools to allocate from and ranges never to allocate, compiled once when loaded.
+
+    Reserved ranges become used space and the selected pools become the ranges an
+    allocator searches, so every suggestion lands in a pool and outside the
+    reserved ranges without filtering its answers afterwards.
+    """
+
+    def __init__(self, pools, reserved, digest=None):
+        self.pools = pools
+        # (name, prefixes) per reserved range
+        self.reserved = reserved
+        self.digest = digest
+        self._reserved_intervals = {
+            family: [(start, end) for start, end in
+                     merge_intervals((p.start, p.end) for _, prefixes in reserved for p in prefixes if p.family == family)]
+            for family in (4, 6)
+        }
+        pooled = sorted((p.family, p.start, p.end, pool.name) for pool in pools for p in pool.prefixes)
+        for (family, _, end, name), (next_family, next_start, _, next_name) in zip(pooled, pooled[1:]):
+            if family == next_family and next_start < end:
+                raise ValueError(f"pools {name} and {next_name} overlap")
+
+    def regions(self):
+        return sorted({pool.region for pool in self.pools if pool.region})
+
+    def environments(self):
+        return sorted({pool.environment for pool in self.pools if pool.environment})
+
+    def select(self, family=4, region=None, environment=None):
+        """Pools of the family serving region and environment (None for any), in file order."""
+        return [pool for pool in self.pools if pool.matches(region, environment)
+                and any(p.family == family for p in pool.prefixes)]
+
+    def ranges(self, family=4, region=None, environment=None):
+        """CIDRs to search for a new block, in file order.
+
+        Without pools of the family at all, the family's usual private ranges are
+        searched whatever the region and environment.
+        """
+        if not any(p.family == family for pool in self.pools for p in pool.prefixes):
+            return family_ranges(family)
+        pools = self.select(family, region, environment)
+        if not pools:
+            wanted = ", ".join(f"{k} {v}" for k, v in (("region", region), ("environment", environment)) if v)
+            raise ValueError(f"no IPv{family} pool for {wanted or 'any region'}")
+        return [str(p) for pool in pools for p in pool.prefixes if p.family == family]
+
+    def reserved_intervals(self, family=4):
+        """Reserved space of the family as merged [start, end) intervals."""
+        return list(self._reserved_intervals[family])
+
+    def reserved_prefixes(self, family=4):
+        return [p for _, prefixes in self.reserved for p in prefixes if p.family == family]
+
+    def allocator(self, used_intervals, family=4, region=None, environment=None):
+        """FreeSpaceAllocator over the selected pools with used_intervals and the reserved ranges marked used."""
+        return FreeSpaceAllocator.from_intervals(list(used_intervals) + self._reserved_intervals[family],
+                                                 self.ranges(family, region, environment))
+
+    def headroom(self, used_intervals, family=4):
+        """One row per region (pools without one under "shared"): size, what is used or reserved, and what is left."""
+        used_intervals = list(used_intervals)
+        by_region = {}
+        for pool in self.pools:
+            if any(p.family == family for p in pool.prefixes):
+                by_region.setdefault(pool.region or "shared", []).append(pool)
+        rows = []
+        for region, pools in by_region.items():
+            ranges = [str(p) for pool in pools for p in pool.prefixes if p.family == family]
+            total = sum(parse_prefix(r).num_addresses for r in ranges)
+            reserved_free = FreeSpaceAllocator.from_intervals(self._reserved_intervals[family], ranges)
+            reserved = total - fragmentation_report(reserved_free)["free_addresses"]
+            report = fragmentation_report(
+                FreeSpaceAllocator.from_intervals(used_intervals + self._reserved_intervals[family], ranges))
+            rows.append({
+                "Region": region,
+                "Pools": ", ".join(pool.name for pool in pools),
+                "Pool IPs": total,
+                "Used IPs": total - reserved - report["free_addresses"],
+                "Reserved IPs": reserved,
+                "Free IPs": report["free_addresses"],
+                "Free %": round(100 * report["free_addresses"] / total, 2) if total else 0.0,
+                "Largest Free Block": report["largest_free_block"],
+            })
+        return rows
+
+
+def parse_pools(data):
+    """Compile a pools document into a PoolPolicy.
+
+    {"pools": [{"name": "weu-prod", "region": "westeurope", "environment": "prod", "cidrs": ["10.64.0.0/12"]}],
+     "reserved": [{"name": "on-prem", "cidrs": ["10.0.0.0/10"]}]}
+    Reserved entries may also be bare CIDRs.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("a pools document must be a mapping with pools and reserved lists")
+    pools = []
+    for entry in data.get("pools") or []:
+        if not isinstance(entry, dict):
+            raise ValueError(f"pool {entry!r} must be a mapping with name, region, environment and cidrs")
+        name = entry.get("name") or f"pool-{len(pools) + 1}"
+        pools.append(Pool(name, require_prefixes(name, entry.get("cidrs")), entry.get("region"), entry.get("environment")))
+    reserved = []
+    for entry in data.get("reserved") or []:
+        if isinstance(entry, dict):
+            name = entry.get("name") or f"reserved-{len(reserved) + 1}"
+            reserved.append((name, require_prefixes(name, entry.get("cidrs"))))
+        else:
+            reserved.append((str(entry), require_prefixes("reserved", entry)))
+    # Lets a daemon tell whether a client runs with the same policy
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return PoolPolicy(pools, reserved, digest)
+
+
+def load_pools(path=None):
+    """The PoolPolicy in path (default: $CIDR_AGENT_POOLS), or None when no file is configured."""
+    path = path or POOLS_PATH
+    if not path:
+        return None
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        return parse_pools(yaml.safe_load(text))
+    return parse_pools(json.loads(text))
@@ -0,0 +1,116 @@
+import socket
+
+MAX_PREFIXLEN = {4: 32, 6: 128}
+_AF = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+
+class Prefix:
+    """A parsed IPv4 or IPv6 prefix: integer network address, prefix length and family (4 or 6).
+
+    Parse CIDR strings once with parse_prefix and pass these around; comparisons
+    and interval math are plain integer operations.
+    """
+
+    __slots__ = ("network", "prefixlen", "family", "_text")
+
+    def __init__(self, network, prefixlen, family, text=None):
+        self.network = network
+        self.prefixlen = prefixlen
+        self.family = family
+        self._text = text
+
+    @property
+    def max_prefixlen(self):
+        return MAX_PREFIXLEN[self.family]
+
+    @property
+    def num_addresses(self):
+        return 1 << (MAX_PREFIXLEN[self.family] - self.prefixlen)
+
+    # Half-open [start, end) integer interval
+    @property
+    def start(self):
+        return self.network
+
+    @property
+    def end(self):
+        return self.network + self.num_addresses
+
+    def overlaps(self, other):
+        return self.family == other.family and self.network < other.end and other.network < self.end
+
+    def contains(self, other):
+        return self.family == other.family and self.network <= other.network and other.end <= self.end
+
+    def _key(self):
+        return self.family, self.network, self.prefixlen
+
+    def __eq__(self, other):
+        return isinstance(other, Prefix) and self._key() == other._key()
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        if self._text is None:
+            self._text = format_prefix(self.network, self.prefixlen, self.family)
+        return self._text
+
+    def __repr__(self):
+        return f"Prefix('{self}')"
+
+
+def format_prefix(network, prefixlen, family=4):
+    packed = network.to_bytes(MAX_PREFIXLEN[family] // 8, "big")
+    return f"{socket.inet_ntop(_AF[family], packed)}/{prefixlen}"
+
+
+def parse_prefix(cidr):
+    """Parse an IPv4 or IPv6 CIDR string into a Prefix, clearing host bits; None if it is not one.
+
+    A Prefix is returned unchanged, so callers can accept either.
+    """
+    if isinstance(cidr, Prefix):
+        return cidr
+    address, _, length = cidr.strip().partition("/")
+    family = 6 if ":" in address else 4
+    max_prefixlen = MAX_PREFIXLEN[family]
+    try:
+        address_int = int.from_bytes(socket.inet_pton(_AF[family], address), "big")
+        prefixlen = int(length) if length else max_prefixlen
+    except (OSError, ValueError):
+        return None
+    if not 0 <= prefixlen <= max_prefixlen:
+        return None
+    network = address_int & ~((1 << (max_prefixlen - prefixlen)) - 1)
+    # Keep the caller's text for display unless host bits had to be cleared
+    text = cidr.strip() if network == address_int and length else None
+    return Prefix(network, prefixlen, family, text)
+
+
+def parse_prefixes(cidrs):
+    """Parse CIDR strings into Prefixes, dropping empty and invalid entries."""
+    prefixes = []
+    for cidr in cidrs or ():
+        prefix = parse_prefix(cidr) if cidr else None
+        if prefix is not None:
+            prefixes.append(prefix)
+    return prefixes
+
+
+def require_prefixes(owner, cidrs):
+    """Parse a CIDR string or list of them from a config file, raising ValueError naming owner on a bad or missing one."""
+    if isinstance(cidrs, str):
+        cidrs = [cidrs]
+    prefixes = []
+    for cidr in cidrs or []:
+        prefix = parse_prefix(str(cidr))
+        if prefix is None:
+            raise ValueError(f"{owner}: {cidr!r} is not a CIDR")
+        prefixes.append(prefix)
+    if not prefixes:
+        raise ValueError(f"{owner}: no cidrs given")
+    return prefixes
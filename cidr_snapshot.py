@@ -0,0 +1,157 @@
+import json
+import os
+import sqlite3
+import time
+
+from cidr_inventory import Inventory, NicRecord, SubnetRecord, VNetRecord
+from cidr_metrics import timed
+from cidr_prefix import Prefix
+
+SNAPSHOT_DIR = os.environ.get("CIDR_AGENT_SNAPSHOT_DIR", os.path.join(os.path.expanduser("~"), ".cidr_agent"))
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE vnets (id TEXT PRIMARY KEY, name TEXT, resource_group TEXT);
+CREATE TABLE subnets (id TEXT PRIMARY KEY, vnet_id TEXT NOT NULL, name TEXT);
+-- One row per VNet address prefix or subnet prefix, already parsed. IPv4 rows
+-- carry their [start, end) range as integers so the allocator can skip parsing;
+-- IPv6 addresses do not fit SQLite's 64-bit INTEGER, so those rows store the
+-- network as a 16-byte big-endian BLOB in start and leave end NULL
+CREATE TABLE prefixes (owner_id TEXT NOT NULL, kind TEXT NOT NULL, prefix TEXT NOT NULL,
+                       family INTEGER NOT NULL, prefixlen INTEGER NOT NULL, start, "end" INTEGER);
+CREATE TABLE nics (id TEXT PRIMARY KEY, name TEXT);
+CREATE TABLE nic_ip_configurations (nic_id TEXT NOT NULL, subnet_id TEXT, private_ip TEXT);
+CREATE INDEX prefixes_start ON prefixes (start);
+CREATE INDEX subnets_vnet ON subnets (vnet_id);
+"""
+
+
+def snapshot_path(scope):
+    """Snapshot file for a subscription id, or "tenant" for the tenant-wide crawl."""
+    return os.path.join(SNAPSHOT_DIR, f"inventory-{scope}.sqlite")
+
+
+def _prefix_row(owner_id, kind, prefix):
+    if prefix.family == 6:
+        return owner_id, kind, str(prefix), 6, prefix.prefixlen, prefix.network.to_bytes(16, "big"), None
+    return owner_id, kind, str(prefix), 4, prefix.prefixlen, prefix.start, prefix.end
+
+
+def _row_prefix(text, family, prefixlen, start):
+    network = int.from_bytes(start, "big") if family == 6 else start
+    return Prefix(network, prefixlen, family, text)
+
+
+@timed()
+def save_snapshot(inventory, path, subscription_ids=None):
+    """Write the inventory to a SQLite snapshot, replacing any existing file atomically."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        meta = {
+            "schema_version": SCHEMA_VERSION,
+            "collected_at": inventory.collected_at,
+            "reconciled_at": inventory.reconciled_at,
+            "subscription_ids": subscription_ids if subscription_ids is not None else inventory.subscription_ids,
+            "nics_loaded": inventory.nics_loaded,
+        }
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+        conn.executemany("INSERT INTO vnets VALUES (?, ?, ?)",
+                         [(v.id, v.name, v.resource_group) for v in inventory.vnets])
+        conn.executemany("INSERT INTO subnets VALUES (?, ?, ?)",
+                         [(s.id, v.id, s.name) for v, s in inventory.iter_subnets()])
+        prefixes = [_prefix_row(v.id, "vnet", p) for v in inventory.vnets for p in v.prefixes]
+        prefixes += [_prefix_row(s.id, "subnet", p) for _, s in inventory.iter_subnets() for p in s.prefixes]
+        conn.executemany("INSERT INTO prefixes VALUES (?, ?, ?, ?, ?, ?, ?)", prefixes)
+        conn.executemany("INSERT INTO nics VALUES (?, ?)", [(n.id, n.name) for n in inventory.nics])
+        conn.executemany("INSERT INTO nic_ip_configurations VALUES (?, ?, ?)",
+                         [(n.id, subnet_id, ip) for n in inventory.nics for subnet_id, ip in n.ip_configurations])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """Read-only view of a saved inventory; tables are only read when asked for."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.execute("PRAGMA mmap_size = 268435456")
+        meta = {k: json.loads(v) for k, v in self._conn.execute("SELECT key, value FROM meta")}
+        if meta.get("schema_version") != SCHEMA_VERSION:
+            self._conn.close()
+            raise ValueError(f"{path} has snapshot schema {meta.get('schema_version')}, expected {SCHEMA_VERSION}")
+        self.collected_at = meta["collected_at"]
+        self.reconciled_at = meta.get("reconciled_at", self.collected_at)
+        self.subscription_ids = meta["subscription_ids"]
+        # Snapshots saved before the flag existed had NICs exactly when they stored some
+        self.nics_loaded = meta.get("nics_loaded")
+
+    def age(self):
+        return time.time() - self.collected_at
+
+    def close(self):
+        self._conn.close()
+
+    def used_cidrs(self):
+        return {row[0] for row in self._conn.execute("SELECT DISTINCT prefix FROM prefixes")}
+
+    @timed("snapshot_used_intervals")
+    def used_intervals(self, family=4):
+        """[start, end) integer ranges of every stored prefix of one family, sorted by start."""
+        if family == 4:
+            return self._conn.execute('SELECT start, "end" FROM prefixes WHERE family = 4 ORDER BY start').fetchall()
+        intervals = []
+        for start, prefixlen in self._conn.execute("SELECT start, prefixlen FROM prefixes WHERE family = 6 ORDER BY start"):
+            network = int.from_bytes(start, "big")
+            intervals.append((network, network + (1 << (128 - prefixlen))))
+        return intervals
+
+    @timed("load_snapshot")
+    def load_inventory(self):
+        """Rebuild the full Inventory model from the snapshot."""
+        inventory = Inventory(collected_at=self.collected_at)
+        inventory.reconciled_at = self.reconciled_at
+        inventory.subscription_ids = list(self.subscription_ids)
+        if len(self.subscription_ids) == 1:
+            inventory.subscription_id = self.subscription_ids[0]
+        vnet_prefixes = {}
+        subnet_prefixes = {}
+        rows = self._conn.execute("SELECT owner_id, kind, prefix, family, prefixlen, start FROM prefixes ORDER BY rowid")
+        for owner_id, kind, text, family, prefixlen, start in rows:
+            owners = vnet_prefixes if kind == "vnet" else subnet_prefixes
+            owners.setdefault(owner_id, []).append(_row_prefix(text, family, prefixlen, start))
+        subnets = {}
+        for subnet_id, vnet_id, name in self._conn.execute("SELECT id, vnet_id, name FROM subnets"):
+            subnets.setdefault(vnet_id, []).append(SubnetRecord(subnet_id, name, subnet_prefixes.get(subnet_id, [])))
+        for vnet_id, name, resource_group in self._conn.execute("SELECT id, name, resource_group FROM vnets"):
+            inventory.vnets.append(VNetRecord(vnet_id, name, resource_group,
+                                              vnet_prefixes.get(vnet_id, []), subnets.get(vnet_id, [])))
+        ip_configurations = {}
+        for nic_id, subnet_id, ip in self._conn.execute("SELECT nic_id, subnet_id, private_ip FROM nic_ip_configurations"):
+            ip_configurations.setdefault(nic_id, []).append((subnet_id, ip))
+        for nic_id, name in self._conn.execute("SELECT id, name FROM nics"):
+            inventory.nics.append(NicRecord(nic_id, name, ip_configurations.get(nic_id, [])))
+        inventory.nics_loaded = bool(inventory.nics) if self.nics_loaded is None else self.nics_loaded
+        return inventory
+
+
+def open_snapshot(path, max_age=None):
+    """Open a snapshot if it exists and is no older than max_age seconds, else None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+    except (sqlite3.Error, KeyError, ValueError):
+        return None
+    if max_age is not None and snapshot.age() > max_age:
+        snapshot.close()
+        return None
+    return snapshot
@@ -0,0 +1,599 @@
+import bisect
+import json
+from collections import Counter
+
+from cidr_allocator import FreeSpaceAllocator, merge_intervals, subtract_intervals
+from cidr_analysis import family_ranges
+from cidr_inventory import AZURE_RESERVED_IPS, Inventory, SubnetRecord, VNetRecord, subnet_ip_usage
+from cidr_metrics import timed
+from cidr_planner import block_histogram, histogram_report
+from cidr_prefix import MAX_PREFIXLEN, require_prefixes
+
+# Offline what-if: apply planned deletes and adds to an inventory without touching
+# Azure, then compare free space, suggestions, conflicts and utilization.
+
+EXAMPLE = """\
+delete:
+  vnets:
+    - {name: vnet-legacy, resource_group: rg-legacy}
+  subnets:
+    - {vnet: vnet-hub, resource_group: rg-network, name: snet-old}
+add:
+  vnets:
+    - name: vnet-new-app
+      resource_group: rg-app
+      cidrs: [10.200.0.0/22]
+      subnets:
+        - {name: snet-web, cidrs: [10.200.0.0/24]}
+        - {name: snet-db, cidrs: [10.200.1.0/26]}
+  subnets:
+    - {vnet: vnet-hub, resource_group: rg-network, name: snet-new, cidrs: [10.0.5.0/27]}
+"""
+
+
+# First of the given keys present in a change set entry; the find_unused_subnets and
+# export column names ("VNet Name", "Subnet Name", "Resource Group") work as well
+def _field(entry, *names):
+    for name in names:
+        if entry.get(name):
+            return entry[name]
+    return None
+
+
+# A VNet as a lowercased resource id, or (name, resource group) lowercased
+def _vnet_key(entry):
+    if isinstance(entry, str):
+        return entry.lower()
+    name = _field(entry, "vnet", "name", "VNet Name")
+    resource_group = _field(entry, "resource_group", "Resource Group")
+    if not name or not resource_group:
+        raise ValueError(f"{entry!r}: a VNet needs a resource id, or a name and resource_group")
+    return name.lower(), resource_group.lower()
+
+
+# A subnet as (VNet key, lowercased subnet name)
+def _subnet_key(entry):
+    if isinstance(entry, str):
+        vnet_id, _, name = entry.lower().partition("/subnets/")
+        if not name:
+            raise ValueError(f"{entry!r} is not a subnet resource id")
+        return vnet_id, name
+    name = _field(entry, "name", "subnet", "Subnet Name")
+    if not name:
+        raise ValueError(f"{entry!r}: a subnet needs a name")
+    return _vnet_key({k: v for k, v in entry.items() if k != "name"}), name.lower()
+
+
+class ChangeSet:
+    """Planned deletes and adds of VNets and subnets. Nothing here is ever sent to Azure."""
+
+    def __init__(self, delete_vnets=(), delete_subnets=(), add_vnets=(), add_subnets=()):
+        # VNet keys (see _vnet_key)
+        self.delete_vnets = list(delete_vnets)
+        # Subnet keys (see _subnet_key)
+        self.delete_subnets = list(delete_subnets)
+        # (name, resource group, prefixes, [(subnet name, prefixes)])
+        self.add_vnets = list(add_vnets)
+        # (VNet key, subnet name, prefixes)
+        self.add_subnets = list(add_subnets)
+
+    def __len__(self):
+        return len(self.delete_vnets) + len(self.delete_subnets) + len(self.add_vnets) + len(self.add_subnets)
+
+    def with_deleted_subnets(self, rows):
+        """A copy that also deletes the subnets in rows: subnet resource ids (see unused_subnet_ids) or idle_subnets rows."""
+        return ChangeSet(self.delete_vnets, self.delete_subnets + [_subnet_key(row) for row in rows],
+                         self.add_vnets, self.add_subnets)
+
+
+def parse_changes(data):
+    """Build a ChangeSet from a parsed YAML/JSON document (see EXAMPLE)."""
+    if not isinstance(data, dict):
+        raise ValueError("a change set must be a mapping with delete and add sections")
+    delete = data.get("delete") or {}
+    add = data.get("add") or {}
+    add_vnets = []
+    for entry in add.get("vnets") or []:
+        name = _field(entry, "name", "VNet Name")
+        resource_group = _field(entry, "resource_group", "Resource Group")
+        if not name or not resource_group:
+            raise ValueError(f"{entry!r}: a new VNet needs a name and resource_group")
+        subnets = [(subnet["name"], require_prefixes(f"{name}/{subnet['name']}", subnet.get("cidrs")))
+                   for subnet in entry.get("subnets") or []]
+        add_vnets.append((name, resource_group, require_prefixes(name, entry.get("cidrs")), subnets))
+    add_subnets = []
+    for entry in add.get("subnets") or []:
+        vnet_key, _ = _subnet_key(entry)
+        name = _field(entry, "name", "subnet", "Subnet Name")
+        add_subnets.append((vnet_key, name, require_prefixes(name, entry.get("cidrs"))))
+    return ChangeSet(
+        [_vnet_key(entry) for entry in delete.get("vnets") or []],
+        [_subnet_key(entry) for entry in delete.get("subnets") or []],
+        add_vnets,
+        add_subnets,
+    )
+
+
+def load_changes(path):
+    """Read a change set from a .yaml/.yml or .json file."""
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        return parse_changes(yaml.safe_load(text))
+    return parse_changes(json.loads(text))
+
+
+def unused_subnet_ids(inventory, usage):
+    """Resource ids of the subnets idle_subnets lists, for ChangeSet.with_deleted_subnets.
+
+    Ids rather than names, since VNet names repeat across subscriptions.
+    """
+    return [subnet.id for _, subnet in inventory.iter_subnets() if not usage.get(subnet.id.lower())]
+
+
+class SimulatedInventory(Inventory):
+    """A base inventory with a ChangeSet applied.
+
+    Copy-on-write: VNets the changes do not touch, their subnets and every NIC are
+    the base's own records. Only changed VNets get new records, so analyses that
+    take an Inventory run on it unchanged.
+    """
+
+    def __init__(self, base, replaced=None, added_vnets=()):
+        super().__init__(base.subscription_id, base.collected_at)
+        self.subscription_ids = base.subscription_ids
+        self.reconciled_at = base.reconciled_at
+        self.nics = base.nics
+        self.nics_loaded = base.nics_loaded
+        self.base = base
+        # Base VNet index -> its new record, or None if deleted
+        self._replaced = replaced or {}
+        self._vnets = None
+        # family -> (allocator, per-range block histograms), filled in by Simulation
+        self._spaces = {}
+        self.deleted_vnets = []
+        self.added_vnets = list(added_vnets)
+        self.modified_vnets = 0
+        # Subnets gone with their VNet or on their own, and subnets added to existing VNets
+        self.deleted_subnets = []
+        self.added_subnets = []
+        # VNet and subnet prefixes the changes drop and add, duplicates included
+        self.removed_prefixes = []
+        self.added_prefixes = []
+
+    # Built on first use only, since evaluating a scenario never needs the whole list
+    @property
+    def vnets(self):
+        if self._vnets is None:
+            vnets = list(self.base.vnets)
+            for i, record in self._replaced.items():
+                vnets[i] = record
+            self._vnets = [vnet for vnet in vnets if vnet is not None] + self.added_vnets
+        return self._vnets
+
+    @vnets.setter
+    def vnets(self, vnets):
+        self._vnets = vnets
+
+    def summary(self):
+        return {
+            "VNets deleted": len(self.deleted_vnets),
+            "VNets added": len(self.added_vnets),
+            "VNets changed": self.modified_vnets,
+            "Subnets deleted": len(self.deleted_subnets),
+            "Subnets added": len(self.added_subnets) + sum(len(vnet.subnets) for vnet in self.added_vnets),
+        }
+
+
+# Every prefix must sit inside one of the VNet's prefixes, and sibling subnets must not overlap
+def _check_subnet(vnet, name, prefixes):
+    for prefix in prefixes:
+        if not any(parent.contains(prefix) for parent in vnet.prefixes):
+            raise ValueError(f"subnet {name} ({prefix}) is outside {vnet.name}'s address space")
+        for sibling in vnet.subnets:
+            if any(prefix.overlaps(p) for p in sibling.prefixes):
+                raise ValueError(f"subnet {name} ({prefix}) overlaps {sibling.name} in {vnet.name}")
+
+
+def _relation(a, b):
+    if a.start == b.start and a.end == b.end:
+        return "identical"
+    return "contains" if a.start <= b.start and b.end <= a.end else "inside"
+
+
+def _conflict_row(a, prefix_a, b, prefix_b):
+    return {
+        "VNet A": a.name,
+        "CIDR A": str(prefix_a),
+        "Resource Group A": a.resource_group,
+        "Relation": _relation(prefix_a, prefix_b),
+        "VNet B": b.name,
+        "CIDR B": str(prefix_b),
+        "Resource Group B": b.resource_group,
+    }
+
+
+class Simulation:
+    """Evaluates change sets against one base inventory.
+
+    What every scenario needs from the base (merged used space, a count of each
+    VNet and subnet block, subnet usage, conflicts and the unchanged answers) is
+    built once here and shared. A scenario reads the base's used intervals through
+    an allocator overlay and patches them, so evaluating it costs time in
+    proportion to its changes rather than to the estate; only asking for a
+    simulated inventory's full VNet list or used_intervals walks everything. With a PoolPolicy, free space and
+    suggestions are measured in its pools with its reserved ranges held back.
+    Utilization comes from nics (default: the base's own).
+    """
+
+    @timed("build_simulation")
+    def __init__(self, base, policy=None, nics=None):
+        self.base = base
+        self.policy = policy
+        # Without NICs, used IPs are unknown rather than zero
+        known = nics is not None or base.nics_loaded
+        self.usage = subnet_ip_usage(base.nics if nics is None else nics, family=4) if known else None
+        # Lowercased resource id -> index; ids are unique across subscriptions, names are not
+        self._vnet_index = {}
+        # (name, resource group) lowercased -> indexes of the VNets with that name
+        self._vnet_names = {}
+        # (start, end) -> how many VNet and subnet prefixes are exactly that block, per family
+        self._counts = {4: Counter(), 6: Counter()}
+        # Same for VNet prefixes only, to the indexes of the VNets holding them
+        self._vnet_blocks = {4: {}, 6: {}}
+        for i, vnet in enumerate(base.vnets):
+            self._vnet_index[vnet.id.lower()] = i
+            self._vnet_names.setdefault((vnet.name.lower(), (vnet.resource_group or "").lower()), []).append(i)
+            for prefix in vnet.prefixes:
+                self._counts[prefix.family][prefix.start, prefix.end] += 1
+                self._vnet_blocks[prefix.family].setdefault((prefix.start, prefix.end), []).append(i)
+            for subnet in vnet.subnets:
+                for prefix in subnet.prefixes:
+                    self._counts[prefix.family][prefix.start, prefix.end] += 1
+        self._blocks = {family: sorted(counts) for family, counts in self._counts.items()}
+        self._sorted_vnet_blocks = {family: sorted(blocks) for family, blocks in self._vnet_blocks.items()}
+        self._used = {family: [(s, e) for s, e in merge_intervals(counts)] for family, counts in self._counts.items()}
+        self._utilization = self._subnet_totals(subnet for _, subnet in base.iter_subnets())
+        self._conflicts = None
+        self._base_answers = {}
+
+    def _find_vnet(self, key):
+        if isinstance(key, str):
+            found = [self._vnet_index[key]] if key in self._vnet_index else []
+            name = key
+        else:
+            found = self._vnet_names.get(key, [])
+            name = f"{key[0]} in {key[1]}"
+        if not found:
+            raise ValueError(f"no VNet {name} in the inventory")
+        if len(found) > 1:
+            raise ValueError(f"VNet {name} exists in {len(found)} subscriptions; give its resource id instead")
+        return found[0]
+
+    @timed("simulate_changes")
+    def apply(self, changes):
+        """A SimulatedInventory with changes applied: deletes first, then adds. Raises ValueError on a change Azure would refuse."""
+        vnets = self.base.vnets
+        # index -> new record, or None once deleted
+        replaced = {}
+        removed = []
+        deleted_vnets = []
+        deleted_subnets = []
+        for key in changes.delete_vnets:
+            i = self._find_vnet(key)
+            if replaced.get(i, vnets[i]) is None:
+                continue
+            replaced[i] = None
+            deleted_vnets.append(vnets[i])
+            deleted_subnets.extend(vnets[i].subnets)
+            removed.extend(vnets[i].prefixes)
+            removed.extend(p for subnet in vnets[i].subnets for p in subnet.prefixes)
+        # The same subnet may be listed twice, e.g. in the file and among the unused ones
+        gone = set()
+        for vnet_key, name in changes.delete_subnets:
+            i = self._find_vnet(vnet_key)
+            current = replaced.get(i, vnets[i])
+            if current is None or (i, name) in gone:
+                continue
+            gone.add((i, name))
+            kept = [subnet for subnet in current.subnets if subnet.name.lower() != name]
+            if len(kept) == len(current.subnets):
+                raise ValueError(f"no subnet {name} in {current.name}")
+            for subnet in current.subnets:
+                if subnet.name.lower() == name:
+                    deleted_subnets.append(subnet)
+                    removed.extend(subnet.prefixes)
+            replaced[i] = VNetRecord(current.id, current.name, current.resource_group, current.prefixes, kept)
+        added = []
+        added_subnets = []
+        for vnet_key, name, prefixes in changes.add_subnets:
+            i = self._find_vnet(vnet_key)
+            current = replaced.get(i, vnets[i])
+            if current is None:
+                raise ValueError(f"cannot add subnet {name}: its VNet is deleted")
+            _check_subnet(current, name, prefixes)
+            subnet = SubnetRecord(f"{current.id}/subnets/{name}", name, prefixes)
+            replaced[i] = VNetRecord(current.id, current.name, current.resource_group, current.prefixes,
+                                     current.subnets + [subnet])
+            added_subnets.append(subnet)
+            added.extend(prefixes)
+        added_vnets = []
+        subscription_id = self.base.subscription_id or "whatif"
+        for name, resource_group, prefixes, subnets in changes.add_vnets:
+            vnet_id = (f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}"
+                       f"/providers/Microsoft.Network/virtualNetworks/{name}")
+            # Without a single subscription to put it in, any VNet of that name and resource group is a clash
+            if self.base.subscription_id:
+                existing = [self._vnet_index[vnet_id.lower()]] if vnet_id.lower() in self._vnet_index else []
+            else:
+                existing = self._vnet_names.get((name.lower(), resource_group.lower()), [])
+            if any(replaced.get(i, vnets[i]) is not None for i in existing):
+                raise ValueError(f"VNet {name} already exists in {resource_group}")
+            vnet = VNetRecord(vnet_id, name, resource_group, prefixes, [])
+            for subnet_name, subnet_prefixes in subnets:
+                _check_subnet(vnet, subnet_name, subnet_prefixes)
+                vnet.subnets.append(SubnetRecord(f"{vnet_id}/subnets/{subnet_name}", subnet_name, subnet_prefixes))
+                added.extend(subnet_prefixes)
+            added_vnets.append(vnet)
+            added.extend(prefixes)
+
+        overlay = SimulatedInventory(self.base, replaced, added_vnets)
+        overlay.deleted_vnets = deleted_vnets
+        overlay.modified_vnets = sum(1 for record in replaced.values() if record is not None)
+        overlay.deleted_subnets = deleted_subnets
+        overlay.added_subnets = added_subnets
+        overlay.removed_prefixes = removed
+        overlay.added_prefixes = added
+        return overlay
+
+    # The parts of a removed block that no remaining VNet or subnet prefix covers
+    def _uncovered(self, family, block, removed):
+        counts = self._counts[family]
+        start, end = block
+        size = end - start
+        # Aligned blocks nest, so anything covering this one is one of its parent blocks
+        while size < 1 << MAX_PREFIXLEN[family]:
+            size <<= 1
+            parent = (start - start % size, start - start % size + size)
+            if counts.get(parent, 0) > removed.get(parent, 0):
+                return []
+        # ...and anything partly covering it starts inside it
+        blocks = self._blocks[family]
+        covered = []
+        i = bisect.bisect_left(blocks, (start,))
+        while i < len(blocks) and blocks[i][0] < end:
+            if blocks[i] != block and counts[blocks[i]] > removed.get(blocks[i], 0):
+                covered.append(blocks[i])
+            i += 1
+        return subtract_intervals([block], merge_intervals(covered))
+
+    def _ranges(self, family, region=None, environment=None):
+        if self.policy is None:
+            return family_ranges(family)
+        return self.policy.ranges(family, region, environment)
+
+    # The base's used space with the reserved ranges, as an allocator over every pool
+    # (or the private ranges), its interval edges and a block histogram per range
+    def _base_space(self, family):
+        def build():
+            reserved = self.policy.reserved_intervals(family) if self.policy is not None else []
+            allocator = FreeSpaceAllocator.from_intervals(self._used[family] + reserved, self._ranges(family))
+            intervals = allocator.used_intervals()
+            histograms = [block_histogram(allocator.free_blocks(parent.start, parent.end)) for parent in allocator.ranges]
+            return allocator, [s for s, _ in intervals], [e for _, e in intervals], histograms
+        return self._base_answer(("space", family), build)
+
+    # The overlay's used space and per-range block histograms. The base intervals are
+    # patched by bisect where blocks were freed or added, and only the free space
+    # between the nearest untouched used intervals around each change is walked again.
+    def _overlay_space(self, overlay, family):
+        if family in overlay._spaces:
+            return overlay._spaces[family]
+        base, starts, ends, histograms = self._base_space(family)
+        counts = self._counts[family]
+        removed = Counter((p.start, p.end) for p in overlay.removed_prefixes if p.family == family)
+        holes = []
+        for block, times in removed.items():
+            if counts[block] <= times:
+                holes.extend(self._uncovered(family, block, removed))
+        holes = merge_intervals(holes)
+        if self.policy is not None:
+            holes = subtract_intervals(holes, self.policy.reserved_intervals(family))
+        added = [(p.start, p.end) for p in overlay.added_prefixes if p.family == family]
+        allocator = base.overlay()
+        for start, end in holes:
+            allocator.remove_interval(start, end)
+        for start, end in added:
+            allocator.add_interval(start, end)
+        # The base used intervals on either side of a change stay put, so only the free space between them can differ
+        windows = []
+        for start, end in list(holes) + added:
+            lo = bisect.bisect_left(ends, start)
+            hi = bisect.bisect_right(starts, end)
+            windows.append((ends[lo - 1] if lo else 0, starts[hi] if hi < len(starts) else 1 << MAX_PREFIXLEN[family]))
+        histograms = list(histograms)
+        for start, end in merge_intervals(windows):
+            for k, parent in enumerate(base.ranges):
+                lo, hi = max(start, parent.start), min(end, parent.end)
+                if lo >= hi:
+                    continue
+                histogram = Counter(histograms[k])
+                histogram.subtract(block_histogram(base.free_blocks(lo, hi)))
+                histogram.update(block_histogram(allocator.free_blocks(lo, hi)))
+                histograms[k] = histogram
+        overlay._spaces[family] = allocator, histograms
+        return allocator, histograms
+
+    def used_intervals(self, overlay=None, family=4):
+        """Merged used space of the base, or of a simulated inventory, with the policy's reserved ranges."""
+        if overlay is None:
+            return self._base_space(family)[0].used_intervals()
+        return self._overlay_space(overlay, family)[0].used_intervals()
+
+    def allocator(self, overlay=None, family=4, region=None, environment=None):
+        """FreeSpaceAllocator over the base's or the simulated inventory's used space, in the pools (or private ranges)."""
+        space = self._base_space(family)[0] if overlay is None else self._overlay_space(overlay, family)[0]
+        if region is None and environment is None:
+            return space
+        return space.overlay(self._ranges(family, region, environment))
+
+    # fragmentation_report of the whole space, and (size, report) per pool region, summed from the range histograms
+    def _headroom(self, overlay, family):
+        if overlay is None:
+            allocator, _, _, histograms = self._base_space(family)
+        else:
+            allocator, histograms = self._overlay_space(overlay, family)
+        max_prefixlen = MAX_PREFIXLEN[family]
+        total = Counter()
+        for histogram in histograms:
+            total.update(histogram)
+        regions = {}
+        if self.policy is not None:
+            region_of = {(p.start, p.end): pool.region or "shared" for pool in self.policy.pools for p in pool.prefixes}
+            for parent, histogram in zip(allocator.ranges, histograms):
+                region = region_of.get((parent.start, parent.end))
+                if region is not None:
+                    entry = regions.setdefault(region, [0, Counter()])
+                    entry[0] += parent.num_addresses
+                    entry[1].update(histogram)
+        return (histogram_report(total, max_prefixlen),
+                {region: (size, histogram_report(histogram, max_prefixlen)) for region, (size, histogram) in regions.items()})
+
+    def _subnet_totals(self, subnets):
+        count = total = used = 0
+        for subnet in subnets:
+            ipv4 = sum(p.num_addresses for p in subnet.prefixes if p.family == 4)
+            if ipv4:
+                count += 1
+                total += ipv4
+                if self.usage is not None:
+                    used += AZURE_RESERVED_IPS + self.usage.get(subnet.id.lower(), 0)
+        return count, total, used
+
+    def utilization(self, overlay=None):
+        """IPv4 subnet count, total and used IPs (None without NICs) and utilization %, from the base totals and the changes."""
+        count, total, used = self._utilization
+        if overlay is not None:
+            gone = self._subnet_totals(overlay.deleted_subnets)
+            new = self._subnet_totals(overlay.added_subnets + [s for vnet in overlay.added_vnets for s in vnet.subnets])
+            count, total, used = (count - gone[0] + new[0], total - gone[1] + new[1], used - gone[2] + new[2])
+        return {
+            "Subnets": count,
+            "Total IPs": total,
+            "Used IPs": used if self.usage is not None else None,
+            "Utilization %": round(100 * used / total, 1) if total and self.usage is not None else None,
+        }
+
+    def _base_conflicts(self):
+        if self._conflicts is None:
+            from cidr_conflicts import iter_vnet_conflicts
+            self._conflicts = []
+            # Lowercased VNet resource id -> indexes of the base conflicts it is part of
+            self._conflicts_by_vnet = {}
+            for n, (a, b, row) in enumerate(iter_vnet_conflicts(self.base)):
+                self._conflicts.append(row)
+                self._conflicts_by_vnet.setdefault(a.id.lower(), set()).add(n)
+                self._conflicts_by_vnet.setdefault(b.id.lower(), set()).add(n)
+        return self._conflicts
+
+    def conflict_changes(self, overlay):
+        """(indexes of the base conflicts deleted VNets resolve, conflict rows added VNets bring).
+
+        Only the added VNets' prefixes are checked, against the base VNets holding an
+        enclosing or enclosed block and against each other.
+        """
+        self._base_conflicts()
+        resolved = set()
+        for vnet in overlay.deleted_vnets:
+            resolved.update(self._conflicts_by_vnet.get(vnet.id.lower(), ()))
+        deleted = {id(vnet) for vnet in overlay.deleted_vnets}
+        vnets = self.base.vnets
+        new = []
+        for n, vnet in enumerate(overlay.added_vnets):
+            for prefix in vnet.prefixes:
+                family = prefix.family
+                start, end = prefix.start, prefix.end
+                holders = []
+                size = end - start
+                while size < 1 << MAX_PREFIXLEN[family]:
+                    size <<= 1
+                    holders.extend(self._vnet_blocks[family].get((start - start % size, start - start % size + size), ()))
+                blocks = self._sorted_vnet_blocks[family]
+                i = bisect.bisect_left(blocks, (start,))
+                while i < len(blocks) and blocks[i][0] < end:
+                    holders.extend(self._vnet_blocks[family][blocks[i]])
+                    i += 1
+                for i in dict.fromkeys(holders):
+                    if id(vnets[i]) in deleted:
+                        continue
+                    for other in vnets[i].prefixes:
+                        if other.overlaps(prefix):
+                            new.append(_conflict_row(vnets[i], other, vnet, prefix))
+                for earlier in overlay.added_vnets[:n]:
+                    for other in earlier.prefixes:
+                        if other.overlaps(prefix):
+                            new.append(_conflict_row(earlier, other, vnet, prefix))
+        return resolved, new
+
+    def conflicts(self, overlay=None):
+        """VNet conflict rows (as find_vnet_conflicts) of the base, or of a simulated inventory."""
+        base = self._base_conflicts()
+        if overlay is None:
+            return base
+        resolved, new = self.conflict_changes(overlay)
+        return [row for n, row in enumerate(base) if n not in resolved] + new
+
+    def _base_answer(self, key, compute):
+        if key not in self._base_answers:
+            self._base_answers[key] = compute()
+        return self._base_answers[key]
+
+    @timed("evaluate_changes")
+    def evaluate(self, overlay, netmasks=(24,), family=4, region=None, environment=None):
+        """Before and after: free space, the first free block per netmask, conflicts and utilization."""
+        free_before, pools_before = self._base_answer(("headroom", family), lambda: self._headroom(None, family))
+        free_after, pools_after = self._headroom(overlay, family)
+        headroom = {
+            "Family": f"IPv{family}",
+            "Free IPs Before": free_before["free_addresses"],
+            "Free IPs After": free_after["free_addresses"],
+            "Largest Free Block Before": free_before["largest_free_block"],
+            "Largest Free Block After": free_after["largest_free_block"],
+            "Fragmentation Before": free_before["fragmentation"],
+            "Fragmentation After": free_after["fragmentation"],
+        }
+        pools = [{
+            "Region": region,
+            "Free IPs Before": pools_before[region][1]["free_addresses"],
+            "Free IPs After": report["free_addresses"],
+            "Free % After": round(100 * report["free_addresses"] / size, 2) if size else 0.0,
+            "Largest Free Block After": report["largest_free_block"],
+        } for region, (size, report) in pools_after.items()]
+        base_allocator = self._base_answer(("allocator", family, region, environment),
+                                           lambda: self.allocator(None, family, region, environment))
+        allocator = self.allocator(overlay, family, region, environment)
+        suggestions = [{
+            "Netmask": f"/{netmask}",
+            "Before": self._base_answer(("suggest", family, region, environment, netmask),
+                                        lambda: base_allocator.first_free(netmask)),
+            "After": allocator.first_free(netmask),
+        } for netmask in netmasks]
+        resolved, new = self.conflict_changes(overlay)
+        conflicts_before = len(self._base_conflicts())
+        return {
+            "changes": overlay.summary(),
+            "headroom": headroom,
+            "pools": pools,
+            "suggestions": suggestions,
+            "conflicts": {
+                "before": conflicts_before,
+                "after": conflicts_before - len(resolved) + len(new),
+                "new": new,
+                "resolved": len(resolved),
+            },
+            "utilization": {"before": self.utilization(), "after": self.utilization(overlay)},
+            # Azure refuses to delete a subnet that still has NICs in it
+            "busy_deleted_subnets": [subnet.name for subnet in overlay.deleted_subnets
+                                     if self.usage is not None and self.usage.get(subnet.id.lower())],
+        }
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+from cidr_allocator import FreeSpaceAllocator
+from cidr_leases import LeaseStore, lease_first_free
+from cidr_prefix import parse_prefix
+
+# Stress test: many processes, each with many threads, leasing blocks from one
+# lease file at once. Every lease must be distinct and non-overlapping.
+# Usage: python stress_leases.py [processes] [threads] [leases_per_thread]
+
+USED = ["10.0.0.0/16", "10.1.0.0/20", "10.1.64.0/18", "10.2.0.0/24"]
+PREFIXLENS = [24, 24, 26, 28, 22]
+
+
+def lease_many(args):
+    path, threads, count = args
+    store = LeaseStore(path)
+    allocator = FreeSpaceAllocator(USED)
+
+    def worker(index):
+        tokens = []
+        for i in range(count):
+            prefixlen = PREFIXLENS[(index + i) % len(PREFIXLENS)]
+            lease = lease_first_free(store, allocator, prefixlen, owner=f"{os.getpid()}-{index}")
+            tokens.append(lease.token)
+        return tokens
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return [token for tokens in pool.map(worker, range(threads)) for token in tokens]
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 25
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "leases.sqlite")
+        LeaseStore(path)
+        start = time.perf_counter()
+        with Pool(processes) as pool:
+            tokens = [t for batch in pool.map(lease_many, [(path, threads, count)] * processes) for t in batch]
+        elapsed = time.perf_counter() - start
+
+        leased = sorted(parse_prefix(prefix) for _, prefix, _, _ in LeaseStore(path).entries())
+        used = [parse_prefix(c) for c in USED]
+        overlaps = sum(1 for a, b in zip(leased, leased[1:]) if a.end > b.start)
+        overlaps += sum(1 for p in leased for u in used if p.overlaps(u))
+        expected = processes * threads * count
+        print(f"{expected} leases from {processes} processes x {threads} threads in {elapsed:.2f}s "
+              f"({expected / elapsed:.0f}/s): {len(set(tokens))} tokens, {len(leased)} leased prefixes, "
+              f"{overlaps} overlaps")
+        if overlaps or len(leased) != expected or len(set(tokens)) != expected:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import random
+import socket
+from types import SimpleNamespace
+
+from cidr_allocator import PRIVATE_RANGES
+from cidr_prefix import format_prefix, parse_prefix
+
+# Synthetic Azure estates for benchmarks: fake NetworkManagementClient objects whose
+# list_all() pagers return SDK-shaped VirtualNetwork, NetworkInterface and LoadBalancer models.
+
+PAGE_SIZE = 100
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+VNETS_PER_RESOURCE_GROUP = 25
+# (prefix length, weight) of VNet address spaces: mostly /24-/22 with a tail of large hub ranges
+VNET_PREFIXLENS = [(26, 8), (25, 8), (24, 40), (23, 15), (22, 15), (21, 6), (20, 5), (16, 3)]
+# (subnet count, weight); a few VNets are empty shells left behind by deployments
+SUBNET_COUNTS = [(0, 5), (1, 25), (2, 25), (3, 15), (4, 15), (6, 10), (8, 5)]
+SUBNET_PREFIXLENS = [24, 24, 25, 26, 26, 27, 28]
+DUAL_STACK_SHARE = 0.1
+IDLE_SUBNET_SHARE = 0.3
+HOLE_SHARE = 0.02
+LOAD_BALANCER_EVERY = 200
+
+
+class FakePager:
+    """Stands in for azure.core.paging.ItemPaged: iterable, and by_page() yields lists of items."""
+
+    def __init__(self, items, page_size=PAGE_SIZE):
+        self._items = items
+        self.page_size = page_size
+
+    def by_page(self):
+        items = self._items() if callable(self._items) else self._items
+        page = []
+        for item in items:
+            page.append(item)
+            if len(page) == self.page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _address(value):
+    return socket.inet_ntoa(value.to_bytes(4, "big"))
+
+
+def _resource_id(kind, resource_group, name):
+    return (f"/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{resource_group}"
+            f"/providers/Microsoft.Network/{kind}/{name}")
+
+
+class _Packer:
+    """Places blocks left to right through the private ranges, aligned, with occasional holes.
+
+    Once the ranges are full it starts again from the bottom, like estates that reuse
+    the same ranges in isolated VNets.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.ranges = [parse_prefix(r) for r in PRIVATE_RANGES]
+        self.index = 0
+        self.cursor = self.ranges[0].start
+
+    def place(self, prefixlen):
+        size = 1 << (32 - prefixlen)
+        while True:
+            parent = self.ranges[self.index]
+            start = -(-self.cursor // size) * size
+            if prefixlen >= parent.prefixlen and start + size <= parent.end:
+                break
+            self.index = (self.index + 1) % len(self.ranges)
+            self.cursor = self.ranges[self.index].start
+        self.cursor = start + size
+        # A deleted VNet leaves its block free
+        if self.rng.random() < HOLE_SHARE:
+            self.cursor += size
+        return start
+
+
+class SyntheticEstate:
+    """num_vnets VNets with subnets, NICs and internal load balancers, generated from seed.
+
+    VNets are returned in a shuffled order, as list_all does not sort them by address.
+    NICs are generated as their pager is drained, so large estates stay cheap to hold.
+    """
+
+    def __init__(self, num_vnets, seed=42, nics_per_subnet=4):
+        self.num_vnets = num_vnets
+        self.seed = seed
+        self.nics_per_subnet = nics_per_subnet
+        rng = random.Random(seed)
+        packer = _Packer(rng)
+        self.vnets = []
+        # (subnet id, first IPv4 address, NIC count) per subnet with NICs
+        self._nic_plan = []
+        for i in range(num_vnets):
+            self.vnets.append(self._vnet(rng, packer, i))
+        rng.shuffle(self.vnets)
+        self.num_subnets = sum(len(vnet.subnets) for vnet in self.vnets)
+        self.num_nics = sum(count for _, _, count in self._nic_plan)
+
+    def _vnet(self, rng, packer, index):
+        name = f"vnet-{index:06d}"
+        resource_group = f"rg-{index // VNETS_PER_RESOURCE_GROUP:05d}"
+        vnet_id = _resource_id("virtualNetworks", resource_group, name)
+        prefixlen = _weighted(rng, VNET_PREFIXLENS)
+        start = packer.place(prefixlen)
+        address_prefixes = [format_prefix(start, prefixlen)]
+        ipv6 = rng.random() < DUAL_STACK_SHARE
+        if ipv6:
+            # One /48 per dual-stack VNet, under fd00::/8
+            ipv6_start = (0xFD << 120) | (index << 80)
+            address_prefixes.append(format_prefix(ipv6_start, 48, 6))
+
+        count = _weighted(rng, SUBNET_COUNTS)
+        subnet_prefixlen = max(prefixlen + max(count - 1, 0).bit_length(), rng.choice(SUBNET_PREFIXLENS))
+        subnet_prefixlen = min(subnet_prefixlen, 29)
+        subnet_size = 1 << (32 - subnet_prefixlen)
+        subnets = []
+        for n in range(count):
+            subnet_name = f"snet-{n}"
+            subnet_id = f"{vnet_id}/subnets/{subnet_name}"
+            subnet_start = start + n * subnet_size
+            cidr = format_prefix(subnet_start, subnet_prefixlen)
+            if ipv6:
+                # Dual-stack subnets list both prefixes in address_prefixes and leave address_prefix empty
+                cidrs = [cidr, format_prefix(ipv6_start | (n << 64), 64, 6)]
+                subnets.append(SimpleNamespace(id=subnet_id, name=subnet_name, address_prefix=None, address_prefixes=cidrs))
+            else:
+                subnets.append(SimpleNamespace(id=subnet_id, name=subnet_name, address_prefix=cidr, address_prefixes=None))
+            if rng.random() >= IDLE_SUBNET_SHARE:
+                nics = 1 + int(rng.expovariate(1 / self.nics_per_subnet))
+                self._nic_plan.append((subnet_id, subnet_start + 4, min(nics, subnet_size - 5)))
+
+        return SimpleNamespace(
+            id=vnet_id,
+            name=name,
+            address_space=SimpleNamespace(address_prefixes=address_prefixes),
+            subnets=subnets,
+        )
+
+    def _nics(self):
+        for subnet_id, first_ip, count in self._nic_plan:
+            subnet = SimpleNamespace(id=subnet_id)
+            resource_group = subnet_id.split("/")[4]
+            for n in range(count):
+                name = f"nic-{first_ip + n:x}"
+                ipconf = SimpleNamespace(subnet=subnet, private_ip_address=_address(first_ip + n))
+                yield SimpleNamespace(id=_resource_id("networkInterfaces", resource_group, name), name=name,
+                                      ip_configurations=[ipconf])
+
+    def _load_balancers(self):
+        # One internal load balancer per LOAD_BALANCER_EVERY subnets with NICs, on the address after them
+        for subnet_id, first_ip, count in self._nic_plan[::LOAD_BALANCER_EVERY]:
+            resource_group = subnet_id.split("/")[4]
+            name = f"ilb-{first_ip:x}"
+            lb_id = _resource_id("loadBalancers", resource_group, name)
+            frontend = SimpleNamespace(id=f"{lb_id}/frontendIPConfigurations/fe", name="fe",
+                                       subnet=SimpleNamespace(id=subnet_id),
+                                       private_ip_address=_address(first_ip + count))
+            yield SimpleNamespace(id=lb_id, name=name, frontend_ip_configurations=[frontend])
+
+    def client(self):
+        """A fake NetworkManagementClient serving this estate."""
+        return SimpleNamespace(
+            virtual_networks=SimpleNamespace(list_all=lambda **kwargs: FakePager(self.vnets)),
+            network_interfaces=SimpleNamespace(list_all=lambda **kwargs: FakePager(self._nics)),
+            load_balancers=SimpleNamespace(list_all=lambda **kwargs: FakePager(self._load_balancers)),
+        )
@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from cidr_allocator import FreeSpaceAllocator
+from cidr_prefix import format_prefix
+
+# A /22 of addresses keeps a brute-force scan of every address cheap
+RANGES = ["10.0.0.0/23", "10.0.4.0/24"]
+BASE = 10 << 24
+
+
+def used_addresses(allocator):
+    return {a for start, end in allocator.used_intervals() for a in range(start, end)}
+
+
+def range_addresses(ranges):
+    return [a for r in ranges for a in range(r.start, r.end)]
+
+
+# The first aligned /prefixlen block, in range order, with no used address in it
+def brute_first_free(used, ranges, prefixlen):
+    size = 1 << (32 - prefixlen)
+    for parent in ranges:
+        if prefixlen < parent.prefixlen:
+            continue
+        for start in range(parent.start, parent.end, size):
+            if not any(a in used for a in range(start, start + size)):
+                return format_prefix(start, prefixlen)
+    return None
+
+
+def random_cidr(rng):
+    prefixlen = rng.randint(24, 32)
+    size = 1 << (32 - prefixlen)
+    return format_prefix(BASE + rng.randrange(0, 1 << 11, size), prefixlen)
+
+
+def test_first_free_is_aligned_and_first():
+    allocator = FreeSpaceAllocator(["10.0.0.0/26", "10.0.0.96/27"], ["10.0.0.0/24"])
+    assert allocator.first_free(26) == "10.0.0.128/26"
+    assert allocator.first_free(27) == "10.0.0.64/27"
+    assert allocator.first_free(28) == "10.0.0.64/28"
+    assert allocator.first_free(24) is None
+    assert allocator.first_free(33) is None
+
+
+def test_allocate_matches_brute_force():
+    rng = random.Random(1)
+    for _ in range(50):
+        allocator = FreeSpaceAllocator([random_cidr(rng) for _ in range(rng.randint(0, 12))], RANGES)
+        for _ in range(10):
+            prefixlen = rng.randint(23, 32)
+            expected = brute_first_free(used_addresses(allocator), allocator.ranges, prefixlen)
+            assert allocator.allocate(prefixlen) == expected
+            if expected:
+                assert not allocator.is_free(expected)
+
+
+def test_add_and_remove_interval_match_brute_force():
+    rng = random.Random(2)
+    for _ in range(100):
+        allocator = FreeSpaceAllocator([random_cidr(rng) for _ in range(rng.randint(0, 8))], RANGES)
+        used = used_addresses(allocator)
+        for _ in range(10):
+            start = BASE + rng.randrange(1 << 11)
+            end = start + rng.randint(1, 300)
+            if rng.random() < 0.5:
+                allocator.add_interval(start, end)
+                used.update(range(start, end))
+            else:
+                allocator.remove_interval(start, end)
+                used.difference_update(range(start, end))
+            intervals = allocator.used_intervals()
+            assert used_addresses(allocator) == used
+            # Still merged: sorted, with a gap between neighbours
+            assert all(e1 < s2 for (_, e1), (s2, _) in zip(intervals, intervals[1:]))
+            free = [a for a in range_addresses(allocator.ranges) if a not in used]
+            assert sum(1 << (32 - prefixlen) for _, prefixlen in allocator.free_blocks()) == len(free)
+
+
+def test_with_used_within_and_overlay_leave_the_original_alone():
+    rng = random.Random(3)
+    for _ in range(50):
+        allocator = FreeSpaceAllocator([random_cidr(rng) for _ in range(6)], RANGES)
+        before = allocator.used_intervals()
+        extra = [random_cidr(rng) for _ in range(4)]
+
+        combined = allocator.with_used(extra + ["fd00::/64", None])
+        assert used_addresses(combined) == used_addresses(allocator) | used_addresses(FreeSpaceAllocator(extra, RANGES))
+
+        narrow = allocator.within(["10.0.1.0/24"])
+        overlay = allocator.overlay(["10.0.1.0/24"])
+        for prefixlen in (24, 26, 28, 30):
+            expected = brute_first_free(used_addresses(allocator), narrow.ranges, prefixlen)
+            assert narrow.first_free(prefixlen) == overlay.first_free(prefixlen) == expected
+        for view in (narrow, overlay):
+            view.allocate(28)
+            view.remove_interval(BASE, BASE + 64)
+        assert narrow.used_intervals() == overlay.used_intervals()
+        assert allocator.used_intervals() == before
+
+
+def test_ipv6_and_mixed_ranges():
+    allocator = FreeSpaceAllocator(["fd00::/64", "10.0.0.0/24"], ["fd00::/56"])
+    assert allocator.family == 6
+    assert allocator.first_free(64) == "fd00:0:0:1::/64"
+    with pytest.raises(ValueError):
+        FreeSpaceAllocator((), ["10.0.0.0/8", "fd00::/8"])
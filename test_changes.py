@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from cidr_changes import NIC_TYPE, SUBNET_TYPE, VNET_TYPE, InventoryRefresher
+
+SUB = "/subscriptions/sub-1/resourceGroups/rg/providers/Microsoft.Network"
+
+
+def vnet_id(name):
+    return f"{SUB}/virtualNetworks/{name}"
+
+
+def nic_id(name):
+    return f"{SUB}/networkInterfaces/{name}"
+
+
+class FakeArm:
+    """The current state of one subscription, read the way the network SDK client does."""
+
+    def __init__(self):
+        # VNet name -> (address prefixes, {subnet name: prefix})
+        self.vnets = {}
+        # NIC name -> (VNet name, subnet name, private IP)
+        self.nics = {}
+
+    def vnet(self, name):
+        prefixes, subnets = self.vnets[name]
+        return SimpleNamespace(
+            id=vnet_id(name), name=name,
+            address_space=SimpleNamespace(address_prefixes=list(prefixes)),
+            subnets=[SimpleNamespace(id=f"{vnet_id(name)}/subnets/{s}", name=s, address_prefixes=None, address_prefix=p)
+                     for s, p in subnets.items()],
+        )
+
+    def nic(self, name):
+        vnet, subnet, ip = self.nics[name]
+        return SimpleNamespace(id=nic_id(name), name=name, ip_configurations=[
+            SimpleNamespace(subnet=SimpleNamespace(id=f"{vnet_id(vnet)}/subnets/{subnet}"), private_ip_address=ip)])
+
+    def client(self, subscription_id):
+        return SimpleNamespace(
+            virtual_networks=SimpleNamespace(list_all=lambda **kw: Paged([self.vnet(n) for n in self.vnets]),
+                                             get=lambda rg, name, **kw: self._get(self.vnet, name)),
+            network_interfaces=SimpleNamespace(list_all=lambda **kw: Paged([self.nic(n) for n in self.nics]),
+                                               get=lambda rg, name, **kw: self._get(self.nic, name)),
+            load_balancers=SimpleNamespace(list_all=lambda **kw: Paged([])),
+        )
+
+    def _get(self, read, name):
+        try:
+            return read(name)
+        except KeyError:
+            raise ResourceNotFoundError(f"{name} not found")
+
+
+class Paged:
+    def __init__(self, items):
+        self.items = items
+
+    def by_page(self):
+        return iter([self.items[:2], self.items[2:]])
+
+
+class FakeResourceGraph:
+    """Serves canned resourcechanges rows in pages of two, linked by skip tokens."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+
+    def resources(self, request, **kwargs):
+        self.requests.append(request)
+        start = int(request.options.skip_token or 0)
+        more = start + 2 < len(self.rows)
+        return SimpleNamespace(data=self.rows[start:start + 2], skip_token=str(start + 2) if more else None)
+
+
+def change(resource_id, resource_type, change_type):
+    return {"targetResourceId": resource_id, "targetResourceType": resource_type, "changeType": change_type}
+
+
+def snapshot(inventory):
+    vnets = sorted((v.id.lower(), v.name, v.resource_group, v.address_prefixes,
+                    sorted((s.id.lower(), s.address_prefixes) for s in v.subnets)) for v in inventory.vnets)
+    nics = sorted((n.id.lower(), n.ip_configurations) for n in inventory.nics)
+    return vnets, nics
+
+
+def test_incremental_refresh_matches_full_reload():
+    arm = FakeArm()
+    arm.vnets = {
+        "vnet-a": (["10.1.0.0/16"], {"s1": "10.1.0.0/24"}),
+        "vnet-b": (["10.2.0.0/16"], {}),
+        "vnet-c": (["10.3.0.0/16"], {"s1": "10.3.0.0/24"}),
+    }
+    arm.nics = {"nic-1": ("vnet-a", "s1", "10.1.0.4"), "nic-2": ("vnet-c", "s1", "10.3.0.4")}
+    graph = FakeResourceGraph([])
+    refresher = InventoryRefresher(arm.client, graph, ["sub-1"])
+    refresher.refresh()
+    assert refresher.last_refresh_mode == "full"
+
+    # Changes made in Azure since the crawl, and the feed rows Resource Graph reports for them
+    del arm.vnets["vnet-b"]
+    arm.vnets["vnet-c"] = (["10.3.0.0/16", "10.30.0.0/16"], {"s1": "10.3.0.0/24"})
+    arm.vnets["vnet-a"][1]["s2"] = "10.1.1.0/24"
+    arm.vnets["vnet-d"] = (["10.4.0.0/16"], {"s1": "10.4.0.0/24"})
+    del arm.nics["nic-1"]
+    arm.nics["nic-3"] = ("vnet-d", "s1", "10.4.0.4")
+    graph.rows = [
+        change(vnet_id("vnet-b"), VNET_TYPE, "Update"),
+        change(vnet_id("vnet-b"), VNET_TYPE, "Delete"),
+        change(vnet_id("vnet-c"), VNET_TYPE, "Update"),
+        change(f"{vnet_id('vnet-a')}/subnets/s2", SUBNET_TYPE, "Create"),
+        change(vnet_id("vnet-d"), VNET_TYPE, "Create"),
+        change(nic_id("nic-1"), NIC_TYPE, "Delete"),
+        change(nic_id("nic-3"), NIC_TYPE, "Create"),
+    ]
+
+    incremental = refresher.refresh()
+    assert refresher.last_refresh_mode == "incremental"
+    assert len(graph.requests) == 4
+    assert refresher.last_changes == 6
+    assert snapshot(incremental) == snapshot(InventoryRefresher(arm.client, graph, ["sub-1"]).refresh())
+    vnet_c = next(v for v in incremental.vnets if v.name == "vnet-c")
+    assert vnet_c.address_prefixes == ["10.3.0.0/16", "10.30.0.0/16"]
+    assert "vnet-b" not in {v.name for v in incremental.vnets}
@@ -0,0 +1,89 @@
+import io
+import json
+import time
+
+import requests
+import urllib3
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.transport import RequestsTransport
+
+import cidr_collector
+import cidr_inventory
+from cidr_collector import collect_tenant_inventory
+
+VNETS_URL = "https://management.azure.com/subscriptions/sub-1/providers/Microsoft.Network/virtualNetworks"
+
+
+class FakeCredential:
+    def get_token(self, *scopes, **kwargs):
+        return AccessToken("token", int(time.time()) + 3600)
+
+
+def vnet(n):
+    vnet_id = f"/subscriptions/sub-1/resourceGroups/rg/providers/Microsoft.Network/virtualNetworks/vnet-{n}"
+    return {
+        "id": vnet_id,
+        "name": f"vnet-{n}",
+        "properties": {
+            "addressSpace": {"addressPrefixes": [f"10.{n}.0.0/16"]},
+            "subnets": [{"id": f"{vnet_id}/subnets/default", "name": "default",
+                         "properties": {"addressPrefix": f"10.{n}.0.0/24"}}],
+        },
+    }
+
+
+class FakeArm(requests.adapters.BaseAdapter):
+    """ARM's virtualNetworks list in three pages; page 2 is throttled once with Retry-After."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.throttled = False
+
+    def send(self, request, **kwargs):
+        page = request.url.partition("$skiptoken=")[2] or "1"
+        if page == "2" and not self.throttled:
+            self.throttled = True
+            self.calls.append((page, 429))
+            return self._response(request, 429, {"error": {"code": "TooManyRequests"}}, {"Retry-After": "7"})
+        self.calls.append((page, 200))
+        body = {"value": [vnet(int(page))]}
+        if page != "3":
+            body["nextLink"] = f"{VNETS_URL}?api-version=2024-05-01&$skiptoken={int(page) + 1}"
+        return self._response(request, 200, body)
+
+    def _response(self, request, status, body, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status == 200 else "Too Many Requests"
+        response.headers.update({"Content-Type": "application/json", **(headers or {})})
+        response._content = json.dumps(body).encode()
+        response.raw = urllib3.HTTPResponse(io.BytesIO(response._content), headers=response.headers, status=status,
+                                            preload_content=False)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def test_paged_crawl_reads_every_page_and_honors_retry_after(monkeypatch):
+    arm = FakeArm()
+    session = requests.Session()
+    session.mount("https://", arm)
+    monkeypatch.setattr(cidr_collector, "_shared_transport",
+                        lambda max_workers: RequestsTransport(session=session, session_owner=False))
+    waits = []
+    monkeypatch.setattr(cidr_inventory.time, "sleep", waits.append)
+
+    inventory, errors = collect_tenant_inventory(["sub-1"], FakeCredential(), max_workers=1, include_nics=False)
+
+    assert errors == {}
+    assert [v.name for v in inventory.vnets] == ["vnet-1", "vnet-2", "vnet-3"]
+    assert [s.address_prefix for v in inventory.vnets for s in v.subnets] == ["10.1.0.0/24", "10.2.0.0/24", "10.3.0.0/24"]
+    # The throttled page is retried where paging stopped, after the wait ARM asked for
+    assert arm.calls == [("1", 200), ("2", 429), ("2", 200), ("3", 200)]
+    assert waits == [7.0]
+    assert inventory.api_calls == 4
+    assert inventory.throttled_retries == 1
@@ -0,0 +1,62 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+from urllib.parse import urlencode
+
+import pytest
+
+from cidr_daemon import InventoryService, make_server
+from cidr_inventory import Inventory, VNetRecord
+from cidr_prefix import parse_prefixes
+
+
+def make_inventory():
+    inventory = Inventory("sub-1")
+    inventory.vnets.append(VNetRecord("/vnets/vnet-a", "vnet-a", "rg", parse_prefixes(["10.0.0.0/16"]), []))
+    return inventory
+
+
+@pytest.fixture
+def daemon():
+    refresher = SimpleNamespace(inventory=None, refresh=make_inventory)
+    service = InventoryService(refresher, "sub-1")
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def get(path, **params):
+        url = f"http://127.0.0.1:{server.server_address[1]}{path}?{urlencode(params)}"
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    yield service, get
+    server.shutdown()
+    server.server_close()
+
+
+def test_routes_wait_for_the_inventory(daemon):
+    service, get = daemon
+    assert get("/health")[1]["status"] == "loading"
+    assert get("/suggest", netmask=24, scope="sub-1")[0] == 503
+    assert get("/used-cidrs")[0] == 503
+
+
+def test_suggest_routing(daemon):
+    service, get = daemon
+    service.refresh()
+
+    assert get("/suggest", netmask=24, scope="sub-2")[0] == 409
+    assert get("/nowhere")[0] == 404
+    status, body = get("/suggest", scope="sub-1")
+    assert (status, body["error"]) == (400, "netmask is required")
+    # A client running a pool policy must not be answered by a daemon running none
+    status, body = get("/suggest", netmask=24, scope="sub-1", policy="0123abcd")
+    assert (status, body["error"]) == (400, "daemon runs pool policy None")
+    status, body = get("/suggest", netmask=24, scope="sub-1")
+    assert (status, body["cidr"]) == (200, "10.1.0.0/24")
+    assert get("/used-cidrs")[1]["used_cidrs"] == ["10.0.0.0/16"]
@@ -0,0 +1,22 @@
+from cidr_fragmentation import recovery_candidates
+from cidr_inventory import Inventory, VNetRecord
+from cidr_prefix import parse_prefixes
+
+
+def make_inventory(*cidrs):
+    inventory = Inventory("sub")
+    for n, cidr in enumerate(cidrs):
+        inventory.vnets.append(VNetRecord(f"/vnets/vnet-{n}", f"vnet-{n}", "rg", parse_prefixes([cidr]), []))
+    return inventory
+
+
+def test_largest_recovered_block_ranks_first():
+    inventory = make_inventory("10.128.0.0/28", "10.0.0.0/9", "10.128.0.16/28")
+
+    top = recovery_candidates(inventory, limit=1)
+    assert [c["Block Recovered"] for c in top] == ["10.0.0.0/9"]
+
+    ranked = recovery_candidates(inventory)
+    prefixlens = [int(c["Block Recovered"].split("/")[1]) for c in ranked]
+    assert prefixlens == sorted(prefixlens)
+    assert ranked[0]["VNet Name"] == "vnet-1"
@@ -0,0 +1,117 @@
+import random
+
+from cidr_index import AddressIndex, PrefixTrie, range_blocks
+from cidr_inventory import Inventory, NicRecord, SubnetRecord, VNetRecord
+from cidr_prefix import parse_prefix
+
+BASE = 10 << 24
+
+
+def random_entry(rng, n):
+    prefixlen = rng.choice([8, 12, 16, 20, 22, 23, 24, 24, 25, 26, 28, 30, 32, 32, 32])
+    shift = 32 - prefixlen
+    network = (BASE + rng.randrange(1 << 16)) >> shift << shift
+    return ("vnet", 4, network, prefixlen, f"e{n}", None, None, "rg", f"/e/{n}")
+
+
+def inside(entry, network, prefixlen):
+    return entry[3] >= prefixlen and entry[2] >> (32 - prefixlen) == network >> (32 - prefixlen)
+
+
+def check(trie, stored, rng):
+    for _ in range(50):
+        prefixlen = rng.randint(0, 32)
+        shift = 32 - prefixlen
+        network = (BASE + rng.randrange(1 << 16)) >> shift << shift
+        covering = trie.covering(network, prefixlen)
+        assert sorted(covering) == sorted(e for e in stored if inside((0, 0, network, prefixlen), e[2], e[3]))
+        assert [e[3] for e in covering] == sorted(e[3] for e in covering)
+        found = trie.within(network, prefixlen)
+        assert sorted(found) == sorted(e for e in stored if inside(e, network, prefixlen))
+        assert [(e[2], e[3]) for e in found] == sorted((e[2], e[3]) for e in found)
+
+
+def test_insert_and_remove_match_a_linear_scan():
+    rng = random.Random(5)
+    for _ in range(20):
+        trie = PrefixTrie(4)
+        stored = []
+        for n in range(300):
+            if stored and rng.random() < 0.35:
+                entry = stored.pop(rng.randrange(len(stored)))
+                assert trie.remove(entry)
+                assert not trie.remove(entry)
+            else:
+                entry = random_entry(rng, n)
+                trie.insert(entry)
+                stored.append(entry)
+            if n % 50 == 0:
+                check(trie, stored, rng)
+        check(trie, stored, rng)
+        # Emptied out, every node below the root has been pruned
+        for entry in stored:
+            assert trie.remove(entry)
+        assert trie.within(0, 0) == []
+        assert trie.child[0][0] == trie.child[1][0] == 0
+        assert len(trie._free) == len(trie.network) - 1
+
+
+def test_build_matches_insert():
+    rng = random.Random(6)
+    entries = [random_entry(rng, n) for n in range(500)]
+    built = PrefixTrie(4)
+    built.build(sorted(entries, key=lambda e: (e[2], e[3])))
+    check(built, entries, rng)
+    for entry in entries[:200]:
+        assert built.remove(entry)
+    check(built, entries[200:], rng)
+
+
+def test_range_blocks_cover_exactly():
+    rng = random.Random(7)
+    for _ in range(200):
+        first = rng.randrange(1 << 16)
+        last = first + rng.randrange(1 << 12)
+        blocks = range_blocks(first, last, 32)
+        assert len(blocks) <= 2 * 32
+        position = first
+        for network, prefixlen in blocks:
+            assert network == position and network % (1 << (32 - prefixlen)) == 0
+            position += 1 << (32 - prefixlen)
+        assert position == last + 1
+
+
+def make_inventory():
+    inventory = Inventory("sub")
+    vnet_id = "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/virtualNetworks/hub"
+    subnets = [SubnetRecord(f"{vnet_id}/subnets/s{n}", f"s{n}", [parse_prefix(f"10.0.{n}.0/24")]) for n in range(4)]
+    inventory.vnets.append(VNetRecord(vnet_id, "hub", "rg", [parse_prefix("10.0.0.0/16")], subnets))
+    inventory.nics.append(NicRecord("/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/networkInterfaces/nic-1",
+                                    "nic-1", [(subnets[1].id, "10.0.1.4"), (subnets[1].id, "fd00::4")]))
+    inventory.nics.extend(NicRecord(f"/nics/nic-2{n}", f"nic-2{n}", [(subnets[2].id, f"10.0.2.{n + 4}")]) for n in range(10))
+    return inventory
+
+
+def test_address_index_queries_and_updates():
+    inventory = make_inventory()
+    index = AddressIndex(inventory)
+    assert [(row["Kind"], row["Name"]) for row in index.lookup("10.0.1.4")] == [("nic", "nic-1"), ("subnet", "s1"), ("vnet", "hub")]
+    assert index.lookup("10.1.0.0") == []
+    assert [row["CIDR"] for row in index.contains("10.0.1.0-10.0.2.5")] == ["10.0.1.0/24", "10.0.1.4", "10.0.2.4", "10.0.2.5"]
+    assert [row["CIDR"] for row in index.contains("10.0.0.0/16", kinds=("subnet",), limit=2)] == ["10.0.0.0/24", "10.0.1.0/24"]
+    assert [row["CIDR"] for row in index.lookup("fd00::4")] == ["fd00::4"]
+
+    # Patched in place: the changed VNet is swapped, the new NIC added, and a re-read
+    # but unchanged NIC is matched back to its entries
+    hub = inventory.vnets[0]
+    inventory.vnets[0] = VNetRecord(hub.id, hub.name, hub.resource_group, hub.prefixes, hub.subnets[:3])
+    inventory.nics.append(NicRecord("/nics/nic-9", "nic-9", [(hub.subnets[0].id, "10.0.0.9")]))
+    nic = inventory.nics[0]
+    inventory.nics[0] = NicRecord(nic.id, nic.name, list(nic.ip_configurations))
+    assert index.update(inventory) == 3
+    assert [row["Kind"] for row in index.lookup("10.0.3.1")] == ["vnet"]
+    assert [row["Name"] for row in index.lookup("10.0.0.9")] == ["nic-9", "s0", "hub"]
+    fresh = AddressIndex(inventory)
+    for query in ("10.0.0.0/16", "10.0.0.0-10.0.3.255", "fd00::/8"):
+        assert index.contains(query) == fresh.contains(query)
+    assert index.entry_count == fresh.entry_count
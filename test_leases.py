@@ -0,0 +1,65 @@
+import os
+
+from cidr_allocator import FreeSpaceAllocator
+from cidr_inventory import Inventory, VNetRecord
+from cidr_leases import LeaseStore, existing_lease_store, lease_first_free
+from cidr_prefix import parse_prefixes
+
+
+def test_overlapping_claim_is_refused(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.sqlite"))
+    first = store.claim(["10.0.0.0/24"], owner="a")
+    assert first.prefixes == ["10.0.0.0/24"]
+    assert store.claim(["10.0.0.128/25"], owner="b") is None
+    assert store.claim(["10.0.0.0/16"], owner="b") is None
+    # All or nothing: the free block is not leased when its partner clashes
+    assert store.claim(["10.0.1.0/24", "10.0.0.64/26"], owner="b") is None
+    assert [str(p) for p in store.active()] == ["10.0.0.0/24"]
+    assert store.claim(["10.0.1.0/24"], owner="b") is not None
+
+
+def test_expired_leases_are_not_active(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.sqlite"), ttl=60)
+    lease = store.claim(["10.0.0.0/24"])
+    assert [str(p) for p in store.active(4)] == ["10.0.0.0/24"]
+    assert store.active(6) == []
+    later = lease.expires_at + 1
+    assert store.active(now=later) == []
+    assert store.entries(now=later) == []
+    # An expired lease no longer blocks a claim
+    assert store.claim(["10.0.0.0/24"], ttl=-1) is None
+    store.release(lease.token)
+    assert store.claim(["10.0.0.0/24"], ttl=-1) is not None
+    assert store.active() == []
+    assert store.claim(["10.0.0.0/24"]) is not None
+
+
+def test_lease_first_free_skips_leased_blocks(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.sqlite"))
+    allocator = FreeSpaceAllocator(["10.0.0.0/24"])
+    first = lease_first_free(store, allocator, 24)
+    second = lease_first_free(store, allocator, 24)
+    assert (first.prefixes, second.prefixes) == (["10.0.1.0/24"], ["10.0.2.0/24"])
+
+
+def test_release_and_confirm(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.sqlite"))
+    kept = store.claim(["10.0.0.0/24"])
+    store.claim(["10.0.1.0/24", "10.0.2.0/24"])
+    released = store.claim(["10.0.3.0/24"])
+
+    assert store.release(released.token) == 1
+    assert store.release(released.token) == 0
+
+    inventory = Inventory("sub")
+    inventory.vnets.append(VNetRecord("/vnets/a", "a", "rg", parse_prefixes(["10.0.1.0/24", "10.0.2.0/24"]), []))
+    assert store.confirm(inventory) == 2
+    assert [entry[0] for entry in store.entries()] == [kept.token]
+
+
+def test_existing_lease_store_never_creates_the_file(tmp_path):
+    path = str(tmp_path / "leases.sqlite")
+    assert existing_lease_store(path) is None
+    assert not os.path.exists(path)
+    LeaseStore(path).claim(["10.0.0.0/24"])
+    assert [str(p) for p in existing_lease_store(path).active()] == ["10.0.0.0/24"]
@@ -0,0 +1,59 @@
+import pytest
+
+from cidr_planner import VNetDemand, parse_requirements, plan_batch
+from cidr_prefix import parse_prefix
+
+REQUIREMENTS = {"requirements": [
+    {"name": "landing-zone", "count": 3, "subnets": [{"prefix": 24, "count": 2}, {"prefix": 26}]},
+    {"name": "hub", "subnets": [{"prefix": 22}]},
+    {"name": "edge", "count": 4, "subnets": [{"prefix": 28}]},
+    {"name": "huge", "subnets": [{"prefix": 16}]},
+]}
+
+
+def test_parse_requirements():
+    demands = parse_requirements(REQUIREMENTS)
+    assert [(d.name, d.instance, d.prefixlen) for d in demands][:4] == [
+        ("landing-zone", 1, 22), ("landing-zone", 2, 22), ("landing-zone", 3, 22), ("hub", 1, 22)]
+    # Two /24s and a /26 round up to a /22
+    assert demands[0].subnet_prefixes == [24, 24, 26]
+    with pytest.raises(ValueError, match="outside /8-/29"):
+        parse_requirements([{"name": "x", "subnets": [{"prefix": 30}]}])
+    with pytest.raises(ValueError, match="no subnets requested"):
+        parse_requirements([{"name": "x"}])
+
+
+def test_mixed_batch_is_placed_without_overlaps():
+    used = ["10.0.0.0/22", "10.0.4.0/26", "10.0.6.0/23"]
+    ranges = ["10.0.0.0/19"]
+    demands = parse_requirements(REQUIREMENTS) + [VNetDemand("v6", 1, [64], family=6)]
+    placements, unplaced, report = plan_batch(used, demands, ranges)
+
+    # The /16 does not fit in a /19, and an IPv6 demand has no place in IPv4 ranges
+    assert sorted((d.name, d.family) for d in unplaced) == [("huge", 4), ("v6", 6)]
+    assert len(placements) == 8
+    assert [(p["Requirement"], p["Instance"]) for p in placements][:3] == [("edge", 1), ("edge", 2), ("edge", 3)]
+
+    taken = [parse_prefix(cidr) for cidr in used]
+    parent = parse_prefix(ranges[0])
+    for placement in placements:
+        vnet = parse_prefix(placement["VNet CIDR"])
+        assert parent.contains(vnet)
+        assert not any(vnet.overlaps(other) for other in taken), placement
+        taken.append(vnet)
+        subnets = [parse_prefix(cidr) for cidr in placement["Subnets"]]
+        assert all(vnet.contains(subnet) for subnet in subnets)
+        assert not any(a.overlaps(b) for i, a in enumerate(subnets) for b in subnets[i + 1:])
+
+    # Best fit: the /28s go into the hole next to the used /26 rather than splitting a large block
+    edge = sorted(parse_prefix(p["VNet CIDR"]) for p in placements if p["Requirement"] == "edge")
+    assert all(parse_prefix("10.0.4.0/24").contains(vnet) for vnet in edge)
+    assert report["after"]["free_addresses"] == report["before"]["free_addresses"] - sum(
+        parse_prefix(p["VNet CIDR"]).num_addresses for p in placements)
+
+
+def test_full_space_leaves_everything_unplaced():
+    placements, unplaced, report = plan_batch(["10.0.0.0/24"], parse_requirements(REQUIREMENTS), ["10.0.0.0/24"])
+    assert placements == []
+    assert len(unplaced) == 9
+    assert report["before"]["free_addresses"] == report["after"]["free_addresses"] == 0
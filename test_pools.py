@@ -0,0 +1,85 @@
+import pytest
+import yaml
+
+from cidr_pools import EXAMPLE, load_pools, parse_pools
+from cidr_prefix import parse_prefix
+
+
+def interval(cidr):
+    prefix = parse_prefix(cidr)
+    return prefix.start, prefix.end
+
+
+def test_overlapping_pools_are_rejected():
+    with pytest.raises(ValueError, match="pools a and b overlap"):
+        parse_pools({"pools": [{"name": "a", "cidrs": ["10.0.0.0/16"]}, {"name": "b", "cidrs": ["10.0.128.0/17"]}]})
+    with pytest.raises(ValueError, match="not a CIDR"):
+        parse_pools({"pools": [{"name": "a", "cidrs": ["10.0.0.0/33"]}]})
+    with pytest.raises(ValueError):
+        parse_pools(["10.0.0.0/8"])
+    # Same addresses, different families
+    policy = parse_pools({"pools": [{"name": "v4", "cidrs": ["0.0.0.0/8"]}, {"name": "v6", "cidrs": ["::/104"]}]})
+    assert [pool.name for pool in policy.select(6)] == ["v6"]
+
+
+def test_selection_by_region_and_environment():
+    policy = parse_pools({"pools": [
+        {"name": "weu-prod", "region": "westeurope", "environment": "prod", "cidrs": ["10.64.0.0/12"]},
+        {"name": "weu-dev", "region": "westeurope", "environment": "dev", "cidrs": ["10.80.0.0/14"]},
+        {"name": "shared", "cidrs": ["10.200.0.0/16"]},
+    ]})
+    assert policy.regions() == ["westeurope"]
+    assert policy.environments() == ["dev", "prod"]
+    assert policy.ranges(4, "WestEurope", "dev") == ["10.80.0.0/14", "10.200.0.0/16"]
+    assert policy.ranges(4, "northeurope") == ["10.200.0.0/16"]
+    assert policy.ranges(4) == ["10.64.0.0/12", "10.80.0.0/14", "10.200.0.0/16"]
+    # No IPv6 pools at all: the usual IPv6 range
+    assert policy.ranges(6, "westeurope") == ["fd00::/8"]
+    regional = parse_pools({"pools": [{"name": "weu", "region": "westeurope", "cidrs": ["10.64.0.0/12"]}]})
+    with pytest.raises(ValueError, match="no IPv4 pool for region northeurope"):
+        regional.ranges(4, "northeurope")
+
+
+def test_reserved_ranges_are_never_suggested():
+    policy = parse_pools({
+        "pools": [{"name": "p", "cidrs": ["10.0.0.0/22"]}],
+        "reserved": [{"name": "on-prem", "cidrs": ["10.0.0.0/24", "10.0.1.0/25"]}, "10.0.3.0/24"],
+    })
+    assert policy.reserved_intervals(4) == [(interval("10.0.0.0/24")[0], interval("10.0.1.0/25")[1]),
+                                            interval("10.0.3.0/24")]
+    allocator = policy.allocator([interval("10.0.2.0/26")])
+    assert allocator.first_free(26) == "10.0.1.128/26"
+    assert allocator.first_free(24) is None
+    assert [allocator.allocate(26) for _ in range(6)] == [
+        "10.0.1.128/26", "10.0.1.192/26", "10.0.2.64/26", "10.0.2.128/26", "10.0.2.192/26", None]
+
+
+def test_headroom():
+    policy = parse_pools(yaml.safe_load(EXAMPLE))
+    used = [interval("10.64.0.0/16"), interval("10.96.0.0/13"), interval("10.81.0.0/16")]
+    rows = {row["Region"]: row for row in policy.headroom(used)}
+    weu = rows["westeurope"]
+    assert weu["Pools"] == "weu-prod, weu-dev"
+    assert weu["Pool IPs"] == (1 << 20) + (1 << 18)
+    assert (weu["Used IPs"], weu["Reserved IPs"]) == (2 << 16, 0)
+    assert weu["Free IPs"] == weu["Pool IPs"] - (2 << 16)
+    assert weu["Largest Free Block"] == "/13"
+    neu = rows["northeurope"]
+    assert (neu["Used IPs"], neu["Free IPs"], neu["Free %"], neu["Largest Free Block"]) == (1 << 19, 1 << 19, 50.0, "/13")
+
+    # Reserved space inside a pool is neither used nor free
+    overlapping = parse_pools({"pools": [{"name": "p", "region": "r", "cidrs": ["10.0.0.0/16"]}],
+                               "reserved": ["10.0.0.0/17"]})
+    row = overlapping.headroom([interval("10.0.128.0/24")])[0]
+    assert (row["Pool IPs"], row["Reserved IPs"], row["Used IPs"], row["Free IPs"]) == (65536, 32768, 256, 32512)
+
+
+def test_load_pools(tmp_path, monkeypatch):
+    path = tmp_path / "pools.yaml"
+    path.write_text(EXAMPLE)
+    policy = load_pools(str(path))
+    assert [pool.name for pool in policy.pools] == ["weu-prod", "weu-dev", "neu-prod"]
+    assert policy.digest == parse_pools(yaml.safe_load(EXAMPLE)).digest
+    assert policy.digest != parse_pools({"pools": []}).digest
+    monkeypatch.setattr("cidr_pools.POOLS_PATH", None)
+    assert load_pools() is None
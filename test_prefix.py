@@ -0,0 +1,74 @@
+import ipaddress
+import random
+
+import pytest
+
+from cidr_prefix import format_prefix, parse_prefix, parse_prefixes, require_prefixes
+
+
+@pytest.mark.parametrize("cidr, network, prefixlen, family", [
+    ("10.1.2.0/24", "10.1.2.0", 24, 4),
+    (" 192.168.0.0/16 ", "192.168.0.0", 16, 4),
+    ("10.1.2.3", "10.1.2.3", 32, 4),
+    ("0.0.0.0/0", "0.0.0.0", 0, 4),
+    ("fd00:1::/48", "fd00:1::", 48, 6),
+    ("2001:db8::1", "2001:db8::1", 128, 6),
+    ("::/0", "::", 0, 6),
+])
+def test_parse(cidr, network, prefixlen, family):
+    prefix = parse_prefix(cidr)
+    assert (prefix.network, prefix.prefixlen, prefix.family) == (int(ipaddress.ip_address(network)), prefixlen, family)
+    assert prefix.num_addresses == 1 << (prefix.max_prefixlen - prefixlen)
+    assert prefix.end - prefix.start == prefix.num_addresses
+    assert parse_prefix(prefix) is prefix
+
+
+@pytest.mark.parametrize("cidr", ["", "10.0.0.0/33", "10.0.0.0/-1", "10.0.0/8", "10.0.0.256/24", "fd00::/129",
+                                  "fd00:::1/64", "10.0.0.0/x", "example.com"])
+def test_invalid(cidr):
+    assert parse_prefix(cidr) is None
+
+
+def test_host_bits_are_cleared():
+    assert str(parse_prefix("10.1.2.3/16")) == "10.1.0.0/16"
+    assert str(parse_prefix("fd00::abcd/64")) == "fd00::/64"
+    assert parse_prefix("10.1.2.3/16") == parse_prefix("10.1.0.0/16")
+    assert hash(parse_prefix("10.1.2.3/16")) == hash(parse_prefix("10.1.0.0/16"))
+
+
+def test_matches_ipaddress():
+    rng = random.Random(11)
+    for _ in range(500):
+        family = rng.choice([4, 6])
+        bits = 32 if family == 4 else 128
+        address = rng.getrandbits(bits)
+        prefixlen = rng.randint(0, bits)
+        text = f"{ipaddress.ip_address(address) if family == 4 else ipaddress.IPv6Address(address)}/{prefixlen}"
+        expected = ipaddress.ip_network(text, strict=False)
+        prefix = parse_prefix(text)
+        assert (prefix.start, prefix.end - 1) == (int(expected.network_address), int(expected.broadcast_address))
+        assert format_prefix(prefix.network, prefix.prefixlen, family) == str(expected)
+
+
+def test_ordering_and_containment():
+    prefixes = parse_prefixes(["fd00::/8", "10.1.0.0/24", "10.0.0.0/8", "10.0.0.0/16", "", None, "bogus", "172.16.0.0/12"])
+    assert [str(p) for p in sorted(prefixes)] == ["10.0.0.0/8", "10.0.0.0/16", "10.1.0.0/24", "172.16.0.0/12", "fd00::/8"]
+
+    wide, narrow, other = parse_prefix("10.0.0.0/8"), parse_prefix("10.1.0.0/24"), parse_prefix("172.16.0.0/12")
+    assert wide.contains(narrow) and not narrow.contains(wide)
+    assert wide.contains(wide)
+    assert wide.overlaps(narrow) and narrow.overlaps(wide)
+    assert not wide.overlaps(other)
+    # Adjacent blocks touch but do not overlap
+    assert not parse_prefix("10.0.0.0/25").overlaps(parse_prefix("10.0.0.128/25"))
+    # Families never overlap, even where the integers would
+    assert not parse_prefix("0.0.0.0/0").overlaps(parse_prefix("::/96"))
+    assert not parse_prefix("::/0").contains(parse_prefix("10.0.0.0/8"))
+
+
+def test_require_prefixes():
+    assert require_prefixes("vnet", "10.0.0.0/16") == [parse_prefix("10.0.0.0/16")]
+    with pytest.raises(ValueError, match="vnet: 'nope' is not a CIDR"):
+        require_prefixes("vnet", ["10.0.0.0/16", "nope"])
+    with pytest.raises(ValueError, match="vnet: no cidrs given"):
+        require_prefixes("vnet", None)
@@ -0,0 +1,68 @@
+import sqlite3
+
+from cidr_inventory import Inventory, NicRecord, SubnetRecord, VNetRecord
+from cidr_prefix import parse_prefixes
+from cidr_snapshot import open_snapshot, save_snapshot
+
+VNET_ID = "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/virtualNetworks/hub"
+
+
+def make_inventory():
+    inventory = Inventory("sub")
+    subnet = SubnetRecord(f"{VNET_ID}/subnets/s1", "s1", parse_prefixes(["10.0.0.0/24", "fd00::/64"]))
+    inventory.vnets.append(VNetRecord(VNET_ID, "hub", "rg", parse_prefixes(["10.0.0.0/16", "fd00::/48"]), [subnet]))
+    return inventory
+
+
+def test_round_trip(tmp_path):
+    inventory = make_inventory()
+    inventory.nics.append(NicRecord("/nics/nic-1", "nic-1", [(f"{VNET_ID}/subnets/s1", "10.0.0.4")]))
+    inventory.nics_loaded = True
+    path = str(tmp_path / "inventory-sub.sqlite")
+    save_snapshot(inventory, path)
+
+    snapshot = open_snapshot(path)
+    loaded = snapshot.load_inventory()
+    assert snapshot.used_intervals(4) == [(10 << 24, (10 << 24) + (1 << 16)), (10 << 24, (10 << 24) + 256)]
+    assert [str(p) for p in sorted(loaded.used_prefixes())] == ["10.0.0.0/16", "10.0.0.0/24", "fd00::/48", "fd00::/64"]
+    assert loaded.subscription_id == "sub"
+    assert [(n.name, n.ip_configurations) for n in loaded.nics] == [("nic-1", [(f"{VNET_ID}/subnets/s1", "10.0.0.4")])]
+    assert loaded.nics_loaded
+    snapshot.close()
+    assert open_snapshot(path, max_age=-1) is None
+
+
+def test_an_estate_without_nics_stays_loaded(tmp_path):
+    path = str(tmp_path / "inventory-sub.sqlite")
+    inventory = make_inventory()
+    save_snapshot(inventory, path)
+    snapshot = open_snapshot(path)
+    assert not snapshot.load_inventory().nics_loaded
+    snapshot.close()
+
+    # Crawled, but there were no NICs to find: nothing to crawl again
+    inventory.nics_loaded = True
+    save_snapshot(inventory, path)
+    snapshot = open_snapshot(path)
+    loaded = snapshot.load_inventory()
+    snapshot.close()
+    assert loaded.nics == [] and loaded.nics_loaded
+
+    # Snapshots written before the flag existed had NICs loaded exactly when they stored some
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM meta WHERE key = 'nics_loaded'")
+    conn.commit()
+    conn.close()
+    snapshot = open_snapshot(path)
+    assert not snapshot.load_inventory().nics_loaded
+    snapshot.close()
+
+
+def test_merge_keeps_nics_loaded_only_if_every_part_had_them():
+    tenant = Inventory()
+    a, b = Inventory("a"), Inventory("b")
+    a.nics_loaded = b.nics_loaded = True
+    assert tenant.merge(a).merge(b).nics_loaded
+    c = Inventory("c")
+    assert not tenant.merge(c).nics_loaded
+    assert not Inventory().merge(c).merge(a).nics_loaded
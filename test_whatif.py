@@ -0,0 +1,73 @@
+import random
+
+import pytest
+import yaml
+
+from cidr_allocator import FreeSpaceAllocator
+from cidr_analysis import family_ranges
+from cidr_conflicts import find_vnet_conflicts
+from cidr_inventory import SubnetRecord, VNetRecord, load_inventory
+from cidr_planner import fragmentation_report
+from cidr_pools import EXAMPLE, parse_pools
+from cidr_prefix import format_prefix, parse_prefix
+from cidr_whatif import ChangeSet, Simulation
+from synthetic_estate import SyntheticEstate
+
+
+def make_inventory(rng):
+    inventory = load_inventory(SyntheticEstate(300, seed=7).client(), "sub-1")
+    # VNets overlapping existing ones, so there are conflicts to resolve
+    for k, vnet in enumerate(rng.sample(inventory.vnets, 20)):
+        prefix = vnet.prefixes[0]
+        wider = parse_prefix(format_prefix(prefix.start, max(8, prefix.prefixlen - rng.choice([0, 1, 2])), prefix.family))
+        vnet_id = f"/subscriptions/sub-1/resourceGroups/rg-dup/providers/Microsoft.Network/virtualNetworks/dup-{k}"
+        inventory.vnets.append(VNetRecord(vnet_id, f"dup-{k}", "rg-dup", [wider], []))
+    # ...and VNets inside the example policy's pools
+    for k in range(10):
+        start = (10 << 24) + (64 << 16) + rng.randrange(1 << 18) // 1024 * 1024
+        vnet_id = f"/subscriptions/sub-1/resourceGroups/rg-pool/providers/Microsoft.Network/virtualNetworks/pool-{k}"
+        subnet = SubnetRecord(f"{vnet_id}/subnets/s1", "s1", [parse_prefix(format_prefix(start, 24))])
+        inventory.vnets.append(VNetRecord(vnet_id, f"pool-{k}", "rg-pool", [parse_prefix(format_prefix(start, 22))], [subnet]))
+    return inventory
+
+
+def random_changes(rng, inventory, trial):
+    vnets = rng.sample(inventory.vnets, 5)
+    delete_vnets = [vnet.id.lower() for vnet in vnets[:2]]
+    subnets = [subnet.id for vnet in vnets[2:] for subnet in vnet.subnets]
+    add_vnets = []
+    for k in range(rng.randint(0, 4)):
+        prefixlen = rng.randint(14, 24)
+        start = ((10 << 24) + rng.randrange(1 << 24)) >> (32 - prefixlen) << (32 - prefixlen)
+        subnet = parse_prefix(format_prefix(start, prefixlen + 2))
+        add_vnets.append((f"new-{trial}-{k}", "rg-new", [parse_prefix(format_prefix(start, prefixlen))], [("s1", [subnet])]))
+    return ChangeSet(delete_vnets, add_vnets=add_vnets).with_deleted_subnets(rng.sample(subnets, min(3, len(subnets))))
+
+
+@pytest.mark.parametrize("pools", [None, EXAMPLE], ids=["private-ranges", "pools"])
+def test_evaluate_matches_a_full_recompute(pools):
+    rng = random.Random(3)
+    inventory = make_inventory(rng)
+    policy = parse_pools(yaml.safe_load(pools)) if pools else None
+    simulation = Simulation(inventory, policy)
+    for trial in range(25):
+        overlay = simulation.apply(random_changes(rng, inventory, trial))
+        for family in (4, 6):
+            used = [(p.start, p.end) for p in overlay.used_prefixes() if p.family == family]
+            if policy is not None:
+                allocator = policy.allocator(used, family)
+            else:
+                allocator = FreeSpaceAllocator.from_intervals(used, family_ranges(family))
+            expected = fragmentation_report(allocator)
+
+            result = simulation.evaluate(overlay, (24, 20), family)
+            headroom = result["headroom"]
+            assert headroom["Free IPs After"] == expected["free_addresses"]
+            assert headroom["Largest Free Block After"] == expected["largest_free_block"]
+            assert headroom["Fragmentation After"] == expected["fragmentation"]
+            assert [row["After"] for row in result["suggestions"]] == [allocator.first_free(24), allocator.first_free(20)]
+            assert result["conflicts"]["after"] == len(find_vnet_conflicts(overlay))
+            if policy is not None:
+                rows = policy.headroom(used, family)
+                assert [(row["Region"], row["Free IPs"], row["Largest Free Block"]) for row in rows] == \
+                    [(row["Region"], row["Free IPs After"], row["Largest Free Block After"]) for row in result["pools"]]